@@ -0,0 +1,79 @@
+"""Cold-start import benchmark
+
+Runs main.py's module-level imports in fresh interpreters (so nothing is
+already cached in sys.modules) and reports the median wall time, plus
+whether any of the heavy, deferred modules got pulled in at startup.
+
+Usage:
+    python benchmarks/import_time.py [--runs N] [--max-ms LIMIT]
+
+With --max-ms the script exits with status 1 when the median is above the
+limit or a deferred module is imported at startup, so it can guard
+against regressions.
+"""
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that should only load when their feature is first used. (Streamlit
+# itself imports the core of plotly for st.plotly_chart; plotly.express,
+# with its data-frame machinery, is the part the app can defer.)
+DEFERRED_MODULES = ['plotly.express', 'twilio']
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+exec(compile({source!r}, 'main.py imports', 'exec'))
+elapsed = time.perf_counter() - start
+print(json.dumps({{'ms': elapsed * 1000, 'loaded': [m for m in {deferred!r} if m in sys.modules]}}))
+"""
+
+
+def startup_imports(path):
+    """Source of the import statements at the top level of a module"""
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    imports = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+    return '\n'.join(ast.unparse(node) for node in imports)
+
+
+def measure(source, runs):
+    """Time the imports in `runs` fresh interpreters"""
+    probe = PROBE.format(source=source, deferred=DEFERRED_MODULES)
+    timings, loaded = [], set()
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-c', probe], cwd=ROOT, capture_output=True, text=True, check=True)
+        sample = json.loads(result.stdout.strip().splitlines()[-1])
+        timings.append(sample['ms'])
+        loaded.update(sample['loaded'])
+    return timings, sorted(loaded)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters to time (default 5)')
+    parser.add_argument('--max-ms', type=float, default=None, help='fail if the median is above this')
+    args = parser.parse_args()
+
+    timings, loaded = measure(startup_imports(os.path.join(ROOT, 'main.py')), args.runs)
+    report = {
+        'runs': args.runs,
+        'median_ms': round(statistics.median(timings), 1),
+        'min_ms': round(min(timings), 1),
+        'max_ms': round(max(timings), 1),
+        'deferred_modules_loaded': loaded
+    }
+    print(json.dumps(report, indent=2))
+
+    if args.max_ms is not None and (report['median_ms'] > args.max_ms or loaded):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""Command-line access to the analytics and maintenance tasks
+
+Runs against the same data/ directory as the Streamlit app, without
+starting Streamlit, and prints its results as JSON for batch jobs.
+
+Usage:
+    python cli.py report summary --period last-month
+    python cli.py report compare --by merchant --month 2025-04
+    python cli.py report backtest --folder bills --limit 2000 3000
+    python cli.py export powerbi --format parquet
+    python cli.py import payments.csv
+    python cli.py rebuild
+    python cli.py compact
+
+Exits with status 1 (and an "error" key in the output) when a command fails.
+"""
+import argparse
+import contextlib
+import json
+import os
+import re
+import sys
+from datetime import date, datetime
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+PERIODS = {
+    'all-time': 'All Time',
+    'current-month': 'Current Month',
+    'last-month': 'Last Month',
+    'last-3-months': 'Last 3 Months'
+}
+REPORTS = ['summary', 'folders', 'trend', 'heatmap', 'compare', 'forecast', 'limits', 'sizes', 'backtest']
+MONTH_PATTERN = re.compile(r'^\d{4}-(0[1-9]|1[0-2])$')
+
+
+def _jsonable(value):
+    """Turn DataFrames, dates and NumPy values into plain JSON values"""
+    import numpy as np
+    import pandas as pd
+    if isinstance(value, pd.DataFrame):
+        if value.index.name is not None:
+            value = value.reset_index()
+        return [_jsonable(row) for row in value.to_dict('records')]
+    if isinstance(value, dict):
+        return {str(key): _jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value]
+    if value is pd.NaT or value is None:
+        return None
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+
+def check_report_args(args, folder_names):
+    """Reject arguments the analytics would quietly answer with an empty result"""
+    if args.period not in PERIODS:
+        raise ValueError(f"unknown period: {args.period}")
+    if args.month is not None and not MONTH_PATTERN.match(args.month):
+        raise ValueError(f"--month must be a 'YYYY-MM' month, not {args.month!r}")
+    unknown = [name for name in args.folder or [] if name not in folder_names]
+    if unknown:
+        raise ValueError(f"unknown folder: {', '.join(unknown)}")
+
+
+def run_report(args):
+    from utils.analytics import Analytics
+    analytics = Analytics()
+    check_report_args(args, analytics.ledger.folder_manager.get_folders())
+    months, date_range = analytics.get_period_months(PERIODS[args.period])
+    folders = args.folder or None
+
+    if args.name == 'summary':
+        summary = analytics.generate_analytics(date_range)
+        return {key: summary[key] for key in ('total_spending', 'daily_avg', 'spending_by_folder', 'folder_count') if key in summary}
+    if args.name == 'folders':
+        return analytics.get_spending_slice(('folder',), folders, months)
+    if args.name == 'trend':
+        return analytics.get_spending_trend(date_range)
+    if args.name == 'heatmap':
+        return analytics.get_spending_heatmap(folders, date_range).rename_axis('weekday')
+    if args.name == 'compare':
+        return analytics.get_spending_comparison(args.by, folders, args.month)
+    if args.name == 'forecast':
+        return analytics.get_month_end_forecast()
+    if args.name == 'limits':
+        folder_manager = analytics.ledger.folder_manager
+        names = folders or folder_manager.get_folders()
+        return [{'folder': name, **analytics.check_folder_limit(name, folder_manager)} for name in names]
+    if args.name == 'sizes':
+        return analytics.get_amount_distribution(args.by, args.month)
+    if args.name == 'backtest':
+        if not folders or len(folders) != 1 or not args.limit:
+            raise ValueError("backtest needs one --folder and at least one --limit")
+        return analytics.backtest_limit(folders[0], args.limit)
+
+
+def run_export(args):
+    from utils.analytics import Analytics
+    result = Analytics().export_for_powerbi(full=args.full, file_format=args.format)
+    if not result:
+        raise RuntimeError("export failed")
+    if result['partition'] is not None:
+        result['partition'] = os.path.abspath(result['partition'])
+    return {'path': os.path.abspath(os.path.join('data', 'powerbi_export')), **result}
+
+
+def run_import(args):
+    import pandas as pd
+    from utils.transaction_manager import TransactionManager
+    transactions = pd.read_csv(sys.stdin if args.file == '-' else args.file, dtype={'notes': str, 'tags': str})
+    missing = {'merchant', 'amount'} - set(transactions.columns)
+    if missing:
+        raise ValueError(f"missing columns: {', '.join(sorted(missing))}")
+    transactions['timestamp'] = pd.to_datetime(transactions['timestamp']) if 'timestamp' in transactions else datetime.now()
+    if 'folder' not in transactions:
+        transactions['folder'] = args.default_folder
+    transactions['folder'] = transactions['folder'].fillna(args.default_folder)
+    transactions['notes'] = transactions['notes'].fillna('') if 'notes' in transactions else ''
+    transactions['tags'] = transactions['tags'].fillna('') if 'tags' in transactions else ''
+    records = transactions[['folder', 'merchant', 'amount', 'timestamp', 'notes', 'tags']].to_dict('records')
+    ids = TransactionManager().add_transactions(records)
+    return {'imported': len(ids), 'ids': ids}
+
+
+def run_rebuild(args):
+    from utils.transaction_manager import TransactionManager
+    transaction_manager = TransactionManager()
+    loaded = transaction_manager.ledger.rebuild()
+    result = {'transactions': loaded}
+    if transaction_manager.binary_store is not None:
+        transaction_manager.binary_store.rebuild_from(transaction_manager.ledger.frame())
+        result['binary_records'] = len(transaction_manager.binary_store)
+    return result
+
+
+def run_compact(args):
+    from utils.transaction_manager import TransactionManager
+    from utils.notification_manager import NotificationManager
+    stores = {
+        'transactions': TransactionManager().ledger.store,
+        'notifications': NotificationManager().store
+    }
+    compacted = {}
+    for name, store in stores.items():
+        if args.force or store.pending_bytes() > 0:
+            store.compact()
+            compacted[name] = True
+        else:
+            compacted[name] = False
+    return {'compacted': compacted}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-root', default=ROOT, help='directory holding data/ (default: the app directory)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    report = commands.add_parser('report', help='print an analytics report')
+    report.add_argument('name', choices=REPORTS)
+    report.add_argument('--period', choices=list(PERIODS), default='all-time')
+    report.add_argument('--folder', action='append', help='only this folder (repeatable)')
+    report.add_argument('--by', choices=['folder', 'merchant'], default='folder')
+    report.add_argument('--month', help="'YYYY-MM' month for compare and sizes")
+    report.add_argument('--limit', type=float, nargs='+', help='candidate limits for backtest')
+    report.set_defaults(run=run_report)
+
+    export = commands.add_parser('export', help='write the Power BI export')
+    export.add_argument('target', choices=['powerbi'])
+    export.add_argument('--full', action='store_true', help='start over instead of exporting only the changes')
+    export.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    export.set_defaults(run=run_export)
+
+    importer = commands.add_parser('import', help='add transactions from a CSV file')
+    importer.add_argument('file', help="CSV with merchant and amount (and optionally folder, timestamp, notes, tags) columns, or '-' for stdin")
+    importer.add_argument('--default-folder', default='Default', help='folder for rows without one')
+    importer.set_defaults(run=run_import)
+
+    rebuild = commands.add_parser('rebuild', help='rebuild the rollups and indexes from the logs')
+    rebuild.set_defaults(run=run_rebuild)
+
+    compact = commands.add_parser('compact', help='fold the append logs into their snapshots')
+    compact.add_argument('--force', action='store_true', help='compact even when nothing is pending')
+    compact.set_defaults(run=run_compact)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    os.chdir(args.data_root)
+    sys.path.insert(0, ROOT)
+    # The managers report problems with print(); keep stdout for the JSON
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            result = _jsonable(args.run(args))
+    except Exception as e:
+        print(json.dumps({'error': str(e)}))
+        return 1
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,12 +1,14 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime, date
-import plotly.express as px
 from utils.folder_manager import FolderManager
 from utils.transaction_manager import TransactionManager
 from utils.analytics import Analytics
 from utils.notification_manager import NotificationManager
 from utils.sms_sender import SMSSender
+from utils.compactor import start_compactor
+from utils.tag_index import parse_tags
+from utils.downsample import WEBGL_MIN_POINTS
 
 # Initialize session state
 if 'folder_manager' not in st.session_state:
@@ -19,6 +21,12 @@ if 'notification_manager' not in st.session_state:
     st.session_state.notification_manager = NotificationManager()
 if 'sms_sender' not in st.session_state:
     st.session_state.sms_sender = SMSSender()
+
+# Fold the append-only logs into snapshots in the background (once per process)
+start_compactor([
+    st.session_state.transaction_manager.ledger.store,
+    st.session_state.notification_manager.store
+])
 if 'user_phone' not in st.session_state:
     st.session_state.user_phone = ""  # Will be set in settings
 if 'show_folder_options' not in st.session_state:
@@ -51,343 +59,322 @@ def simulate_qr_scan():
     selected = random.choice(merchants)
     return selected
 
-def main():
-    # Set page config to match PhonePe style
-    st.set_page_config(page_title="PhonePe", page_icon="📱", layout="centered")
-
-    # Custom CSS to match PhonePe mobile app style
-    st.markdown("""
-        <style>
-        /* Base Styling */
-        body {
-            font-family: 'Roboto', sans-serif;
-            max-width: 100%;
-            overflow-x: hidden;
-            background-color: #fafafa !important;
-        }
-        
-        .main .block-container {
-            padding-top: 10px;
-            max-width: 95%;
-        }
-        
-        /* Button Styling */
-        .stButton > button {
-            background-color: #6739B7;
-            color: white;
-            border-radius: 25px;
-            border: none;
-            padding: 12px 20px;
-            font-weight: 500;
-            box-shadow: 0 4px 8px rgba(103,57,183,0.2);
-            transition: all 0.2s ease;
-            text-transform: none;
-            letter-spacing: 0.5px;
-        }
-        
-        .stButton > button:hover {
-            background-color: #5c33a4;
-            box-shadow: 0 6px 12px rgba(103,57,183,0.3);
-            transform: translateY(-1px);
-        }
-        
-        .stButton > button:active {
-            transform: translateY(1px);
-            box-shadow: 0 2px 4px rgba(103,57,183,0.2);
-        }
-        
-        /* Mobile Container */
-        .mobile-container {
-            max-width: 480px;
-            margin: 0 auto;
-            border: 1px solid #eaeaea;
-            border-radius: 25px;
-            box-shadow: 0 10px 25px rgba(0,0,0,0.05);
-            overflow: hidden;
-            background-color: white;
-            position: relative;
-        }
-        
-        /* Headers */
-        .phonepe-header {
-            background: linear-gradient(135deg, #6739B7 0%, #8157c9 100%);
-            color: white;
-            padding: 15px 0;
-            text-align: center;
-            border-radius: 10px 10px 0 0;
-            font-weight: 600;
-            font-size: 18px;
-            margin-bottom: 15px;
-            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-            position: relative;
-            overflow: hidden;
-        }
-        
-        .phonepe-header::after {
-            content: '';
-            position: absolute;
-            top: -10px;
-            right: -10px;
-            width: 80px;
-            height: 80px;
-            background: rgba(255,255,255,0.1);
-            border-radius: 50%;
-        }
-        
-        /* Scanner UI */
-        .scanner-overlay {
-            position: relative;
-            background: linear-gradient(to bottom, #000000, #333333);
-            padding: 30px;
-            border-radius: 15px;
-            text-align: center;
-            height: 320px;
-            display: flex;
-            flex-direction: column;
-            justify-content: center;
-            align-items: center;
-            margin-bottom: 20px;
-            box-shadow: 0 6px 16px rgba(0,0,0,0.15);
-            overflow: hidden;
-        }
-        
-        .scanner-overlay::before {
-            content: '';
-            position: absolute;
-            top: 0;
-            left: 0;
-            right: 0;
-            height: 1px;
-            background: linear-gradient(to right, transparent, rgba(255,255,255,0.3), transparent);
-        }
-        
-        /* Mobile Status Bar */
-        .status-bar {
-            background: linear-gradient(to right, #5c33a4, #6739B7);
-            color: white;
-            padding: 8px 15px;
-            font-size: 12px;
-            display: flex;
-            justify-content: space-between;
-            border-bottom: 1px solid rgba(255,255,255,0.1);
-        }
-        
-        /* Navigation Bar */
-        .nav-bar {
-            display: flex;
-            justify-content: space-around;
-            background-color: white;
-            padding: 10px 0;
-            border-radius: 15px;
-            margin-bottom: 20px;
-            box-shadow: 0 2px 10px rgba(0,0,0,0.05);
-        }
-        
-        .nav-item {
-            display: flex;
-            flex-direction: column;
-            align-items: center;
-            font-size: 12px;
-            color: #444;
-        }
-        
-        .nav-item.active {
-            color: #6739B7;
-            font-weight: bold;
-        }
-        
-        /* Card Styling */
-        .phonepe-card {
-            background-color: white;
-            border-radius: 12px;
-            padding: 15px;
-            margin-bottom: 15px;
-            box-shadow: 0 2px 8px rgba(0,0,0,0.06);
-            border: 1px solid #f0f0f0;
-        }
-        
-        /* Input Fields */
-        .stTextInput > div > div > input {
-            border-radius: 8px;
-            border: 1px solid #e0e0e0;
-            padding: 10px 15px;
-            transition: all 0.2s;
-        }
-        
-        .stTextInput > div > div > input:focus {
-            border-color: #6739B7;
-            box-shadow: 0 0 0 2px rgba(103,57,183,0.2);
-        }
-        
-        /* Icon Styling */
-        .folder-icon {
-            font-size: 24px;
-            color: #6739B7;
-        }
-        
-        /* Hide Streamlit Branding */
-        #MainMenu {visibility: hidden;}
-        footer {visibility: hidden;}
-        
-        /* Custom Scrollbar */
-        ::-webkit-scrollbar {
-            width: 6px;
-            height: 6px;
-        }
-        
-        ::-webkit-scrollbar-track {
-            background: #f1f1f1;
-            border-radius: 10px;
-        }
-        
-        ::-webkit-scrollbar-thumb {
-            background: #6739B7;
-            border-radius: 10px;
-        }
-        
-        ::-webkit-scrollbar-thumb:hover {
-            background: #5c33a4;
-        }
-        .scanner-frame {
-            border: 2px solid #6739B7;
-            border-radius: 10px;
-            padding: 5px;
-            width: 80%;
-            height: 60%;
-            margin: 0 auto;
-            display: flex;
-            justify-content: center;
-            align-items: center;
-        }
-        .folder-toggle {
-            position: absolute;
-            bottom: 20px;
-            right: 20px;
-            background-color: rgba(103, 57, 183, 0.8);
-            color: white;
-            border-radius: 50%;
-            width: 40px;
-            height: 40px;
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            cursor: pointer;
-            font-size: 18px;
-        }
-        .folder-panel {
-            background-color: #f8f8f8;
-            border-radius: 10px;
-            padding: 15px;
-            margin-top: 10px;
-            border: 1px solid #ddd;
-        }
-        .folder-item {
-            display: flex;
-            align-items: center;
-            padding: 8px;
-            border-radius: 5px;
-            margin-bottom: 5px;
-            cursor: pointer;
-        }
-        .folder-item:hover {
-            background-color: #e9e0ff;
-        }
-        .folder-item-selected {
-            background-color: #e9e0ff;
-            border-left: 3px solid #6739B7;
-        }
-        div[data-testid="stSelectbox"] {
-            background-color: white;
-            border-radius: 5px;
-            padding: 5px;
-            border: 1px solid #ddd;
-        }
-        </style>
-    """, unsafe_allow_html=True)
-
-    # Mobile Phone Status Bar (simulated)
-    st.markdown("""
-        <div class="status-bar">
-            <span>📶 5G</span>
-            <span>⚡ 85%</span>
-            <span>⌚ 10:45 AM</span>
-        </div>
-    """, unsafe_allow_html=True)
-    
-    # PhonePe App Header
-    st.markdown("""
-        <div style="text-align: center; padding: 10px 0;">
-            <h1 style="color: #6739B7; margin: 0; font-size: 28px;">Phone<span style="color: #3483FA;">Pe</span></h1>
-        </div>
-    """, unsafe_allow_html=True)
-    
-    # Get unread notifications count
-    unread_count = st.session_state.notification_manager.get_unread_count()
+# Function to reuse rendered charts while the data and filters are unchanged
+def cached_figure(name, filters, build):
+    """Build a Plotly figure once per data version and filters
     
-    # Navigation options
-    if unread_count > 0:
-        nav_options = ["Scan & Pay", "Transaction History", f"Notifications 🔔 ({unread_count})", "Spending Analytics 📊"]
-    else:
-        nav_options = ["Scan & Pay", "Transaction History", "Notifications 🔔", "Spending Analytics 📊"]
+    The figure's JSON is kept in the Analytics memo cache, so a rerun with
+    nothing changed skips the Plotly Express work.
+    """
+    import plotly.io as pio
     
-    # Create a cleaner, simpler and functional navigation with tabs
-    st.markdown("""
-        <style>
-        /* Style tab buttons to look like PhonePe navigation */
-        div.stTabs button {
-            background-color: transparent;
-            color: #6739B7;
-            border: none;
-            margin: 0;
-            padding: 10px 5px;
-            font-size: 12px;
-            font-weight: normal;
-            display: flex;
-            flex-direction: column;
-            align-items: center;
-        }
-        div.stTabs button p {
-            font-size: 24px;
-            margin-bottom: 4px;
-            margin-top: 0;
-        }
-        div.stTabs button[aria-selected="true"] {
-            background-color: rgba(103, 57, 183, 0.1);
-            font-weight: bold;
-        }
-        div.stTabs [role="tablist"] {
-            display: flex;
-            background-color: white;
-            border-radius: 15px;
-            box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-            padding: 5px;
-            margin-bottom: 15px;
-        }
-        div.stTabs [role="tab"] {
-            width: 100%;
-            border-radius: 10px;
-        }
-        div.stTabs [role="tabpanel"] {
-            padding: 0;
-        }
-        .stTabs {
-            background-color: transparent;
-        }
-        
-        /* Hide radio buttons we use for navigation state */
-        div[data-testid="stRadio"] {
-            position: absolute !important;
-            top: -9999px !important;
-            left: -9999px !important;
-            visibility: hidden !important;
-            pointer-events: none !important;
-            display: none !important;
-        }
-        </style>
-    """, unsafe_allow_html=True)
-    
-    # Add JavaScript to add IDs to radio buttons for easier click targeting
-    st.markdown("""
+    analytics = st.session_state.analytics
+    figure_json = analytics.memo.get_or_compute(
+        ('figure', name, analytics.data_version(), filters),
+        lambda: build().to_json()
+    )
+    return pio.from_json(figure_json)
+
+# App-wide CSS (and the navigation script), assembled once per process
+APP_STYLES = """
+    <style>
+    /* Base Styling */
+    body {
+        font-family: 'Roboto', sans-serif;
+        max-width: 100%;
+        overflow-x: hidden;
+        background-color: #fafafa !important;
+    }
+
+    .main .block-container {
+        padding-top: 10px;
+        max-width: 95%;
+    }
+
+    /* Button Styling */
+    .stButton > button {
+        background-color: #6739B7;
+        color: white;
+        border-radius: 25px;
+        border: none;
+        padding: 12px 20px;
+        font-weight: 500;
+        box-shadow: 0 4px 8px rgba(103,57,183,0.2);
+        transition: all 0.2s ease;
+        text-transform: none;
+        letter-spacing: 0.5px;
+    }
+
+    .stButton > button:hover {
+        background-color: #5c33a4;
+        box-shadow: 0 6px 12px rgba(103,57,183,0.3);
+        transform: translateY(-1px);
+    }
+
+    .stButton > button:active {
+        transform: translateY(1px);
+        box-shadow: 0 2px 4px rgba(103,57,183,0.2);
+    }
+
+    /* Mobile Container */
+    .mobile-container {
+        max-width: 480px;
+        margin: 0 auto;
+        border: 1px solid #eaeaea;
+        border-radius: 25px;
+        box-shadow: 0 10px 25px rgba(0,0,0,0.05);
+        overflow: hidden;
+        background-color: white;
+        position: relative;
+    }
+
+    /* Headers */
+    .phonepe-header {
+        background: linear-gradient(135deg, #6739B7 0%, #8157c9 100%);
+        color: white;
+        padding: 15px 0;
+        text-align: center;
+        border-radius: 10px 10px 0 0;
+        font-weight: 600;
+        font-size: 18px;
+        margin-bottom: 15px;
+        box-shadow: 0 2px 10px rgba(0,0,0,0.1);
+        position: relative;
+        overflow: hidden;
+    }
+
+    .phonepe-header::after {
+        content: '';
+        position: absolute;
+        top: -10px;
+        right: -10px;
+        width: 80px;
+        height: 80px;
+        background: rgba(255,255,255,0.1);
+        border-radius: 50%;
+    }
+
+    /* Scanner UI */
+    .scanner-overlay {
+        position: relative;
+        background: linear-gradient(to bottom, #000000, #333333);
+        padding: 30px;
+        border-radius: 15px;
+        text-align: center;
+        height: 320px;
+        display: flex;
+        flex-direction: column;
+        justify-content: center;
+        align-items: center;
+        margin-bottom: 20px;
+        box-shadow: 0 6px 16px rgba(0,0,0,0.15);
+        overflow: hidden;
+    }
+
+    .scanner-overlay::before {
+        content: '';
+        position: absolute;
+        top: 0;
+        left: 0;
+        right: 0;
+        height: 1px;
+        background: linear-gradient(to right, transparent, rgba(255,255,255,0.3), transparent);
+    }
+
+    /* Mobile Status Bar */
+    .status-bar {
+        background: linear-gradient(to right, #5c33a4, #6739B7);
+        color: white;
+        padding: 8px 15px;
+        font-size: 12px;
+        display: flex;
+        justify-content: space-between;
+        border-bottom: 1px solid rgba(255,255,255,0.1);
+    }
+
+    /* Navigation Bar */
+    .nav-bar {
+        display: flex;
+        justify-content: space-around;
+        background-color: white;
+        padding: 10px 0;
+        border-radius: 15px;
+        margin-bottom: 20px;
+        box-shadow: 0 2px 10px rgba(0,0,0,0.05);
+    }
+
+    .nav-item {
+        display: flex;
+        flex-direction: column;
+        align-items: center;
+        font-size: 12px;
+        color: #444;
+    }
+
+    .nav-item.active {
+        color: #6739B7;
+        font-weight: bold;
+    }
+
+    /* Card Styling */
+    .phonepe-card {
+        background-color: white;
+        border-radius: 12px;
+        padding: 15px;
+        margin-bottom: 15px;
+        box-shadow: 0 2px 8px rgba(0,0,0,0.06);
+        border: 1px solid #f0f0f0;
+    }
+
+    /* Input Fields */
+    .stTextInput > div > div > input {
+        border-radius: 8px;
+        border: 1px solid #e0e0e0;
+        padding: 10px 15px;
+        transition: all 0.2s;
+    }
+
+    .stTextInput > div > div > input:focus {
+        border-color: #6739B7;
+        box-shadow: 0 0 0 2px rgba(103,57,183,0.2);
+    }
+
+    /* Icon Styling */
+    .folder-icon {
+        font-size: 24px;
+        color: #6739B7;
+    }
+
+    /* Hide Streamlit Branding */
+    #MainMenu {visibility: hidden;}
+    footer {visibility: hidden;}
+
+    /* Custom Scrollbar */
+    ::-webkit-scrollbar {
+        width: 6px;
+        height: 6px;
+    }
+
+    ::-webkit-scrollbar-track {
+        background: #f1f1f1;
+        border-radius: 10px;
+    }
+
+    ::-webkit-scrollbar-thumb {
+        background: #6739B7;
+        border-radius: 10px;
+    }
+
+    ::-webkit-scrollbar-thumb:hover {
+        background: #5c33a4;
+    }
+    .scanner-frame {
+        border: 2px solid #6739B7;
+        border-radius: 10px;
+        padding: 5px;
+        width: 80%;
+        height: 60%;
+        margin: 0 auto;
+        display: flex;
+        justify-content: center;
+        align-items: center;
+    }
+    .folder-toggle {
+        position: absolute;
+        bottom: 20px;
+        right: 20px;
+        background-color: rgba(103, 57, 183, 0.8);
+        color: white;
+        border-radius: 50%;
+        width: 40px;
+        height: 40px;
+        display: flex;
+        justify-content: center;
+        align-items: center;
+        cursor: pointer;
+        font-size: 18px;
+    }
+    .folder-panel {
+        background-color: #f8f8f8;
+        border-radius: 10px;
+        padding: 15px;
+        margin-top: 10px;
+        border: 1px solid #ddd;
+    }
+    .folder-item {
+        display: flex;
+        align-items: center;
+        padding: 8px;
+        border-radius: 5px;
+        margin-bottom: 5px;
+        cursor: pointer;
+    }
+    .folder-item:hover {
+        background-color: #e9e0ff;
+    }
+    .folder-item-selected {
+        background-color: #e9e0ff;
+        border-left: 3px solid #6739B7;
+    }
+    div[data-testid="stSelectbox"] {
+        background-color: white;
+        border-radius: 5px;
+        padding: 5px;
+        border: 1px solid #ddd;
+    }
+    </style>
+    <style>
+    /* Style tab buttons to look like PhonePe navigation */
+    div.stTabs button {
+        background-color: transparent;
+        color: #6739B7;
+        border: none;
+        margin: 0;
+        padding: 10px 5px;
+        font-size: 12px;
+        font-weight: normal;
+        display: flex;
+        flex-direction: column;
+        align-items: center;
+    }
+    div.stTabs button p {
+        font-size: 24px;
+        margin-bottom: 4px;
+        margin-top: 0;
+    }
+    div.stTabs button[aria-selected="true"] {
+        background-color: rgba(103, 57, 183, 0.1);
+        font-weight: bold;
+    }
+    div.stTabs [role="tablist"] {
+        display: flex;
+        background-color: white;
+        border-radius: 15px;
+        box-shadow: 0 2px 8px rgba(0,0,0,0.1);
+        padding: 5px;
+        margin-bottom: 15px;
+    }
+    div.stTabs [role="tab"] {
+        width: 100%;
+        border-radius: 10px;
+    }
+    div.stTabs [role="tabpanel"] {
+        padding: 0;
+    }
+    .stTabs {
+        background-color: transparent;
+    }
+
+    /* Hide radio buttons we use for navigation state */
+    div[data-testid="stRadio"] {
+        position: absolute !important;
+        top: -9999px !important;
+        left: -9999px !important;
+        visibility: hidden !important;
+        pointer-events: none !important;
+        display: none !important;
+    }
+    </style>
     <script>
     // Wait for the DOM to fully load
     document.addEventListener('DOMContentLoaded', function() {
@@ -401,16 +388,6 @@ def main():
         }
     });
     </script>
-    """, unsafe_allow_html=True)
-    
-    # Create a container for the navigation buttons
-    st.markdown('<div class="nav-container">', unsafe_allow_html=True)
-    
-    # Use regular Streamlit buttons for navigation - at the bottom like PhonePe
-    col1, col2, col3, col4 = st.columns(4)
-    
-    # Apply custom styling for navigation buttons to make them look like PhonePe
-    st.markdown("""
     <style>
     /* Move navigation to bottom and style it */
     .nav-container {
@@ -425,7 +402,7 @@ def main():
         display: flex;
         justify-content: space-around;
     }
-    
+
     /* Style the navigation buttons */
     div[data-testid="column"] > div:has(div.stButton > button[data-testid="baseButton-secondary"]) {
         display: flex;
@@ -433,7 +410,7 @@ def main():
         align-items: center;
         padding: 5px 0;
     }
-    
+
     /* Make the buttons cleaner and text more visible */
     button[data-testid="baseButton-secondary"] {
         background-color: #f0f0f0 !important; /* Light gray background for contrast */
@@ -450,7 +427,7 @@ def main():
         text-shadow: 0px 0px 1px rgba(255,255,255,0.7) !important; /* Subtle text shadow for legibility */
         border-radius: 4px !important; /* Rounded corners */
     }
-    
+
     /* Highlight active button */
     .nav-{st.session_state.current_view} button {
         background-color: #6739B7 !important;
@@ -460,31 +437,70 @@ def main():
         box-shadow: 0 2px 5px rgba(103,57,183,0.5) !important;
         transform: translateY(-2px) !important;
     }
-    
+
     /* Add spacing at bottom of page to prevent nav overlapping content */
     .block-container {
         padding-bottom: 70px;
     }
     </style>
+"""
+
+def inject_styles():
+    """Inject the app-wide CSS as a single block
+    
+    Streamlit removes whatever a full rerun doesn't emit again, so this runs
+    on each full rerun, but as one prebuilt element. Clicks inside the
+    folder grid, payment form and notification list only rerun their
+    fragment and don't resend it.
+    """
+    st.markdown(APP_STYLES, unsafe_allow_html=True)
+
+# Navigation button callback
+def navigate(view):
+    """Switch views before the rerun the click triggers, so one rerun is enough"""
+    st.session_state.current_view = view
+
+def main():
+    # Set page config to match PhonePe style
+    st.set_page_config(page_title="PhonePe", page_icon="📱", layout="centered")
+
+    # Custom CSS and scripts, built once at import
+    inject_styles()
+
+    # Mobile Phone Status Bar (simulated)
+    st.markdown("""
+        <div class="status-bar">
+            <span>📶 5G</span>
+            <span>⚡ 85%</span>
+            <span>⌚ 10:45 AM</span>
+        </div>
     """, unsafe_allow_html=True)
     
+    # PhonePe App Header
+    st.markdown("""
+        <div style="text-align: center; padding: 10px 0;">
+            <h1 style="color: #6739B7; margin: 0; font-size: 28px;">Phone<span style="color: #3483FA;">Pe</span></h1>
+        </div>
+    """, unsafe_allow_html=True)
+    
+    # Unread notifications badge on the navigation button
+    unread_count = st.session_state.notification_manager.get_unread_count()
+    
+    # Create a container for the navigation buttons
+    st.markdown('<div class="nav-container">', unsafe_allow_html=True)
+    
+    # Use regular Streamlit buttons for navigation - at the bottom like PhonePe
+    col1, col2, col3, col4 = st.columns(4)
+    
     # Create the navigation buttons
     with col1:
-        if st.button("📷\nScan", key="nav-scanner", use_container_width=True):
-            st.session_state.current_view = "scanner"
-            st.rerun()
+        st.button("📷\nScan", key="nav-scanner", use_container_width=True, on_click=navigate, args=("scanner",))
     with col2:
-        if st.button("📋\nHistory", key="nav-history", use_container_width=True):
-            st.session_state.current_view = "history"
-            st.rerun()
+        st.button("📋\nHistory", key="nav-history", use_container_width=True, on_click=navigate, args=("history",))
     with col3:
-        if st.button("🔔\nNotify", key="nav-notifications", use_container_width=True):
-            st.session_state.current_view = "notifications"
-            st.rerun()
+        st.button(f"🔔\nNotify ({unread_count})" if unread_count else "🔔\nNotify", key="nav-notifications", use_container_width=True, on_click=navigate, args=("notifications",))
     with col4:
-        if st.button("📊\nAnalytics", key="nav-analytics", use_container_width=True):
-            st.session_state.current_view = "analytics"
-            st.rerun()
+        st.button("📊\nAnalytics", key="nav-analytics", use_container_width=True, on_click=navigate, args=("analytics",))
     
     st.markdown('</div>', unsafe_allow_html=True)
     
@@ -647,80 +663,115 @@ def show_scanner_interface():
 
     # Show folder options if enabled
     if st.session_state.show_folder_options:
-        with st.container():
-            st.markdown("""
-                <div class="folder-panel">
-                    <h3 style="color: #6739B7; margin-bottom: 15px;">📁 Select Folder</h3>
-                </div>
-            """, unsafe_allow_html=True)
-            
-            # Create new folder functionality
-            col1, col2 = st.columns([1, 3])
-            with col1:
-                create_folder = st.button("➕ New Folder", use_container_width=True)
-            
-            # Initialize the input state
-            if 'new_folder_name' not in st.session_state:
-                st.session_state.new_folder_name = ""
-            if 'show_folder_input' not in st.session_state:
-                st.session_state.show_folder_input = False
-                
-            # Toggle the folder input form when button is clicked
-            if create_folder:
-                st.session_state.show_folder_input = True
-            
-            # Show the folder creation form when needed
-            if st.session_state.show_folder_input:
-                with st.container():
-                    st.markdown("<div style='background-color: #e9e0ff; padding: 15px; border-radius: 10px; margin-top: 10px;'>", unsafe_allow_html=True)
-                    
-                    new_folder_name = st.text_input("Enter new folder name:", key="folder_name_input")
-                    
-                    col1, col2, col3 = st.columns([1,1,1])
-                    with col1:
-                        if st.button("Create Folder"):
-                            if new_folder_name:
-                                success = st.session_state.folder_manager.create_folder(new_folder_name)
-                                if success:
-                                    st.success(f"Folder '{new_folder_name}' created successfully!")
-                                    # Update selected folder to the newly created one
-                                    st.session_state.selected_folder = new_folder_name
-                                    st.session_state.show_folder_input = False
-                                else:
-                                    st.warning(f"Folder '{new_folder_name}' already exists!")
+        show_folder_picker()
+
+    # Simulate payment process - PhonePe style payment interface
+    show_payment_form()
+
+@st.fragment
+def show_folder_picker():
+    """Folder grid and new-folder form
+
+    Most clicks here only rerun this fragment, but choosing or creating a
+    folder reruns the whole page: the payment form's split options and
+    folder caption depend on the selected folder.
+    """
+    with st.container():
+        st.markdown("""
+            <div class="folder-panel">
+                <h3 style="color: #6739B7; margin-bottom: 15px;">📁 Select Folder</h3>
+            </div>
+        """, unsafe_allow_html=True)
+
+        # Outcome of creating a folder, kept across the page rerun that followed it
+        folder_message = st.session_state.pop('folder_message', None)
+        if folder_message:
+            st.success(folder_message)
+
+        # Create new folder functionality
+        col1, col2 = st.columns([1, 3])
+        with col1:
+            create_folder = st.button("➕ New Folder", use_container_width=True)
+
+        # Initialize the input state
+        if 'new_folder_name' not in st.session_state:
+            st.session_state.new_folder_name = ""
+        if 'show_folder_input' not in st.session_state:
+            st.session_state.show_folder_input = False
+
+        # Toggle the folder input form when button is clicked
+        if create_folder:
+            st.session_state.show_folder_input = True
+
+        # Show the folder creation form when needed
+        if st.session_state.show_folder_input:
+            with st.container():
+                st.markdown("<div style='background-color: #e9e0ff; padding: 15px; border-radius: 10px; margin-top: 10px;'>", unsafe_allow_html=True)
+
+                new_folder_name = st.text_input("Enter new folder name:", key="folder_name_input")
+                parent_folder = st.selectbox(
+                    "Inside folder (optional):",
+                    ["None"] + st.session_state.folder_manager.get_folders(),
+                    key="parent_folder_input"
+                )
+
+                col1, col2, col3 = st.columns([1,1,1])
+                with col1:
+                    if st.button("Create Folder"):
+                        if new_folder_name:
+                            success = st.session_state.folder_manager.create_folder(
+                                new_folder_name,
+                                parent=None if parent_folder == "None" else parent_folder
+                            )
+                            if success:
+                                st.session_state.folder_message = f"Folder '{new_folder_name}' created successfully!"
+                                # Update selected folder to the newly created one
+                                st.session_state.selected_folder = new_folder_name
+                                st.session_state.show_folder_input = False
+                                st.rerun()
                             else:
-                                st.error("Please enter a folder name!")
-                                
-                    with col3:
-                        if st.button("Cancel"):
-                            st.session_state.show_folder_input = False
-                    
-                    st.markdown("</div>", unsafe_allow_html=True)
-            
-            # Get existing folders
-            folders = st.session_state.folder_manager.get_folders()
-            if not folders:  # If no folders exist, add a Default folder
-                st.session_state.folder_manager.create_folder('Default')
-                folders = ['Default']
-            
-            # Custom folder selection with icons
-            st.markdown("<p style='margin-top: 15px; font-weight: bold;'>Choose a folder:</p>", unsafe_allow_html=True)
-            
-            # Display folders in a grid
-            cols = st.columns(3)
-            for i, folder in enumerate(folders):
-                with cols[i % 3]:
-                    if st.button(f"📁 {folder}", key=f"folder_{i}", use_container_width=True):
+                                st.warning(f"Folder '{new_folder_name}' already exists!")
+                        else:
+                            st.error("Please enter a folder name!")
+
+                with col3:
+                    if st.button("Cancel"):
+                        st.session_state.show_folder_input = False
+
+                st.markdown("</div>", unsafe_allow_html=True)
+
+        # Get existing folders
+        folders = st.session_state.folder_manager.get_folders()
+        if not folders:  # If no folders exist, add a Default folder
+            st.session_state.folder_manager.create_folder('Default')
+            folders = ['Default']
+
+        # Custom folder selection with icons
+        st.markdown("<p style='margin-top: 15px; font-weight: bold;'>Choose a folder:</p>", unsafe_allow_html=True)
+
+        # Display folders in a grid
+        cols = st.columns(3)
+        for i, folder in enumerate(folders):
+            with cols[i % 3]:
+                if st.button(f"📁 {folder}", key=f"folder_{i}", use_container_width=True):
+                    if folder != st.session_state.selected_folder:
                         st.session_state.selected_folder = folder
-            
-            # Show currently selected folder
-            st.markdown(f"""
-                <div style='margin-top: 15px; padding: 10px; background-color: #e9e0ff; border-radius: 5px;'>
-                    <p style='margin: 0; color: #6739B7;'>Selected: 📁 {st.session_state.selected_folder}</p>
-                </div>
-            """, unsafe_allow_html=True)
+                        st.rerun()
 
-    # Simulate payment process - PhonePe style payment interface
+        # Show currently selected folder
+        st.markdown(f"""
+            <div style='margin-top: 15px; padding: 10px; background-color: #e9e0ff; border-radius: 5px;'>
+                <p style='margin: 0; color: #6739B7;'>Selected: 📁 {st.session_state.selected_folder}</p>
+            </div>
+        """, unsafe_allow_html=True)
+
+@st.fragment
+def show_payment_form():
+    """Payment details and Pay Now
+
+    Editing the form only reruns this fragment; a payment reruns the whole
+    page and shows its receipt from session_state.
+    """
     with st.container():
         st.markdown("""
             <div style="background-color: white; padding: 15px; border-radius: 10px; margin-top: 20px; box-shadow: 0 2px 5px rgba(0,0,0,0.1);">
@@ -761,39 +812,90 @@ def show_scanner_interface():
         note = st.text_input("✏️ Add a note (optional)", 
                            placeholder="What's this payment for?")
         
+        # Optional tags
+        tags = st.text_input("🏷️ Tags (optional)", 
+                           placeholder="e.g. reimbursable, trip-goa")
+        
+        # Optionally split the payment across several folders
+        splits = {}
+        if st.session_state.show_folder_options:
+            with st.expander("➗ Split across folders"):
+                split_folders = st.multiselect(
+                    "Also allocate part of this payment to:",
+                    [f for f in st.session_state.folder_manager.get_folders() if f != st.session_state.selected_folder]
+                )
+                for split_folder in split_folders:
+                    splits[split_folder] = st.number_input(
+                        f"Amount for {split_folder} (₹)",
+                        min_value=0.0,
+                        step=10.0,
+                        format="%.2f",
+                        key=f"split_{split_folder}"
+                    )
+                if split_folders:
+                    st.caption(f"The remaining ₹{max(0.0, amount - sum(splits.values())):.2f} stays in {st.session_state.selected_folder}")
+        
         # Payment button styled like PhonePe
         st.markdown("<br>", unsafe_allow_html=True)
         
         pay_col1, pay_col2, pay_col3 = st.columns([1,2,1])
         with pay_col2:
             if st.button("💸 Pay Now", use_container_width=True):
-                if amount > 0 and merchant:
+                if sum(splits.values()) > amount:
+                    st.error("The split amounts add up to more than the payment!")
+                elif amount > 0 and merchant:
                     # Create transaction
                     transaction = {
                         'merchant': merchant,
                         'amount': amount,
                         'timestamp': datetime.now(),
                         'folder': st.session_state.selected_folder if st.session_state.show_folder_options else 'Default',
-                        'notes': note if note else ''
+                        'notes': note if note else '',
+                        'tags': tags,
+                        'splits': splits
                     }
                     
+                    # Shown with the receipt, after the page rerun below
+                    notices = []
+                    
+                    # Compare with earlier payments before this one joins the statistics
+                    anomalies = st.session_state.analytics.check_anomaly(transaction)
+                    projected_before = set(st.session_state.analytics.get_month_end_forecast().query('projected_over')['folder'])
+                    
                     # Save transaction
                     st.session_state.transaction_manager.add_transaction(transaction)
                     
+                    # Flag unusually large payments
+                    if anomalies:
+                        st.session_state.notification_manager.add_anomaly_notification(
+                            merchant,
+                            transaction['folder'],
+                            amount,
+                            anomalies
+                        )
+                        notices.append(('warning', f"🔍 This payment is {max(a['ratio'] for a in anomalies):.1f}x larger than usual. A notification has been added."))
+                    
                     # Check if this transaction exceeds any spending limit
                     folder_name = transaction['folder']
                     if st.session_state.show_folder_options:
-                        # Check folder spending limit
-                        limit_info = st.session_state.analytics.check_folder_limit(
-                            folder_name, 
-                            st.session_state.folder_manager
-                        )
+                        # Check the limits of every folder the payment went to and
+                        # of the folders above them
+                        exceeded = {}
+                        for paid_folder in [folder_name] + list(splits):
+                            for limit_info in st.session_state.analytics.check_folder_limits_upward(
+                                paid_folder,
+                                st.session_state.folder_manager
+                            ):
+                                if limit_info['over_limit']:
+                                    exceeded[limit_info['folder']] = limit_info
+                        exceeded = list(exceeded.values())
                         
-                        # If limit is set and exceeded, create a notification
-                        if limit_info['has_limit'] and limit_info['over_limit']:
+                        # Create a notification for each exceeded limit
+                        for limit_info in exceeded:
+                            limit_folder = limit_info['folder']
                             # Trigger notification
                             st.session_state.notification_manager.add_limit_exceeded_notification(
-                                folder_name,
+                                limit_folder,
                                 limit_info['current'],
                                 limit_info['limit']
                             )
@@ -802,158 +904,191 @@ def show_scanner_interface():
                             if st.session_state.user_phone:
                                 sms_result = st.session_state.sms_sender.send_limit_exceeded_notification(
                                     st.session_state.user_phone,
-                                    folder_name,
+                                    limit_folder,
                                     limit_info['current'],
                                     limit_info['limit']
                                 )
                                 
                                 if not sms_result['success'] and "not configured" not in sms_result['message']:
-                                    st.error(f"Failed to send SMS notification: {sms_result['message']}")
+                                    notices.append(('error', f"Failed to send SMS notification: {sms_result['message']}"))
                             
                             # Show warning in UI
-                            st.warning(f"""
-                            ⚠️ SPENDING LIMIT EXCEEDED for folder '{folder_name}'!
+                            notices.append(('warning', f"""
+                            ⚠️ SPENDING LIMIT EXCEEDED for folder '{limit_folder}'!
                             You have spent ₹{limit_info['current']:.2f}, which is {limit_info['percentage']:.1f}% of your ₹{limit_info['limit']:.2f} limit.
                             A notification has been sent to your phone.
-                            """)
+                            """))
                     
-                    # Generate transaction ID with current timestamp
-                    transaction_id = f"PHONEPE{datetime.now().strftime('%Y%m%d%H%M%S')}"
-                    
-                    # PhonePe-style success screen with animations
-                    
-                    # Add CSS animations and success message
-                    st.markdown("""
-                    <style>
-                    @keyframes fadeIn {
-                        from { opacity: 0; transform: translateY(20px); }
-                        to { opacity: 1; transform: translateY(0); }
-                    }
-                    
-                    @keyframes checkmark {
-                        0% { transform: scale(0); opacity: 0; }
-                        50% { transform: scale(1.2); }
-                        100% { transform: scale(1); opacity: 1; }
-                    }
-                    
-                    @keyframes rotating {
-                        from { transform: rotate(0deg); }
-                        to { transform: rotate(360deg); }
-                    }
+                    # Warn about folders this payment puts on course to exceed their monthly limit
+                    if st.session_state.show_folder_options:
+                        forecast = st.session_state.analytics.get_month_end_forecast()
+                        for overrun in forecast[forecast['projected_over'] & (forecast['spent'] <= forecast['limit'])].itertuples():
+                            if overrun.folder in projected_before:
+                                continue
+                            st.session_state.notification_manager.add_projected_overrun_notification(
+                                overrun.folder,
+                                overrun.forecast,
+                                overrun.limit
+                            )
+                            notices.append(('info', f"📈 At this rate '{overrun.folder}' will reach about ₹{overrun.forecast:.2f} by the end of the month, above its ₹{overrun.limit:.2f} limit."))
                     
-                    .payment-success-block {
-                        animation: fadeIn 0.5s ease-out forwards;
+                    # Generate transaction ID with current timestamp
+                    paid_at = datetime.now()
+                    st.session_state.payment_receipt = {
+                        'transaction_id': f"PHONEPE{paid_at.strftime('%Y%m%d%H%M%S')}",
+                        'paid_at': paid_at,
+                        'amount': amount,
+                        'merchant': merchant,
+                        'folder': transaction['folder'],
+                        'note': note,
+                        'show_folder': st.session_state.show_folder_options,
+                        'notices': notices
                     }
+                    # The payment may have added notifications, and their unread
+                    # count in the navigation bar is drawn outside this fragment
+                    st.rerun()
+                else:
+                    st.error("Please enter a valid merchant ID and amount")
+            
+            # Receipt of the last payment, kept until Done is clicked
+            receipt = st.session_state.get('payment_receipt')
+            if receipt:
+                for kind, message in receipt['notices']:
+                    getattr(st, kind)(message)
+                
+                # PhonePe-style success screen with animations
+                
+                # Add CSS animations and success message
+                st.markdown("""
+                <style>
+                @keyframes fadeIn {
+                    from { opacity: 0; transform: translateY(20px); }
+                    to { opacity: 1; transform: translateY(0); }
+                }
+                
+                @keyframes checkmark {
+                    0% { transform: scale(0); opacity: 0; }
+                    50% { transform: scale(1.2); }
+                    100% { transform: scale(1); opacity: 1; }
+                }
+                
+                @keyframes rotating {
+                    from { transform: rotate(0deg); }
+                    to { transform: rotate(360deg); }
+                }
+                
+                .payment-success-block {
+                    animation: fadeIn 0.5s ease-out forwards;
+                }
+                
+                .checkmark-circle {
+                    width: 60px;
+                    height: 60px;
+                    background-color: #28a745;
+                    border-radius: 50%;
+                    display: flex;
+                    align-items: center;
+                    justify-content: center;
+                    margin: 0 auto 15px auto;
+                    animation: checkmark 0.5s ease-out forwards;
+                }
+                
+                .celebration-dot {
+                    position: absolute;
+                    width: 8px;
+                    height: 8px;
+                    border-radius: 50%;
+                    animation: fadeIn 0.3s ease-out forwards, rotating 8s linear infinite;
+                }
+                </style>
+                
+                <div class="payment-success-block" style="position: relative; background: linear-gradient(135deg, #f5fffa 0%, #e1f5fe 100%); padding: 25px; border-radius: 15px; text-align: center; margin: 15px 0; border: 1px solid #d4edda;">
+                    <div class="checkmark-circle">
+                        <span style="color: white; font-size: 30px;">✓</span>
+                    </div>
                     
-                    .checkmark-circle {
-                        width: 60px;
-                        height: 60px;
-                        background-color: #28a745;
-                        border-radius: 50%;
-                        display: flex;
-                        align-items: center;
-                        justify-content: center;
-                        margin: 0 auto 15px auto;
-                        animation: checkmark 0.5s ease-out forwards;
-                    }
+                    <h2 style="color: #28a745; margin-bottom: 5px; font-weight: 600;">
+                        Payment Successful!
+                    </h2>
                     
-                    .celebration-dot {
-                        position: absolute;
-                        width: 8px;
-                        height: 8px;
-                        border-radius: 50%;
-                        animation: fadeIn 0.3s ease-out forwards, rotating 8s linear infinite;
-                    }
-                    </style>
+                    <p style="color: #555; margin-bottom: 20px;">
+                        Your transaction has been completed
+                    </p>
                     
-                    <div class="payment-success-block" style="position: relative; background: linear-gradient(135deg, #f5fffa 0%, #e1f5fe 100%); padding: 25px; border-radius: 15px; text-align: center; margin: 15px 0; border: 1px solid #d4edda;">
-                        <div class="checkmark-circle">
-                            <span style="color: white; font-size: 30px;">✓</span>
+                    <!-- Celebration dots - like confetti -->
+                    <div class="celebration-dot" style="top: 20px; left: 20px; background-color: #6739B7;"></div>
+                    <div class="celebration-dot" style="top: 40px; right: 30px; background-color: #FFC107; animation-delay: 0.1s;"></div>
+                    <div class="celebration-dot" style="top: 80px; left: 50px; background-color: #FF5722; animation-delay: 0.2s;"></div>
+                    <div class="celebration-dot" style="top: 30px; right: 50px; background-color: #2196F3; animation-delay: 0.3s;"></div>
+                    <div class="celebration-dot" style="top: 70px; left: 80px; background-color: #6739B7; animation-delay: 0.4s;"></div>
+                    <div class="celebration-dot" style="top: 50px; right: 80px; background-color: #4CAF50; animation-delay: 0.5s;"></div>
+                </div>
+                """, unsafe_allow_html=True)
+                
+                # Transaction amount display with animation
+                st.markdown(f"""
+                <div style="background-color: white; border-radius: 10px; padding: 20px; 
+                     box-shadow: 0 2px 6px rgba(0,0,0,0.1); margin-top: 10px; margin-bottom: 20px; animation: fadeIn 0.6s ease-out forwards; animation-delay: 0.2s; opacity: 0;">
+                    <div style="display: flex; align-items: center; justify-content: center; margin-bottom: 10px;">
+                        <div style="width: 40px; height: 40px; background-color: rgba(103, 57, 183, 0.1); 
+                             border-radius: 50%; display: flex; align-items: center; 
+                             justify-content: center; margin-right: 15px;">
+                            <span style="color: #6739B7; font-size: 18px;">₹</span>
                         </div>
-                        
-                        <h2 style="color: #28a745; margin-bottom: 5px; font-weight: 600;">
-                            Payment Successful!
+                        <h2 style="color: #333; margin: 0; font-weight: 600; font-size: 28px;">
+                            {receipt['amount']:.2f}
                         </h2>
-                        
-                        <p style="color: #555; margin-bottom: 20px;">
-                            Your transaction has been completed
-                        </p>
-                        
-                        <!-- Celebration dots - like confetti -->
-                        <div class="celebration-dot" style="top: 20px; left: 20px; background-color: #6739B7;"></div>
-                        <div class="celebration-dot" style="top: 40px; right: 30px; background-color: #FFC107; animation-delay: 0.1s;"></div>
-                        <div class="celebration-dot" style="top: 80px; left: 50px; background-color: #FF5722; animation-delay: 0.2s;"></div>
-                        <div class="celebration-dot" style="top: 30px; right: 50px; background-color: #2196F3; animation-delay: 0.3s;"></div>
-                        <div class="celebration-dot" style="top: 70px; left: 80px; background-color: #6739B7; animation-delay: 0.4s;"></div>
-                        <div class="celebration-dot" style="top: 50px; right: 80px; background-color: #4CAF50; animation-delay: 0.5s;"></div>
                     </div>
-                    """, unsafe_allow_html=True)
                     
-                    # Transaction amount display with animation
+                    <div style="padding: 15px; background-color: #f8f9fa; border-radius: 8px; margin-bottom: 15px;">
+                        <table style="width: 100%;">
+                            <tr>
+                                <td style="padding: 8px 0; color: #555; font-size: 14px;">Transaction ID</td>
+                                <td style="padding: 8px 0; color: #333; font-weight: 500; text-align: right;">{receipt['transaction_id']}</td>
+                            </tr>
+                            <tr>
+                                <td style="padding: 8px 0; color: #555; font-size: 14px;">Date & Time</td>
+                                <td style="padding: 8px 0; color: #333; text-align: right;">{receipt['paid_at'].strftime('%d %b, %I:%M %p')}</td>
+                            </tr>
+                            <tr>
+                                <td style="padding: 8px 0; color: #555; font-size: 14px;">Paid to</td>
+                                <td style="padding: 8px 0; color: #333; text-align: right;">{receipt['merchant']}</td>
+                            </tr>
+                            <tr>
+                                <td style="padding: 8px 0; color: #555; font-size: 14px;">Folder</td>
+                                <td style="padding: 8px 0; color: #6739B7; font-weight: 500; text-align: right;">
+                                    📁 {receipt['folder']}
+                                </td>
+                            </tr>
+                            {f'<tr><td style="padding: 8px 0; color: #555; font-size: 14px;">Note</td><td style="padding: 8px 0; color: #333; text-align: right;">{receipt["note"]}</td></tr>' if receipt['note'] else ''}
+                        </table>
+                    </div>
+                    
+                    <div style="background-color: #e9f7ef; border-radius: 8px; padding: 12px; text-align: center;">
+                        <p style="margin: 0; color: #28a745; font-weight: 500;">
+                            Transaction completed successfully!
+                        </p>
+                    </div>
+                </div>
+                """, unsafe_allow_html=True)
+                
+                # Add "Done" button to close the payment screen
+                col1, col2, col3 = st.columns([1,2,1])
+                with col2:
+                    if st.button("✓ Done", use_container_width=True, key="done_btn"):
+                        st.session_state.qr_scanned = False
+                        del st.session_state.payment_receipt
+                        st.rerun()
+                
+                if receipt['show_folder']:
                     st.markdown(f"""
-                    <div style="background-color: white; border-radius: 10px; padding: 20px; 
-                         box-shadow: 0 2px 6px rgba(0,0,0,0.1); margin-top: 10px; margin-bottom: 20px; animation: fadeIn 0.6s ease-out forwards; animation-delay: 0.2s; opacity: 0;">
-                        <div style="display: flex; align-items: center; justify-content: center; margin-bottom: 10px;">
-                            <div style="width: 40px; height: 40px; background-color: rgba(103, 57, 183, 0.1); 
-                                 border-radius: 50%; display: flex; align-items: center; 
-                                 justify-content: center; margin-right: 15px;">
-                                <span style="color: #6739B7; font-size: 18px;">₹</span>
-                            </div>
-                            <h2 style="color: #333; margin: 0; font-weight: 600; font-size: 28px;">
-                                {amount:.2f}
-                            </h2>
-                        </div>
-                        
-                        <div style="padding: 15px; background-color: #f8f9fa; border-radius: 8px; margin-bottom: 15px;">
-                            <table style="width: 100%;">
-                                <tr>
-                                    <td style="padding: 8px 0; color: #555; font-size: 14px;">Transaction ID</td>
-                                    <td style="padding: 8px 0; color: #333; font-weight: 500; text-align: right;">{transaction_id}</td>
-                                </tr>
-                                <tr>
-                                    <td style="padding: 8px 0; color: #555; font-size: 14px;">Date & Time</td>
-                                    <td style="padding: 8px 0; color: #333; text-align: right;">{datetime.now().strftime('%d %b, %I:%M %p')}</td>
-                                </tr>
-                                <tr>
-                                    <td style="padding: 8px 0; color: #555; font-size: 14px;">Paid to</td>
-                                    <td style="padding: 8px 0; color: #333; text-align: right;">{merchant}</td>
-                                </tr>
-                                <tr>
-                                    <td style="padding: 8px 0; color: #555; font-size: 14px;">Folder</td>
-                                    <td style="padding: 8px 0; color: #6739B7; font-weight: 500; text-align: right;">
-                                        📁 {transaction['folder']}
-                                    </td>
-                                </tr>
-                                {f'<tr><td style="padding: 8px 0; color: #555; font-size: 14px;">Note</td><td style="padding: 8px 0; color: #333; text-align: right;">{note}</td></tr>' if note else ''}
-                            </table>
-                        </div>
-                        
-                        <div style="background-color: #e9f7ef; border-radius: 8px; padding: 12px; text-align: center;">
-                            <p style="margin: 0; color: #28a745; font-weight: 500;">
-                                Transaction completed successfully!
+                        <div style="background-color: #e9e0ff; padding: 10px; border-radius: 5px; margin-top: 10px; text-align: center;">
+                            <p style="color: #6739B7; margin: 0;">
+                                <span style="font-size: 20px;">📁</span> 
+                                Transaction saved in folder: <strong>{receipt['folder']}</strong>
                             </p>
                         </div>
-                    </div>
                     """, unsafe_allow_html=True)
-                    
-                    # Add "Done" button to close the payment screen
-                    col1, col2, col3 = st.columns([1,2,1])
-                    with col2:
-                        if st.button("✓ Done", use_container_width=True, key="done_btn"):
-                            st.session_state.qr_scanned = False 
-                            st.rerun()
-                    
-                    if st.session_state.show_folder_options:
-                        st.markdown(f"""
-                            <div style="background-color: #e9e0ff; padding: 10px; border-radius: 5px; margin-top: 10px; text-align: center;">
-                                <p style="color: #6739B7; margin: 0;">
-                                    <span style="font-size: 20px;">📁</span> 
-                                    Transaction saved in folder: <strong>{st.session_state.selected_folder}</strong>
-                                </p>
-                            </div>
-                        """, unsafe_allow_html=True)
-                else:
-                    st.error("Please enter a valid merchant ID and amount")
 
 def show_transaction_history():
     """Display transaction history with folder filtering"""
@@ -975,9 +1110,17 @@ def show_transaction_history():
     # Add "All Folders" option at the beginning
     filter_options = ["All Folders"] + folders
     
-    tab1, tab2 = st.tabs(["📊 Transactions", "⚙️ Spending Limits"])
+    # A segmented control rather than st.tabs, so only the view being shown
+    # is computed. (Radios can't be used: the navigation CSS hides them.)
+    history_view = st.segmented_control(
+        "View:",
+        ["📊 Transactions", "⚙️ Spending Limits"],
+        default="📊 Transactions",
+        label_visibility="collapsed",
+        key="history_view"
+    ) or "📊 Transactions"
     
-    with tab1:
+    if history_view == "📊 Transactions":
         # Create filter dropdown
         selected_folder = st.selectbox(
             "Select a folder to view transactions:", 
@@ -1045,7 +1188,18 @@ def show_transaction_history():
                 """, unsafe_allow_html=True)
         
         # Get transactions for the selected folder
-        transactions = st.session_state.analytics.get_folder_transactions(selected_folder)
+        # Tag filter, resolved on the tag bitmaps
+        tag_col1, tag_col2 = st.columns([3, 1])
+        with tag_col1:
+            selected_tags = st.multiselect("Filter by tags:", st.session_state.analytics.get_tags())
+        with tag_col2:
+            tag_match = st.segmented_control("Match", ["Any", "All"], default="Any") or "Any"
+        
+        transactions = st.session_state.analytics.get_folder_transactions(
+            selected_folder,
+            all_tags=selected_tags if tag_match == "All" else None,
+            any_tags=selected_tags if tag_match == "Any" else None
+        )
         
         # Display transactions
         if not transactions.empty:
@@ -1053,7 +1207,7 @@ def show_transaction_history():
             transactions['formatted_date'] = transactions['timestamp'].dt.strftime('%d %b %Y, %I:%M %p')
             
             # Total amount for the selected folder
-            total_amount = transactions['amount'].sum()
+            total_amount = transactions['folder_amount'].sum() if 'folder_amount' in transactions else transactions['amount'].sum()
             
             # Display the total
             st.markdown(f"""
@@ -1087,8 +1241,46 @@ def show_transaction_history():
                                 <p style="margin: 0; color: #6739B7; font-weight: bold; font-size: 14px;">📁 {tx['folder']}</p>
                             </div>
                             <p style="margin: 5px 0 0; color: #777; font-style: italic;">{tx['notes'] if tx['notes'] else 'No notes'}</p>
+                            <p style="margin: 5px 0 0; color: #6739B7; font-size: 13px;">{' '.join(f'🏷️ {tag}' for tag in parse_tags(tx['tags']))}</p>
                         </div>
                     """, unsafe_allow_html=True)
+
+                    # Edit, move or delete this transaction
+                    with st.expander("✏️ Edit transaction"):
+                        edit_col1, edit_col2 = st.columns(2)
+                        with edit_col1:
+                            new_merchant = st.text_input("Merchant", value=str(tx['merchant']), key=f"edit_merchant_{tx['id']}")
+                            new_amount = st.number_input("Amount (₹)", value=float(tx['amount']), min_value=0.0, step=10.0, format="%.2f", key=f"edit_amount_{tx['id']}")
+                        with edit_col2:
+                            folder_index = folders.index(tx['folder']) if tx['folder'] in folders else 0
+                            new_folder = st.selectbox("Folder", folders, index=folder_index, key=f"edit_folder_{tx['id']}")
+                            new_notes = st.text_input("Notes", value=tx['notes'] if isinstance(tx['notes'], str) else '', key=f"edit_notes_{tx['id']}")
+                        current_tags = ', '.join(parse_tags(tx['tags']))
+                        new_tags = st.text_input("Tags", value=current_tags, key=f"edit_tags_{tx['id']}")
+
+                        save_col, delete_col = st.columns(2)
+                        with save_col:
+                            if st.button("💾 Save changes", key=f"save_{tx['id']}", use_container_width=True):
+                                changes = {}
+                                if new_merchant != tx['merchant']:
+                                    changes['merchant'] = new_merchant
+                                if new_amount != tx['amount']:
+                                    changes['amount'] = new_amount
+                                if new_folder != tx['folder']:
+                                    changes['folder'] = new_folder
+                                if new_notes != (tx['notes'] if isinstance(tx['notes'], str) else ''):
+                                    changes['notes'] = new_notes
+                                if new_tags != current_tags:
+                                    changes['tags'] = new_tags
+                                try:
+                                    if st.session_state.transaction_manager.update_transaction(tx['id'], **changes):
+                                        st.rerun()
+                                except ValueError as e:
+                                    st.error(str(e))
+                        with delete_col:
+                            if st.button("🗑️ Delete", key=f"delete_{tx['id']}", use_container_width=True):
+                                st.session_state.transaction_manager.delete_transaction(tx['id'])
+                                st.rerun()
         else:
             # No transactions found
             st.markdown("""
@@ -1100,26 +1292,24 @@ def show_transaction_history():
             """, unsafe_allow_html=True)
     
     # Spending Limits Tab
-    with tab2:
+    else:
         st.markdown("""
             <div style="background-color: white; padding: 15px; border-radius: 10px; margin-top: 20px; box-shadow: 0 2px 5px rgba(0,0,0,0.1);">
                 <h3 style="color: #6739B7; margin-bottom: 15px; text-align: center;">Folder Spending Limits</h3>
-                <p style="text-align: center; color: #555;">Set monthly spending limits for each folder to manage your expenses</p>
+                <p style="text-align: center; color: #555;">Set a spending limit and budget period for each folder to manage your expenses</p>
             </div>
         """, unsafe_allow_html=True)
         
         # Display folder details and allow setting limits
         folder_details = st.session_state.folder_manager.get_folder_details()
         
-        # Current month info
-        today = date.today()
-        current_month = today.strftime('%B %Y')
+        # Outcome of a rename or delete, kept across the rerun that followed it
+        folder_message = st.session_state.pop('folder_message', None)
+        if folder_message:
+            st.success(folder_message)
         
-        st.markdown(f"""
-            <div style="background-color: #e9e0ff; padding: 10px; border-radius: 5px; margin: 15px 0; text-align: center;">
-                <p style="margin: 0; color: #6739B7; font-weight: bold;">Current Period: {current_month}</p>
-            </div>
-        """, unsafe_allow_html=True)
+        # Month-end forecasts for every folder, computed together
+        forecasts = st.session_state.analytics.get_month_end_forecast().set_index('folder')
         
         # For each folder, show current limit and spending + input to update
         for index, folder in folder_details.iterrows():
@@ -1129,18 +1319,24 @@ def show_transaction_history():
             limit = folder['spending_limit'] if 'spending_limit' in folder else 0.0
             spending_info = st.session_state.analytics.check_folder_limit(folder_name, st.session_state.folder_manager)
             
+            # Current spending for this folder, over its own budget period
+            # (the calendar month for folders without a limit)
+            if spending_info['has_limit']:
+                current_spending, current_period = spending_info['current'], spending_info['period']
+            else:
+                month_spending = st.session_state.analytics.get_current_month_spending(folder_name)
+                current_spending, current_period = month_spending['amount'], month_spending['period']
+            
             with st.container():
                 st.markdown(f"""
                     <div style="padding: 10px; margin: 15px 0 5px 0; background-color: #f8f8f8; border-radius: 5px;">
-                        <h4 style="margin: 0; color: #6739B7;">📁 {folder_name}</h4>
+                        <h4 style="margin: 0; color: #6739B7;">📁 {st.session_state.folder_manager.get_folder_path(folder_name)}</h4>
+                        <p style="margin: 5px 0 0; color: #555; font-size: 14px;">Current period: {current_period}</p>
                     </div>
                 """, unsafe_allow_html=True)
                 
                 col1, col2 = st.columns([3, 2])
                 
-                # Current spending for this folder
-                current_spending = spending_info['current'] if spending_info['has_limit'] else st.session_state.analytics.get_current_month_spending(folder_name)['amount']
-                
                 with col1:
                     st.markdown(f"Current spending: ₹{current_spending:.2f}")
                     if spending_info['has_limit']:
@@ -1152,6 +1348,25 @@ def show_transaction_history():
                             
                         st.progress(min(1.0, spending_info['percentage']/100))
                         st.markdown(f"<p style='color: {progress_color}; font-size: 14px;'>{spending_info['percentage']:.1f}% of limit</p>", unsafe_allow_html=True)
+                        
+                        # Pace compared with the same point in the previous period
+                        pace = st.session_state.analytics.get_spending_pace(
+                            folder_name,
+                            st.session_state.folder_manager.get_limit_period(folder_name)
+                        )
+                        if pace['change'] is None:
+                            st.caption(f"Pace: ₹{pace['current']:.2f} so far (nothing spent by this point last period)")
+                        else:
+                            arrow = "🔺" if pace['change'] > 0 else "🔻"
+                            st.caption(f"Pace: {arrow} {abs(pace['change']):.0f}% vs ₹{pace['previous']:.2f} at this point last period")
+                
+                    # Projected spending by the end of the month
+                    if folder_name in forecasts.index and forecasts.at[folder_name, 'days_left'] > 0:
+                        projected = forecasts.at[folder_name, 'forecast']
+                        if forecasts.at[folder_name, 'projected_over']:
+                            st.markdown(f"<p style='color: #dc3545; font-size: 14px;'>📈 Projected month end: ₹{projected:.2f}, over the limit</p>", unsafe_allow_html=True)
+                        else:
+                            st.caption(f"📈 Projected month end: ₹{projected:.2f}")
                 
                 with col2:
                     # Set new limit
@@ -1164,8 +1379,64 @@ def show_transaction_history():
                         key=f"limit_{folder_name}"
                     )
                     
+                    # How the proposed limit would have fared in past months
+                    if new_limit > 0:
+                        with st.expander("🧪 Test on past months"):
+                            # Computed on request rather than for every folder on every rerun;
+                            # the result stays up while the proposed limit is unchanged
+                            backtest_key = f"backtest_{folder_name}"
+                            if st.button("Run test", key=f"backtest_button_{folder_name}"):
+                                st.session_state[backtest_key] = round(new_limit, 2)
+                            if st.session_state.get(backtest_key) != round(new_limit, 2):
+                                st.caption(f"See how ₹{new_limit:.2f} and nearby limits would have fared in past months.")
+                            else:
+                                candidates = [round(new_limit * factor, 2) for factor in (0.5, 0.75, 1.0, 1.25, 1.5)]
+                                backtest = st.session_state.analytics.backtest_limit(folder_name, candidates)
+                                summary = backtest['summary']
+                                if summary.empty:
+                                    st.caption("No past months to test against yet.")
+                                else:
+                                    proposed = summary[summary['limit'] == round(new_limit, 2)].iloc[0]
+                                    if proposed['breaches']:
+                                        st.caption(f"₹{new_limit:.2f} would have been exceeded in {int(proposed['breaches'])} of {int(proposed['months'])} past months, typically by day {int(proposed['typical_breach_day'])}")
+                                    else:
+                                        st.caption(f"₹{new_limit:.2f} would not have been exceeded in any of the past {int(proposed['months'])} months")
+                                    st.dataframe(
+                                        summary.rename(columns={
+                                            'limit': 'Limit (₹)',
+                                            'breaches': 'Months over',
+                                            'breach_rate': '% of months',
+                                            'typical_breach_day': 'Typical day'
+                                        }).drop(columns='months').set_index('Limit (₹)').style.format({
+                                            '% of months': '{:.0f}%',
+                                            'Typical day': '{:.0f}'
+                                        }, na_rep='—'),
+                                        use_container_width=True
+                                    )
+                                    breach_months = backtest['months']
+                                    breach_months = breach_months[(breach_months['limit'] == round(new_limit, 2)) & breach_months['first_breach'].notna()]
+                                    if not breach_months.empty:
+                                        st.caption("Went over on: " + ", ".join(day.strftime('%d %b %Y') for day in breach_months['first_breach']))
+                    
+                    # Budget period the limit applies to
+                    period_options = {"Monthly": "monthly", "Weekly": "weekly", "Fortnightly": "fortnightly", "Custom (last N days)": "days"}
+                    current_period = st.session_state.folder_manager.get_limit_period(folder_name)
+                    period_labels = list(period_options)
+                    period_index = list(period_options.values()).index(current_period.split(':')[0])
+                    period_label = st.selectbox("Period:", period_labels, index=period_index, key=f"period_{folder_name}")
+                    new_period = period_options[period_label]
+                    if new_period == "days":
+                        window_days = st.number_input(
+                            "Window (days):",
+                            min_value=1,
+                            value=int(current_period.split(':')[1]) if current_period.startswith('days:') else 10,
+                            step=1,
+                            key=f"period_days_{folder_name}"
+                        )
+                        new_period = f"days:{int(window_days)}"
+                    
                     if st.button(f"Update Limit", key=f"update_{folder_name}"):
-                        success = st.session_state.folder_manager.set_spending_limit(folder_name, new_limit)
+                        success = st.session_state.folder_manager.set_spending_limit(folder_name, new_limit, new_period)
                         if success:
                             st.success(f"Spending limit updated for {folder_name}!")
                             if new_limit > 0:
@@ -1174,9 +1445,56 @@ def show_transaction_history():
                                 st.info("No spending limit set (0 = unlimited)")
                         else:
                             st.error("Failed to update spending limit!")
+                    
+                    # Transactions refer to the folder by ID, so renaming only touches folders.csv
+                    with st.expander("✏️ Rename folder"):
+                        new_name = st.text_input("New name", value=folder_name, key=f"rename_{folder_name}")
+                        if st.button("Rename", key=f"rename_button_{folder_name}"):
+                            new_name = new_name.strip()
+                            if not new_name:
+                                st.error("Please enter a folder name!")
+                            elif new_name == folder_name:
+                                st.info("That is already the folder's name.")
+                            elif st.session_state.folder_manager.rename_folder(folder_name, new_name):
+                                st.session_state.folder_message = f"Renamed '{folder_name}' to '{new_name}'!"
+                                st.rerun()
+                            else:
+                                st.error("A folder with that name already exists!")
+
+                    with st.expander("🗑️ Delete folder"):
+                        other_folders = [name for name in folder_details['folder_name'] if name != folder_name]
+                        delete_mode = st.segmented_control(
+                            "Existing transactions",
+                            ["Move to another folder", "Archive"],
+                            default="Move to another folder",
+                            key=f"delete_mode_{folder_name}"
+                        ) or "Move to another folder"
+                        target_folder = None
+                        if delete_mode == "Move to another folder":
+                            target_folder = st.selectbox("Move to", other_folders or ['Default'], key=f"delete_target_{folder_name}")
+                        if st.button("Delete Folder", key=f"delete_button_{folder_name}"):
+                            try:
+                                if delete_mode == "Archive":
+                                    moved = st.session_state.folder_manager.delete_folder(
+                                        folder_name, mode='archive', transaction_manager=st.session_state.transaction_manager)
+                                    st.session_state.folder_message = f"Deleted '{folder_name}' and archived {moved} transactions"
+                                else:
+                                    moved = st.session_state.folder_manager.delete_folder(
+                                        folder_name, mode='reassign', reassign_to=target_folder,
+                                        transaction_manager=st.session_state.transaction_manager)
+                                    st.session_state.folder_message = f"Deleted '{folder_name}' and moved {moved} transactions to '{target_folder}'"
+                            except ValueError as e:
+                                # e.g. moving the transactions into the folder being deleted
+                                st.error(str(e))
+                            else:
+                                st.rerun()
 
 def show_spending_analytics():
     """Display spending analytics with pie charts and graphs showing category-wise spending"""
+    # Plotly is only needed here, so it is loaded on the first visit rather
+    # than slowing down startup on every other view
+    import plotly.express as px
+    
     # Page title
     st.title("Spending Analytics")
     
@@ -1222,16 +1540,24 @@ def show_spending_analytics():
             index=0,
         )
     
+    # Only count transactions carrying any of these tags
+    analytics_tags = st.multiselect("Only transactions tagged:", st.session_state.analytics.get_tags())
+    
     # Error message if no folders are selected
     if not selected_folders:
         st.warning("Please select at least one folder to view analytics.")
         return
     
-    # Get analytics data
-    analytics_data = st.session_state.analytics.generate_analytics()
+    # Calendar months covered by the selected time period
+    months, date_range = st.session_state.analytics.get_period_months(time_period)
     
-    # Extract spending data by folder
-    spending_by_folder = analytics_data['spending_by_folder']
+    # Spending by folder: summed from the spending cube, unless a tag filter
+    # needs the individual transactions
+    if analytics_tags:
+        analytics_data = st.session_state.analytics.generate_analytics(date_range=date_range, any_tags=analytics_tags)
+        spending_by_folder = analytics_data['spending_by_folder']
+    else:
+        spending_by_folder = st.session_state.analytics.get_spending_by_folder(months)
     
     # Filter by selected folders if not "All Folders"
     if selected_folders:
@@ -1251,37 +1577,83 @@ def show_spending_analytics():
         </div>
     """, unsafe_allow_html=True)
     
-    # Create tabs for different visualizations
-    tab1, tab2, tab3 = st.tabs(["📈 Pie Chart", "📊 Bar Chart", "🔍 Detailed Breakdown"])
+    # Rolling spend over the last 7, 30 and 90 days
+    rolling = st.session_state.analytics.get_rolling_spending()
+    st.markdown("<h3 style='text-align: center; color: #6739B7;'>Recent Spending</h3>", unsafe_allow_html=True)
+    rolling_cols = st.columns(len(rolling['overall']))
+    for col, (window, amount) in zip(rolling_cols, rolling['overall'].items()):
+        with col:
+            st.metric(f"Last {window} days", f"₹{amount:.2f}")
+    rolling_by_folder = rolling['by_folder'][rolling['by_folder']['folder'].isin(selected_folders)]
+    st.dataframe(rolling_by_folder.set_index('folder').style.format("₹{:.2f}"), use_container_width=True)
     
-    with tab1:
+    # Typical payment sizes, from the quantile sketches
+    st.markdown("<h3 style='text-align: center; color: #6739B7;'>Payment Sizes</h3>", unsafe_allow_html=True)
+    size_col1, size_col2 = st.columns(2)
+    with size_col1:
+        size_by = st.segmented_control("Group by:", ["Folder", "Merchant"], default="Folder", key="size_by") or "Folder"
+    with size_col2:
+        size_month = st.segmented_control("Period:", ["All Time", "Current Month"], default="All Time", key="size_month") or "All Time"
+    sizes = st.session_state.analytics.get_amount_distribution(
+        size_by.lower(),
+        date.today().strftime('%Y-%m') if size_month == "Current Month" else None
+    )
+    if size_by == "Folder":
+        sizes = sizes[sizes['folder'].isin(selected_folders)]
+    if sizes.empty:
+        st.info("No payments in this period yet.")
+    else:
+        st.dataframe(
+            sizes.set_index(size_by.lower()).style.format({'median': "₹{:.2f}", 'p90': "₹{:.2f}", 'p99': "₹{:.2f}"}),
+            use_container_width=True
+        )
+        st.caption("Median, 90th and 99th percentile payment amounts (approximate for long histories)")
+    
+    # Charts are rebuilt only when the data or these filters change
+    chart_filters = (tuple(selected_folders), time_period, tuple(analytics_tags))
+    
+    # Choose a visualization; only the selected one is built (switching back
+    # to one already seen is answered from the figure cache)
+    analytics_view = st.segmented_control(
+        "View:",
+        ["📈 Pie Chart", "📊 Bar Chart", "📉 Trend", "🗓️ When", "⚖️ Compare", "🔍 Detailed Breakdown"],
+        default="📈 Pie Chart",
+        label_visibility="collapsed",
+        key="analytics_view"
+    ) or "📈 Pie Chart"
+    
+    if analytics_view == "📈 Pie Chart":
         st.markdown("<h3 style='text-align: center; color: #6739B7;'>Spending Distribution by Folder</h3>", unsafe_allow_html=True)
         
         # Create a pie chart showing distribution of spending across folders
-        spending_pie = px.pie(
-            spending_by_folder, 
-            values='amount', 
-            names='folder',
-            title='Spending Distribution by Folder',
-            hover_data=['percentage'],
-            labels={'amount': 'Amount (₹)', 'folder': 'Folder', 'percentage': 'Percentage (%)'},
-            color_discrete_sequence=px.colors.qualitative.Bold,
-        )
+        def build_pie():
+            spending_pie = px.pie(
+                spending_by_folder, 
+                values='amount', 
+                names='folder',
+                title='Spending Distribution by Folder',
+                hover_data=['percentage'],
+                labels={'amount': 'Amount (₹)', 'folder': 'Folder', 'percentage': 'Percentage (%)'},
+                color_discrete_sequence=px.colors.qualitative.Bold,
+            )
         
-        # Customize the pie chart
-        spending_pie.update_traces(
-            textposition='inside',
-            textinfo='percent+label',
-            hovertemplate='<b>%{label}</b><br>Amount: ₹%{value:.2f}<br>Percentage: %{customdata[0]:.1f}%'
-        )
+            # Customize the pie chart
+            spending_pie.update_traces(
+                textposition='inside',
+                textinfo='percent+label',
+                hovertemplate='<b>%{label}</b><br>Amount: ₹%{value:.2f}<br>Percentage: %{customdata[0]:.1f}%'
+            )
         
-        # Set the theme and layout
-        spending_pie.update_layout(
-            legend_title_text='Folders',
-            legend=dict(orientation="h", yanchor="bottom", y=-0.3, xanchor="center", x=0.5),
-            margin=dict(t=60, b=120, l=40, r=40),
-            height=500,
-        )
+            # Set the theme and layout
+            spending_pie.update_layout(
+                legend_title_text='Folders',
+                legend=dict(orientation="h", yanchor="bottom", y=-0.3, xanchor="center", x=0.5),
+                margin=dict(t=60, b=120, l=40, r=40),
+                height=500,
+            )
+        
+            return spending_pie
+        spending_pie = cached_figure('pie', chart_filters, build_pie)
         
         # Display the pie chart
         st.plotly_chart(spending_pie, use_container_width=True)
@@ -1302,58 +1674,152 @@ def show_spending_analytics():
                 </div>
             """, unsafe_allow_html=True)
     
-    with tab2:
+    elif analytics_view == "📊 Bar Chart":
         st.markdown("<h3 style='text-align: center; color: #6739B7;'>Spending by Folder (Bar Chart)</h3>", unsafe_allow_html=True)
         
         # Create a bar chart
-        spending_bar = px.bar(
-            spending_by_folder.sort_values('amount', ascending=False), 
-            x='folder', 
-            y='amount',
-            title='Spending by Folder',
-            labels={'amount': 'Amount (₹)', 'folder': 'Folder'},
-            color='amount',
-            color_continuous_scale='Viridis',
-            text='amount'
-        )
+        def build_bar():
+            spending_bar = px.bar(
+                spending_by_folder.sort_values('amount', ascending=False), 
+                x='folder', 
+                y='amount',
+                title='Spending by Folder',
+                labels={'amount': 'Amount (₹)', 'folder': 'Folder'},
+                color='amount',
+                color_continuous_scale='Viridis',
+                text='amount'
+            )
         
-        # Customize the bar chart
-        spending_bar.update_traces(
-            texttemplate='₹%{text:.2f}',
-            textposition='outside'
-        )
+            # Customize the bar chart
+            spending_bar.update_traces(
+                texttemplate='₹%{text:.2f}',
+                textposition='outside'
+            )
         
-        # Set the theme and layout
-        spending_bar.update_layout(
-            xaxis_title='Folder',
-            yaxis_title='Amount (₹)',
-            height=500,
-            margin=dict(t=60, b=120, l=40, r=40),
-        )
+            # Set the theme and layout
+            spending_bar.update_layout(
+                xaxis_title='Folder',
+                yaxis_title='Amount (₹)',
+                height=500,
+                margin=dict(t=60, b=120, l=40, r=40),
+            )
+        
+            return spending_bar
+        spending_bar = cached_figure('bar', chart_filters, build_bar)
         
         # Display the bar chart
         st.plotly_chart(spending_bar, use_container_width=True)
     
-    with tab3:
+    elif analytics_view == "📉 Trend":
+        st.markdown("<h3 style='text-align: center; color: #6739B7;'>Spending Over Time</h3>", unsafe_allow_html=True)
+        
+        # Downsampled on the server: per day, week or month depending on the range
+        trend = st.session_state.analytics.get_spending_trend(date_range=date_range, any_tags=analytics_tags or None)
+        
+        if trend['trend'].empty:
+            st.info("No transaction data available for this period.")
+        else:
+            def build_trend():
+                spending_line = px.line(
+                    trend['trend'],
+                    x='date',
+                    y='amount',
+                    title=f"Spending per {trend['resolution']} (all folders)",
+                    labels={'amount': 'Amount (₹)', 'date': 'Date'},
+                    markers=len(trend['trend']) <= 60,
+                    # WebGL keeps long series responsive in the browser
+                    render_mode='webgl' if len(trend['trend']) > WEBGL_MIN_POINTS else 'svg'
+                )
+                spending_line.update_traces(line_color='#6739B7')
+                spending_line.update_layout(
+                    xaxis_title='Date',
+                    yaxis_title='Amount (₹)',
+                    height=450,
+                    margin=dict(t=60, b=40, l=40, r=40),
+                )
+                return spending_line
+            spending_line = cached_figure('trend', chart_filters, build_trend)
+            st.plotly_chart(spending_line, use_container_width=True)
+    
+    elif analytics_view == "🗓️ When":
+        st.markdown("<h3 style='text-align: center; color: #6739B7;'>When You Spend</h3>", unsafe_allow_html=True)
+        
+        heatmap_folder = st.selectbox("Folder:", ["All selected folders"] + selected_folders, key="heatmap_folder")
+        heatmap_folders = selected_folders if heatmap_folder == "All selected folders" else [heatmap_folder]
+        heatmap = st.session_state.analytics.get_spending_heatmap(heatmap_folders, date_range)
+        
+        if heatmap.to_numpy().sum() == 0:
+            st.info("No transaction data available for the selected folders.")
+        else:
+            def build_heatmap():
+                spending_heatmap = px.imshow(
+                    heatmap,
+                    labels={'x': 'Hour of day', 'y': 'Day', 'color': 'Amount (₹)'},
+                    color_continuous_scale='Purples',
+                    aspect='auto'
+                )
+                spending_heatmap.update_traces(hovertemplate='%{y} %{x}:00<br>₹%{z:.2f}<extra></extra>')
+                spending_heatmap.update_layout(
+                    xaxis=dict(tickmode='linear', dtick=2),
+                    height=400,
+                    margin=dict(t=20, b=40, l=40, r=40),
+                )
+                return spending_heatmap
+            spending_heatmap = cached_figure(('heatmap', heatmap_folder), chart_filters, build_heatmap)
+            st.plotly_chart(spending_heatmap, use_container_width=True)
+    
+    elif analytics_view == "⚖️ Compare":
+        st.markdown("<h3 style='text-align: center; color: #6739B7;'>Month Comparison</h3>", unsafe_allow_html=True)
+        
+        # Compare the last month of the selected period (the current month for all time)
+        compare_month = months[-1] if months else None
+        compare_by = st.segmented_control(
+            "Compare by:",
+            ["Folder", "Merchant"],
+            default="Folder",
+            key="compare_by"
+        ) or "Folder"
+        by = compare_by.lower()
+        comparison = st.session_state.analytics.get_spending_comparison(by, selected_folders, compare_month)
+        
+        if comparison.empty:
+            st.info("No spending to compare for the selected folders.")
+        else:
+            st.caption("This month against last month (MoM) and the same month last year (YoY)")
+            st.dataframe(
+                comparison.rename(columns={
+                    by: compare_by,
+                    'this_month': 'This month (₹)',
+                    'last_month': 'Last month (₹)',
+                    'mom_change': 'MoM change (₹)',
+                    'mom_percent': 'MoM %',
+                    'last_year': 'Last year (₹)',
+                    'yoy_change': 'YoY change (₹)',
+                    'yoy_percent': 'YoY %'
+                }).style.format({
+                    'This month (₹)': '₹{:.2f}',
+                    'Last month (₹)': '₹{:.2f}',
+                    'MoM change (₹)': '{:+.2f}',
+                    'MoM %': '{:+.1f}%',
+                    'Last year (₹)': '₹{:.2f}',
+                    'YoY change (₹)': '{:+.2f}',
+                    'YoY %': '{:+.1f}%'
+                }, na_rep='—'),
+                use_container_width=True,
+                hide_index=True
+            )
+    
+    else:
         st.markdown("<h3 style='text-align: center; color: #6739B7;'>Detailed Spending Analysis</h3>", unsafe_allow_html=True)
         
-        # Get transactions for selected folders
-        transactions = pd.DataFrame()
-        for folder in selected_folders:
-            folder_transactions = st.session_state.analytics.get_folder_transactions(folder)
-            transactions = pd.concat([transactions, folder_transactions], ignore_index=True)
+        # Spending per folder and merchant, sliced from the spending cube
+        merchant_spending = st.session_state.analytics.get_spending_slice(
+            ('folder', 'merchant'),
+            folders=selected_folders,
+            months=months
+        )
         
-        if not transactions.empty:
-            # Sort by date (newest first)
-            transactions['timestamp'] = pd.to_datetime(transactions['timestamp'])
-            transactions = transactions.sort_values('timestamp', ascending=False)
-            
-            # Format amounts
-            transactions['formatted_amount'] = transactions['amount'].apply(lambda x: f"₹{x:.2f}")
-            transactions['formatted_date'] = transactions['timestamp'].dt.strftime('%d %b %Y, %I:%M %p')
-            
-            # Group transactions by folder and merchant
-            merchant_spending = transactions.groupby(['folder', 'merchant'])['amount'].sum().reset_index()
+        if not merchant_spending.empty:
             merchant_spending = merchant_spending.sort_values(['folder', 'amount'], ascending=[True, False])
             
             # Display top merchants per folder
@@ -1368,29 +1834,33 @@ def show_spending_analytics():
                     """, unsafe_allow_html=True)
                     
                     # Create a horizontal bar chart for merchants
-                    merchant_bar = px.bar(
-                        folder_merchants.head(5),
-                        x='amount',
-                        y='merchant',
-                        orientation='h',
-                        labels={'amount': 'Amount (₹)', 'merchant': 'Merchant'},
-                        color='amount',
-                        color_continuous_scale='Viridis',
-                        text='amount'
-                    )
+                    def build_merchant_bar():
+                        merchant_bar = px.bar(
+                            folder_merchants.head(5),
+                            x='amount',
+                            y='merchant',
+                            orientation='h',
+                            labels={'amount': 'Amount (₹)', 'merchant': 'Merchant'},
+                            color='amount',
+                            color_continuous_scale='Viridis',
+                            text='amount'
+                        )
                     
-                    # Customize the merchant bar chart
-                    merchant_bar.update_traces(
-                        texttemplate='₹%{text:.2f}',
-                        textposition='outside'
-                    )
+                        # Customize the merchant bar chart
+                        merchant_bar.update_traces(
+                            texttemplate='₹%{text:.2f}',
+                            textposition='outside'
+                        )
                     
-                    # Set the theme and layout
-                    merchant_bar.update_layout(
-                        height=300,
-                        margin=dict(t=20, b=20, l=20, r=20),
-                        yaxis=dict(autorange="reversed")
-                    )
+                        # Set the theme and layout
+                        merchant_bar.update_layout(
+                            height=300,
+                            margin=dict(t=20, b=20, l=20, r=20),
+                            yaxis=dict(autorange="reversed")
+                        )
+                    
+                        return merchant_bar
+                    merchant_bar = cached_figure(('merchants', folder), chart_filters, build_merchant_bar)
                     
                     # Display the merchant bar chart
                     st.plotly_chart(merchant_bar, use_container_width=True)
@@ -1413,8 +1883,7 @@ def show_notifications():
     tab1, tab2 = st.tabs(["📣 Notifications", "⚙️ SMS Settings"])
     
     with tab1:
-        # Get notifications
-        notifications = st.session_state.notification_manager.get_notifications()
+        show_notification_list()
     
     with tab2:
         st.markdown("""
@@ -1494,92 +1963,108 @@ def show_notifications():
                 </p>
             </div>
         """, unsafe_allow_html=True)
+
+@st.fragment
+def show_notification_list():
+    """Notification list
+
+    Marking notifications read reruns the whole page, so the unread count
+    in the navigation bar follows.
+    """
+    # Get notifications
+    notifications = st.session_state.notification_manager.get_notifications()
     
-    # Switch back to the Notifications tab
-    with tab1:
-        # Mark all as read button
-        if not notifications.empty:
-            if st.button("📖 Mark all as read", key="mark_all_read"):
-                st.session_state.notification_manager.mark_all_as_read()
-                st.success("All notifications marked as read!")
-                st.rerun()
-        
-        # Display notifications
-        if not notifications.empty:
-            # Format the timestamp
-            notifications['formatted_date'] = pd.to_datetime(notifications['timestamp']).dt.strftime('%d %b %Y, %I:%M %p')
-            
-            # Create a container for notifications
-            st.markdown("""
-                <div style="background-color: white; padding: 15px; border-radius: 10px; margin-top: 20px; box-shadow: 0 2px 5px rgba(0,0,0,0.1);">
-                    <h3 style="color: #6739B7; margin-bottom: 15px; text-align: center;">Your Notifications</h3>
-                </div>
-            """, unsafe_allow_html=True)
-        
-            # Display individual notifications
-            for i, notification in notifications.iterrows():
-                # Different styling based on notification type
-                if notification['type'] == 'limit_exceeded':
-                    icon = "⚠️"
-                    color = "#dc3545"  # Red
-                    bg_color = "#fff5f5"
-                    border = "4px solid #dc3545"
-                else:
-                    icon = "ℹ️"
-                    color = "#6739B7"  # PhonePe Purple
-                    bg_color = "#f9f9f9"
-                    border = "4px solid #6739B7"
-                
-                # Read/unread status
-                read_status = "Read" if notification['read'] else "Unread"
-                read_color = "#6c757d" if notification['read'] else "#28a745"
-                
-                with st.container():
-                    st.markdown(f"""
-                        <div style="border-left: {border}; padding: 15px; margin: 10px 0; background-color: {bg_color}; border-radius: 5px;">
-                            <div style="display: flex; justify-content: space-between; align-items: center;">
-                                <h4 style="margin: 0; color: {color};">{icon} {notification['type'].replace('_', ' ').title()}</h4>
-                                <p style="margin: 0; color: {read_color}; font-size: 14px;">{read_status}</p>
-                            </div>
-                            <p style="margin: 10px 0; color: #333; font-size: 16px;">{notification['message']}</p>
-                            <p style="margin: 5px 0 0; color: #666; font-size: 14px;">{notification['formatted_date']}</p>
-                        </div>
-                    """, unsafe_allow_html=True)
-                    
-                    # Mark as read button for unread notifications
-                    if not notification['read']:
-                        if st.button("Mark as read", key=f"read_{i}"):
-                            st.session_state.notification_manager.mark_as_read(i)
-                            st.success(f"Notification marked as read!")
-                            st.rerun()
-        else:
-            # No notifications
-            st.markdown("""
-                <div style="background-color: #f8f8f8; padding: 30px; border-radius: 10px; text-align: center; margin-top: 20px;">
-                    <h3 style="color: #6739B7; margin-bottom: 10px;">No Notifications</h3>
-                    <p>You don't have any notifications at the moment.</p>
-                    <p>You'll receive notifications here when you exceed your spending limits.</p>
-                </div>
-            """, unsafe_allow_html=True)
-        
-        # Simulated phone notification section
+    # Mark all as read button
+    if not notifications.empty:
+        if st.button("📖 Mark all as read", key="mark_all_read"):
+            st.session_state.notification_manager.mark_all_as_read()
+            st.rerun()
+
+    # Display notifications
+    if not notifications.empty:
+        # Format the timestamp
+        notifications['formatted_date'] = pd.to_datetime(notifications['timestamp']).dt.strftime('%d %b %Y, %I:%M %p')
+
+        # Create a container for notifications
         st.markdown("""
-            <div style="background-color: white; padding: 15px; border-radius: 10px; margin-top: 30px; box-shadow: 0 2px 5px rgba(0,0,0,0.1);">
-                <h3 style="color: #6739B7; margin-bottom: 15px; text-align: center;">Phone Notification Settings</h3>
+            <div style="background-color: white; padding: 15px; border-radius: 10px; margin-top: 20px; box-shadow: 0 2px 5px rgba(0,0,0,0.1);">
+                <h3 style="color: #6739B7; margin-bottom: 15px; text-align: center;">Your Notifications</h3>
             </div>
         """, unsafe_allow_html=True)
-        
-        # Phone notification settings
+
+        # Display individual notifications
+        for i, notification in notifications.iterrows():
+            # Different styling based on notification type
+            if notification['type'] == 'limit_exceeded':
+                icon = "⚠️"
+                color = "#dc3545"  # Red
+                bg_color = "#fff5f5"
+                border = "4px solid #dc3545"
+            elif notification['type'] == 'projected_overrun':
+                icon = "📈"
+                color = "#ffc107"  # Yellow
+                bg_color = "#fffbea"
+                border = "4px solid #ffc107"
+            elif notification['type'] == 'anomaly':
+                icon = "🔍"
+                color = "#fd7e14"  # Orange
+                bg_color = "#fff8f0"
+                border = "4px solid #fd7e14"
+            else:
+                icon = "ℹ️"
+                color = "#6739B7"  # PhonePe Purple
+                bg_color = "#f9f9f9"
+                border = "4px solid #6739B7"
+
+            # Read/unread status
+            read_status = "Read" if notification['read'] else "Unread"
+            read_color = "#6c757d" if notification['read'] else "#28a745"
+
+            with st.container():
+                st.markdown(f"""
+                    <div style="border-left: {border}; padding: 15px; margin: 10px 0; background-color: {bg_color}; border-radius: 5px;">
+                        <div style="display: flex; justify-content: space-between; align-items: center;">
+                            <h4 style="margin: 0; color: {color};">{icon} {notification['type'].replace('_', ' ').title()}</h4>
+                            <p style="margin: 0; color: {read_color}; font-size: 14px;">{read_status}</p>
+                        </div>
+                        <p style="margin: 10px 0; color: #333; font-size: 16px;">{notification['message']}</p>
+                        <p style="margin: 5px 0 0; color: #666; font-size: 14px;">{notification['formatted_date']}</p>
+                    </div>
+                """, unsafe_allow_html=True)
+
+                # Mark as read button for unread notifications
+                if not notification['read']:
+                    if st.button("Mark as read", key=f"read_{i}"):
+                        st.session_state.notification_manager.mark_as_read(i)
+                        st.rerun()
+    else:
+        # No notifications
         st.markdown("""
-            <div style="background-color: #f8f8f8; padding: 15px; border-radius: 10px; margin: 15px 0;">
-                <p style="margin: 0 0 10px 0; font-weight: bold;">You'll receive push notifications on your phone when:</p>
-                <ul style="margin: 0; padding-left: 20px;">
-                    <li>You exceed your folder spending limits</li>
-                    <li>A folder is nearing its spending limit (80% or higher)</li>
-                    <li>Your monthly spending patterns change significantly</li>
-                </ul>
+            <div style="background-color: #f8f8f8; padding: 30px; border-radius: 10px; text-align: center; margin-top: 20px;">
+                <h3 style="color: #6739B7; margin-bottom: 10px;">No Notifications</h3>
+                <p>You don't have any notifications at the moment.</p>
+                <p>You'll receive notifications here when you exceed your spending limits.</p>
             </div>
         """, unsafe_allow_html=True)
 
+    # Simulated phone notification section
+    st.markdown("""
+        <div style="background-color: white; padding: 15px; border-radius: 10px; margin-top: 30px; box-shadow: 0 2px 5px rgba(0,0,0,0.1);">
+            <h3 style="color: #6739B7; margin-bottom: 15px; text-align: center;">Phone Notification Settings</h3>
+        </div>
+    """, unsafe_allow_html=True)
+
+    # Phone notification settings
+    st.markdown("""
+        <div style="background-color: #f8f8f8; padding: 15px; border-radius: 10px; margin: 15px 0;">
+            <p style="margin: 0 0 10px 0; font-weight: bold;">You'll receive push notifications on your phone when:</p>
+            <ul style="margin: 0; padding-left: 20px;">
+                <li>You exceed your folder spending limits</li>
+                <li>A folder is nearing its spending limit (80% or higher)</li>
+                <li>Your monthly spending patterns change significantly</li>
+            </ul>
+        </div>
+    """, unsafe_allow_html=True)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
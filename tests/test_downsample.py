@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+from utils.downsample import (
+    DAILY_MAX_DAYS, TREND_MAX_POINTS, WEBGL_MIN_POINTS, WEEKLY_MAX_DAYS,
+    choose_resolution, downsample_trend, lttb
+)
+
+
+def daily_trend(days, start='2020-01-01'):
+    dates = pd.date_range(start, periods=days, freq='D')
+    amounts = np.random.default_rng(0).uniform(10, 500, days)
+    return pd.DataFrame({'date': dates.date, 'amount': amounts})
+
+
+def test_resolution_follows_the_range():
+    assert choose_resolution('2024-01-01', '2024-03-01') == 'day'
+    assert choose_resolution('2020-01-01', '2021-12-31') == 'day'
+    assert choose_resolution('2020-01-01', '2024-12-31') == 'week'
+    assert choose_resolution('2000-01-01', '2024-12-31') == 'month'
+
+
+def test_long_daily_series_reach_webgl():
+    trend, resolution = downsample_trend(daily_trend(DAILY_MAX_DAYS + 1))
+    assert resolution == 'day'
+    assert WEBGL_MIN_POINTS < len(trend) <= TREND_MAX_POINTS
+
+
+def test_weekly_series_stay_bounded():
+    daily = daily_trend(WEEKLY_MAX_DAYS + 1)
+    trend, resolution = downsample_trend(daily)
+    assert resolution == 'week'
+    assert len(trend) <= TREND_MAX_POINTS
+    assert np.isclose(trend['amount'].sum(), daily['amount'].sum())
+
+
+def test_monthly_series_sum_to_the_daily_ones():
+    daily = daily_trend(WEEKLY_MAX_DAYS + 400)
+    trend, resolution = downsample_trend(daily)
+    assert resolution == 'month'
+    assert np.isclose(trend['amount'].sum(), daily['amount'].sum())
+
+
+def test_lttb_keeps_the_ends_and_the_peak():
+    y = np.zeros(1000)
+    y[437] = 100.0
+    kept = lttb(np.arange(1000), y, 50)
+    assert len(kept) == 50
+    assert kept[0] == 0 and kept[-1] == 999
+    assert 437 in kept
+    assert np.all(np.diff(kept) > 0)
+
+
+def test_lttb_caps_a_series_longer_than_max_points():
+    trend, _ = downsample_trend(daily_trend(DAILY_MAX_DAYS + 1), max_points=WEBGL_MIN_POINTS)
+    assert len(trend) == WEBGL_MIN_POINTS
@@ -1,44 +1,122 @@
 import pandas as pd
-import os
-from datetime import datetime
+import numpy as np
 import calendar
-from datetime import date
+from datetime import date, timedelta
+from utils.ledger import get_ledger
+from utils.binary_store import get_binary_store, STORAGE_MODE, DELETED
+from utils.splits import allocate, parse_splits
+from utils.budget_periods import period_bounds, DEFAULT_PERIOD
+from utils.rollups import ROLLING_WINDOWS
+from utils.memo import MemoCache, memoized
+from utils.downsample import downsample_trend, TREND_MAX_POINTS
+from utils.backtest import summarize_backtest
+from utils.powerbi_export import PowerBIExport, date_key
+
+MICROS_PER_DAY = 86400 * 1000 * 1000
+MICROS_PER_HOUR = 3600 * 1000 * 1000
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
 
 class Analytics:
     def __init__(self):
         self.transactions_file = "data/transactions.csv"
+        self.patches_file = "data/transaction_patches.csv"
+        self.snapshot_file = "data/snapshots/transactions.feather"
+        self.ledger = get_ledger(self.transactions_file, self.patches_file, self.snapshot_file)
+        self.binary_store = get_binary_store() if STORAGE_MODE == 'binary' else None
+        # Results of the heavier queries (and rendered figures), per data version
+        self.memo = MemoCache()
+    
+    def data_version(self):
+        """Get a key that changes whenever the transactions, the folders
+        (names, tree or limits) or the date do"""
+        folders = self.ledger.folder_manager.version()
+        # The binary store changes with every write, and unlike the ledger
+        # it can tell so without reading the logs
+        if self.binary_store is not None:
+            return repr(self.binary_store.version()), folders, date.today()
+        self.ledger.sync()
+        return repr(self.ledger.data_version()), folders, date.today()
+    
+    def get_numeric_columns(self):
+        """Get zero-copy NumPy views over the binary transaction store
+        
+        Returns:
+            dict of timestamp (epoch µs), amount_paise, folder_id and
+            merchant_id arrays, or None when binary storage is off
+        """
+        if self.binary_store is None:
+            return None
+        return self.binary_store.columns()
     
-    def get_folder_transactions(self, folder=None):
-        """Get all transactions for a specific folder or all folders"""
+    def _filter_by_tags(self, transactions, all_tags=None, any_tags=None):
+        """Keep the transactions matching a tag query, resolved on the tag bitmaps"""
+        if not all_tags and not any_tags:
+            return transactions
+        ids = self.ledger.tagged_ids(all_tags, any_tags)
+        return transactions[transactions['id'].isin(ids)]
+    
+    def get_tags(self):
+        """Get every tag in use"""
+        return self.ledger.all_tags()
+    
+    def get_folder_transactions(self, folder=None, all_tags=None, any_tags=None, date_range=None):
+        """Get all transactions for a specific folder or all folders
+        
+        Args:
+            folder: Folder name (None or 'All Folders' for every folder)
+            all_tags: Only transactions with every one of these tags
+            any_tags: Only transactions with at least one of these tags
+            date_range: Optional tuple of (start_date, end_date)
+        
+        Returns:
+            DataFrame of transactions. For a single folder this includes split
+            transactions with an allocation to it, and a `folder_amount`
+            column with the part of each amount allocated to the folder.
+        """
         try:
-            transactions = pd.read_csv(self.transactions_file)
+            # Merged view of the transaction log and its patches, already typed
+            transactions = self.ledger.frame()
             if transactions.empty:
-                return pd.DataFrame(columns=['folder', 'merchant', 'amount', 'timestamp', 'notes'])
-                
-            # Convert timestamp to datetime
-            transactions['timestamp'] = pd.to_datetime(transactions['timestamp'])
+                return pd.DataFrame(columns=['folder', 'merchant', 'amount', 'timestamp', 'notes', 'tags', 'folder_amount'])
+            
+            transactions = self._filter_by_tags(transactions, all_tags, any_tags)
+            if date_range:
+                dates = transactions['timestamp'].dt.date
+                transactions = transactions[(dates >= date_range[0]) & (dates <= date_range[1])]
             
             # Sort by newest first
             transactions = transactions.sort_values('timestamp', ascending=False)
             
             if folder and folder != 'All Folders':
-                return transactions[transactions['folder'] == folder]
+                folder_id = self.ledger.folder_manager.get_folder_id(folder)
+                allocations = allocate(transactions)
+                allocations = allocations[allocations['folder_id'] == folder_id]
+                folder_amount = allocations.groupby('id')['amount'].sum()
+                transactions = transactions[transactions['id'].isin(folder_amount.index)].copy()
+                transactions['folder_amount'] = transactions['id'].map(folder_amount)
+                return transactions
             return transactions
         except Exception as e:
             print(f"Error getting folder transactions: {str(e)}")
-            return pd.DataFrame(columns=['folder', 'merchant', 'amount', 'timestamp', 'notes'])
+            return pd.DataFrame(columns=['folder', 'merchant', 'amount', 'timestamp', 'notes', 'tags', 'folder_amount'])
     
-    def generate_analytics(self, date_range=None):
+    @memoized
+    def generate_analytics(self, date_range=None, all_tags=None, any_tags=None):
         """Generate analytics for the given date range
         
         Args:
             date_range: Optional tuple of (start_date, end_date). If None, uses all data.
+            all_tags: Only count transactions with every one of these tags
+            any_tags: Only count transactions with at least one of these tags
         
         Returns:
             dict with spending data by folder and spending trends
         """
+        # The binary records carry no tags, so tag queries use the ledger
+        if self.binary_store is not None and not all_tags and not any_tags:
+            return self._generate_analytics_binary(date_range)
         try:
-            transactions = pd.read_csv(self.transactions_file)
+            transactions = self._filter_by_tags(self.ledger.frame(), all_tags, any_tags)
             if transactions.empty:
                 return {
                     'spending_by_folder': pd.DataFrame(columns=['folder', 'amount', 'percentage']),
@@ -46,7 +124,6 @@ class Analytics:
                     'total_spending': 0.0
                 }
                 
-            transactions['timestamp'] = pd.to_datetime(transactions['timestamp'])
             transactions['date'] = transactions['timestamp'].dt.date
             
             # Filter by date range if provided
@@ -59,8 +136,12 @@ class Analytics:
             # Calculate total spending
             total_spending = filtered_transactions['amount'].sum()
             
-            # Spending by folder
-            spending_by_folder = filtered_transactions.groupby('folder')['amount'].sum().reset_index()
+            # Spending by folder, counting each part of a split transaction
+            # towards the folder it is allocated to
+            allocations = allocate(filtered_transactions)
+            by_folder = allocations.groupby('folder_id')['amount'].agg(['sum', 'size'])
+            folder_names = self.ledger.folder_manager.decode(by_folder.index)
+            spending_by_folder = pd.DataFrame({'folder': folder_names, 'amount': by_folder['sum'].to_numpy()})
             
             # Add percentage column
             if total_spending > 0:
@@ -82,7 +163,7 @@ class Analytics:
                 daily_avg = 0
                 
             # Folder count by transaction volume
-            folder_count = filtered_transactions.groupby('folder').size().reset_index(name='count')
+            folder_count = pd.DataFrame({'folder': folder_names, 'count': by_folder['size'].to_numpy()})
             folder_count = folder_count.sort_values('count', ascending=False)
             
             return {
@@ -102,6 +183,248 @@ class Analytics:
                 'folder_count': pd.DataFrame(columns=['folder', 'count'])
             }
     
+    @memoized
+    def get_spending_trend(self, date_range=None, all_tags=None, any_tags=None, max_points=TREND_MAX_POINTS):
+        """Get the spending trend at a resolution suited to its length
+        
+        Up to two years are shown per day, up to ten years per week and
+        longer histories per month; if that is still more than `max_points`
+        points, LTTB downsampling keeps the ones that shape the line.
+        
+        Args:
+            date_range: Optional tuple of (start_date, end_date)
+            all_tags: Only count transactions with every one of these tags
+            any_tags: Only count transactions with at least one of these tags
+            max_points: Most points to return
+            
+        Returns:
+            dict: 'trend' DataFrame with date and amount columns, and the
+            'resolution' used ('day', 'week' or 'month')
+        """
+        trend = self.generate_analytics(date_range=date_range, all_tags=all_tags, any_tags=any_tags)['spending_trend']
+        trend, resolution = downsample_trend(trend, max_points)
+        return {'trend': trend, 'resolution': resolution}
+    
+    @memoized
+    def get_spending_heatmap(self, folders=None, date_range=None):
+        """Get spending by day of the week and hour of the day
+        
+        Timestamps are binned as integers (hours since the epoch) with one
+        bincount into the 7 x 24 cells, so no dates are built per row.
+        
+        Args:
+            folders: Only these folder names, counting the parts of split
+                payments allocated to them (None for all folders)
+            date_range: Optional tuple of (start_date, end_date)
+            
+        Returns:
+            DataFrame: One row per weekday (Monday first), one column per hour
+        """
+        try:
+            allocations = self.ledger.allocations()
+            if folders is not None:
+                folder_ids = [self.ledger.folder_manager.get_folder_id(folder) for folder in folders]
+                allocations = allocations[allocations['folder_id'].isin(folder_ids)]
+            micros = allocations['timestamp'].to_numpy(dtype='datetime64[us]').astype(np.int64)
+            amounts = allocations['amount'].to_numpy(dtype=float)
+            if date_range:
+                start = np.datetime64(date_range[0], 'D').astype(np.int64) * MICROS_PER_DAY
+                end = (np.datetime64(date_range[1], 'D').astype(np.int64) + 1) * MICROS_PER_DAY
+                mask = (micros >= start) & (micros < end)
+                micros, amounts = micros[mask], amounts[mask]
+            hours = micros // MICROS_PER_HOUR
+            # 1 January 1970 was a Thursday, i.e. weekday 3 counting from Monday
+            weekday = (hours // 24 + 3) % 7
+            cells = np.bincount(weekday * 24 + hours % 24, weights=amounts, minlength=7 * 24)
+            return pd.DataFrame(cells.reshape(7, 24), index=WEEKDAYS, columns=range(24))
+        except Exception as e:
+            print(f"Error calculating spending heatmap: {str(e)}")
+            return pd.DataFrame(np.zeros((7, 24)), index=WEEKDAYS, columns=range(24))
+    
+    def get_period_months(self, time_period, today=None):
+        """Get the calendar months an Analytics page time period covers
+        
+        Args:
+            time_period: 'All Time', 'Current Month', 'Last Month' or 'Last 3 Months'
+            today: Day the period is relative to (defaults to today)
+            
+        Returns:
+            tuple: ('YYYY-MM' months, (start date, end date)), or (None, None)
+            for all time
+        """
+        today = today or date.today()
+        counts = {'Current Month': (0, 1), 'Last Month': (1, 1), 'Last 3 Months': (0, 3)}
+        if time_period not in counts:
+            return None, None
+        skip, count = counts[time_period]
+        end = today.replace(day=1)
+        for _ in range(skip):
+            end = (end - timedelta(days=1)).replace(day=1)
+        start = end
+        for _ in range(count - 1):
+            start = (start - timedelta(days=1)).replace(day=1)
+        last_day = end.replace(day=calendar.monthrange(end.year, end.month)[1])
+        months = [str(month) for month in pd.period_range(start, end, freq='M')]
+        return months, (start, last_day)
+    
+    @memoized
+    def get_spending_slice(self, by=('folder',), folders=None, months=None):
+        """Get spending summed from the folder x month x merchant cube
+        
+        Args:
+            by: Dimensions to group by, from 'folder', 'month' and 'merchant'
+            folders: Only these folder names (None for all folders)
+            months: Only these 'YYYY-MM' months (None for all time)
+            
+        Returns:
+            DataFrame: The `by` columns (folder and merchant as names) plus
+            amount and count
+        """
+        columns = list(by) + ['amount', 'count']
+        try:
+            folder_ids = None
+            if folders is not None:
+                folder_ids = [self.ledger.folder_manager.get_folder_id(folder) for folder in folders]
+                folder_ids = sorted(folder_id for folder_id in folder_ids if folder_id is not None)
+            cube_by = [f"{dimension}_id" if dimension != 'month' else dimension for dimension in by]
+            spending = self.ledger.cube_slice(cube_by, folder_ids, months)
+            if 'folder' in by:
+                spending['folder_id'] = self.ledger.folder_manager.decode(spending['folder_id'])
+            if 'merchant' in by:
+                spending['merchant_id'] = self.ledger.merchant_registry.decode(spending['merchant_id'])
+            spending.columns = columns
+            return spending
+        except Exception as e:
+            print(f"Error slicing spending: {str(e)}")
+            return pd.DataFrame(columns=columns)
+    
+    @memoized
+    def get_spending_comparison(self, by='folder', folders=None, month=None, today=None):
+        """Compare a month's spending with the month before and the same month
+        a year earlier, summed from the spending cube's monthly cells
+        
+        Args:
+            by: 'folder' or 'merchant'
+            folders: Only these folder names (None for all folders)
+            month: 'YYYY-MM' month to compare (defaults to the current month)
+            today: Day the current month is taken from (defaults to today)
+            
+        Returns:
+            DataFrame: by column plus this_month, last_month, mom_change,
+            mom_percent, last_year, yoy_change and yoy_percent (the percents
+            are NaN where there was nothing to compare with), largest first
+        """
+        columns = [by, 'this_month', 'last_month', 'mom_change', 'mom_percent',
+                   'last_year', 'yoy_change', 'yoy_percent']
+        try:
+            current = pd.Period(month or (today or date.today()), freq='M')
+            periods = {'this_month': current, 'last_month': current - 1, 'last_year': current - 12}
+            spending = self.get_spending_slice((by, 'month'), folders, [str(period) for period in periods.values()])
+            comparison = spending.pivot_table(index=by, columns='month', values='amount', aggfunc='sum', fill_value=0.0)
+            comparison = comparison.reindex(columns=[str(period) for period in periods.values()], fill_value=0.0)
+            comparison.columns = list(periods)
+            for prefix, baseline in (('mom', 'last_month'), ('yoy', 'last_year')):
+                comparison[f'{prefix}_change'] = comparison['this_month'] - comparison[baseline]
+                comparison[f'{prefix}_percent'] = comparison[f'{prefix}_change'] / comparison[baseline].where(comparison[baseline] > 0) * 100
+            comparison = comparison.reset_index().sort_values(['this_month', 'last_month'], ascending=False)
+            return comparison[columns].reset_index(drop=True)
+        except Exception as e:
+            print(f"Error comparing spending: {str(e)}")
+            return pd.DataFrame(columns=columns)
+    
+    @memoized
+    def get_spending_by_folder(self, months=None):
+        """Get each folder's spending and share of the total from the cube
+        
+        Args:
+            months: Only these 'YYYY-MM' months (None for all time)
+            
+        Returns:
+            DataFrame: folder, amount and percentage columns, largest first
+        """
+        spending = self.get_spending_slice(('folder',), months=months)
+        total_spending = spending['amount'].sum()
+        spending['percentage'] = spending['amount'] / total_spending * 100 if total_spending > 0 else 0
+        return spending[['folder', 'amount', 'percentage']].sort_values('amount', ascending=False)
+    
+    def _generate_analytics_binary(self, date_range=None):
+        """generate_analytics() computed straight off the memory-mapped records"""
+        try:
+            columns = self.binary_store.columns()
+            folder_ids = columns['folder_id']
+            days = columns['timestamp'] // MICROS_PER_DAY
+            
+            mask = folder_ids != DELETED
+            if date_range:
+                start = np.datetime64(date_range[0], 'D').astype(np.int64)
+                end = np.datetime64(date_range[1], 'D').astype(np.int64)
+                mask &= (days >= start) & (days <= end)
+            
+            folder_ids = folder_ids[mask]
+            amounts = columns['amount_paise'][mask] / 100.0
+            days = days[mask]
+            total_spending = float(amounts.sum())
+            
+            # Spending and transaction count by folder
+            size = int(folder_ids.max()) + 1 if len(folder_ids) else 0
+            split_fields = self.binary_store.split_fields()
+            split_rows = self.binary_store.rows(split_fields)
+            splits = [parse_splits(field) for field in split_fields.values()]
+            for allocations in splits:
+                size = max([size] + [folder_id + 1 for folder_id, _ in allocations])
+            totals = np.bincount(folder_ids, weights=amounts, minlength=size)
+            counts = np.bincount(folder_ids, minlength=size)
+            
+            # The records only know a split transaction's own folder, so move
+            # the allocated parts over using the (few) split transactions
+            for row, allocations in zip(split_rows, splits):
+                home = columns['folder_id'][row] if row >= 0 else DELETED
+                day = columns['timestamp'][row] // MICROS_PER_DAY
+                if home == DELETED or (date_range and not (start <= day <= end)):
+                    continue
+                for folder_id, amount in allocations:
+                    totals[home] -= amount
+                    totals[folder_id] += amount
+                    counts[folder_id] += 1
+            used = np.flatnonzero(counts)
+            folder_names = self.ledger.folder_manager.decode(used)
+            spending_by_folder = pd.DataFrame({'folder': folder_names, 'amount': totals[used]})
+            if total_spending > 0:
+                spending_by_folder['percentage'] = (spending_by_folder['amount'] / total_spending) * 100
+            else:
+                spending_by_folder['percentage'] = 0
+            spending_by_folder = spending_by_folder.sort_values('amount', ascending=False)
+            
+            # Spending trend over time
+            unique_days, day_index = np.unique(days, return_inverse=True)
+            spending_trend = pd.DataFrame({
+                'date': (unique_days.astype('datetime64[D]')).astype(object),
+                'amount': np.bincount(day_index, weights=amounts, minlength=len(unique_days))
+            })
+            
+            daily_avg = total_spending / len(spending_trend) if len(spending_trend) > 0 else 0
+            
+            folder_count = pd.DataFrame({'folder': folder_names, 'count': counts[used]})
+            folder_count = folder_count.sort_values('count', ascending=False)
+            
+            return {
+                'spending_by_folder': spending_by_folder,
+                'spending_trend': spending_trend,
+                'total_spending': total_spending,
+                'daily_avg': daily_avg,
+                'folder_count': folder_count
+            }
+        except Exception as e:
+            print(f"Error generating analytics: {str(e)}")
+            return {
+                'spending_by_folder': pd.DataFrame(columns=['folder', 'amount', 'percentage']),
+                'spending_trend': pd.DataFrame(columns=['date', 'amount']),
+                'total_spending': 0.0,
+                'daily_avg': 0.0,
+                'folder_count': pd.DataFrame(columns=['folder', 'count'])
+            }
+    
+    @memoized
     def get_current_month_spending(self, folder=None):
         """Get spending for the current month for a specific folder or all folders
         
@@ -112,35 +435,17 @@ class Analytics:
             dict: Spending data with total amount and percentage of limit
         """
         try:
-            # Get current month's first and last day
             today = date.today()
-            _, last_day = calendar.monthrange(today.year, today.month)
-            first_day = date(today.year, today.month, 1)
-            last_day = date(today.year, today.month, last_day)
-            
-            # Get transactions
-            all_transactions = self.get_folder_transactions()
-            if all_transactions.empty:
-                return {
-                    'amount': 0.0,
-                    'limit': 0.0,
-                    'percentage': 0.0,
-                    'over_limit': False
-                }
-                
-            # Add date column for filtering
-            all_transactions['date'] = all_transactions['timestamp'].dt.date
-            
-            # Filter by date range (current month)
-            current_month = all_transactions[(all_transactions['date'] >= first_day) & 
-                                            (all_transactions['date'] <= last_day)]
             
-            # Filter by folder if specified
+            # Monthly rollups are kept up to date as transactions are added,
+            # edited or deleted, so this is a lookup rather than a scan. A
+            # folder's total includes its sub-folders.
+            rollups = self.ledger.tree_rollups()
             if folder and folder != 'All Folders':
-                current_month = current_month[current_month['folder'] == folder]
-                
-            # Calculate total spending
-            total_spending = current_month['amount'].sum() if not current_month.empty else 0.0
+                folder_id = self.ledger.folder_manager.get_folder_id(folder)
+                total_spending = rollups.subtree_month_total(today.year, today.month, folder_id) if folder_id is not None else 0.0
+            else:
+                total_spending = rollups.month_total(today.year, today.month)
             
             # Return spending data
             return {
@@ -154,6 +459,184 @@ class Analytics:
                 'period': f"{date.today().strftime('%B %Y')}"
             }
             
+    def get_period_spending(self, folder=None, period='monthly', today=None):
+        """Get spending in the budget period containing a day
+        
+        Args:
+            folder: Folder name, including its sub-folders (None for all folders)
+            period: 'monthly', 'weekly', 'fortnightly' or 'days:N'
+            today: Day whose period to use (defaults to today)
+            
+        Returns:
+            dict: Spending amount, the period label and its start and end dates
+        """
+        start, end, label = period_bounds(period, today)
+        try:
+            # A range query on the per-folder daily index, not a scan
+            rollups = self.ledger.tree_rollups()
+            if folder and folder != 'All Folders':
+                folder_id = self.ledger.folder_manager.get_folder_id(folder)
+                amount = rollups.range_total(start, end, folder_id) if folder_id is not None else 0.0
+            else:
+                amount = rollups.range_total(start, end)
+            return {'amount': amount, 'period': label, 'start': start, 'end': end}
+        except Exception as e:
+            print(f"Error calculating spending: {str(e)}")
+            return {'amount': 0.0, 'period': label, 'start': start, 'end': end}
+    
+    @memoized
+    def get_rolling_spending(self, today=None):
+        """Get spending over the last 7, 30 and 90 days
+        
+        The windows slide forward incrementally as days pass and as
+        transactions are added, instead of regrouping the whole history.
+        
+        Returns:
+            dict: 'overall' maps window length -> amount; 'by_folder' is a
+            DataFrame with a folder column and one column per window
+        """
+        try:
+            rolling = self.ledger.rolling_spend(today)
+            names = self.ledger.folder_manager.get_folder_names()
+            by_folder = pd.DataFrame({
+                'folder': list(names.values()),
+                **{f"{window} days": [rolling.get((folder_id, window), 0.0) for folder_id in names]
+                   for window in ROLLING_WINDOWS}
+            })
+            return {
+                'overall': {window: rolling.get((None, window), 0.0) for window in ROLLING_WINDOWS},
+                'by_folder': by_folder
+            }
+        except Exception as e:
+            print(f"Error calculating rolling spending: {str(e)}")
+            return {
+                'overall': {window: 0.0 for window in ROLLING_WINDOWS},
+                'by_folder': pd.DataFrame(columns=['folder'] + [f"{window} days" for window in ROLLING_WINDOWS])
+            }
+    
+    @memoized
+    def get_spending_pace(self, folder=None, period='monthly', today=None):
+        """Compare spending so far this period with the same point last period
+        
+        Args:
+            folder: Folder name (None for all folders)
+            period: Budget period, as for get_period_spending()
+            today: Day to evaluate (defaults to today)
+            
+        Returns:
+            dict: current and previous amounts over the same number of days
+            into the period, and the change in percent (None if nothing was
+            spent by then last period)
+        """
+        today = today or date.today()
+        start, _, label = period_bounds(period, today)
+        elapsed = (today - start).days
+        previous_start = period_bounds(period, start - timedelta(days=1))[0]
+        previous_end = min(previous_start + timedelta(days=elapsed), start - timedelta(days=1))
+        try:
+            rollups = self.ledger.tree_rollups()
+            folder_id = None
+            if folder and folder != 'All Folders':
+                folder_id = self.ledger.folder_manager.get_folder_id(folder)
+                if folder_id is None:
+                    return {'current': 0.0, 'previous': 0.0, 'change': None, 'period': label}
+            current = rollups.range_total(start, today, folder_id)
+            previous = rollups.range_total(previous_start, previous_end, folder_id)
+            change = (current - previous) / previous * 100 if previous > 0 else None
+            return {'current': current, 'previous': previous, 'change': change, 'period': label}
+        except Exception as e:
+            print(f"Error calculating spending pace: {str(e)}")
+            return {'current': 0.0, 'previous': 0.0, 'change': None, 'period': label}
+    
+    @memoized
+    def get_amount_distribution(self, by='folder', month=None):
+        """Get typical payment sizes per folder or per merchant
+        
+        The quantiles come from sketches kept up to date as transactions are
+        written, so no transactions are sorted here. They are approximate,
+        within about 1% of rank.
+        
+        Args:
+            by: 'folder' or 'merchant'
+            month: 'YYYY-MM' for one calendar month (None for all time)
+            
+        Returns:
+            DataFrame: folder or merchant, payments, median, p90 and p99
+            columns, and for folders the approximate number of merchants paid
+        """
+        columns = [by, 'payments', 'median', 'p90', 'p99'] + (['merchants'] if by == 'folder' else [])
+        try:
+            distribution = self.ledger.amount_distribution(f"{by}_id", month)
+            if by == 'folder':
+                names = self.ledger.folder_manager.get_folder_names()
+            else:
+                names = dict(enumerate(self.ledger.merchant_registry.get_merchant_names()))
+            rows = [{by: names.get(group_id, f"#{group_id}"), **summary} for group_id, summary in distribution.items()]
+            return pd.DataFrame(rows, columns=columns).sort_values('payments', ascending=False, ignore_index=True)
+        except Exception as e:
+            print(f"Error calculating payment sizes: {str(e)}")
+            return pd.DataFrame(columns=columns)
+    
+    @memoized
+    def get_month_end_forecast(self, today=None):
+        """Forecast every folder's spending by the end of the month
+        
+        All folders are forecast together from the daily rollups, so this is
+        cheap enough to run on every page load.
+        
+        Args:
+            today: Day to forecast from (defaults to today)
+            
+        Returns:
+            DataFrame: folder, spent, forecast, days_left and limit columns,
+            and projected_over, which is True for folders with a monthly
+            limit that are on course to exceed it
+        """
+        try:
+            forecast = self.ledger.month_end_forecast(today)
+            folders = self.ledger.folder_manager.get_folder_details().set_index('folder_id')
+            forecast['folder'] = folders['folder_name'].reindex(forecast.index)
+            monthly = folders['limit_period'].reindex(forecast.index).fillna(DEFAULT_PERIOD) == 'monthly'
+            forecast['limit'] = pd.to_numeric(folders['spending_limit'], errors='coerce').reindex(forecast.index).fillna(0.0)
+            forecast['projected_over'] = monthly & (forecast['limit'] > 0) & (forecast['forecast'] > forecast['limit'])
+            return forecast.reset_index(drop=True)[['folder', 'spent', 'forecast', 'days_left', 'limit', 'projected_over']]
+        except Exception as e:
+            print(f"Error forecasting spending: {str(e)}")
+            return pd.DataFrame(columns=['folder', 'spent', 'forecast', 'days_left', 'limit', 'projected_over'])
+    
+    @memoized
+    def backtest_limit(self, folder, limits, today=None):
+        """Check how often candidate monthly limits would have been exceeded
+        
+        Every past calendar month of the folder's spending (sub-folders
+        included, as for its limit) is replayed against all the candidates
+        in one pass over the daily rollups.
+        
+        Args:
+            folder: Folder name
+            limits: A candidate limit amount, or a list of them
+            today: Months before this day's month are replayed (defaults to today)
+            
+        Returns:
+            dict: 'summary' DataFrame (limit, months, breaches, breach_rate,
+            typical_breach_day) and 'months' DataFrame (limit, month, spent,
+            first_breach date or None)
+        """
+        if np.isscalar(limits):
+            limits = [limits]
+        try:
+            if self.ledger.folder_manager.get_folder_id(folder) is None:
+                raise ValueError(f"no folder named '{folder}'")
+            months = self.ledger.limit_backtest(folder, limits, today)
+            return {'summary': summarize_backtest(months), 'months': months}
+        except Exception as e:
+            print(f"Error backtesting limit: {str(e)}")
+            return {
+                'summary': pd.DataFrame(columns=['limit', 'months', 'breaches', 'breach_rate', 'typical_breach_day']),
+                'months': pd.DataFrame(columns=['limit', 'month', 'spent', 'first_breach'])
+            }
+    
+    @memoized
     def check_folder_limit(self, folder_name, folder_manager):
         """Check if a folder has exceeded its spending limit
         
@@ -178,8 +661,8 @@ class Analytics:
                     'over_limit': False
                 }
                 
-            # Get current month's spending
-            spending = self.get_current_month_spending(folder_name)
+            # Get spending in the folder's current budget period
+            spending = self.get_period_spending(folder_name, folder_manager.get_limit_period(folder_name))
             current_amount = spending['amount']
             
             # Calculate percentage of limit
@@ -205,28 +688,93 @@ class Analytics:
                 'period': f"{date.today().strftime('%B %Y')}"
             }
     
-    def export_for_powerbi(self):
-        """Export data in Power BI compatible format"""
-        try:
-            transactions = pd.read_csv(self.transactions_file)
-            
-            # Create separate dimension tables
-            folders = transactions[['folder']].drop_duplicates()
-            merchants = transactions[['merchant']].drop_duplicates()
+    def check_anomaly(self, transaction):
+        """Check whether a payment is unusually large for its folder or merchant
+        
+        Call this before adding the transaction, so it is compared with the
+        payments before it. Only running statistics are consulted.
+        
+        Args:
+            transaction: Dict with folder, merchant and amount
             
-            # Create fact table
-            facts = transactions[['folder', 'merchant', 'amount', 'timestamp', 'notes']]
+        Returns:
+            list: One dict per scope ('folder' or 'merchant') in which the
+            payment is anomalous (see AmountStats.score); empty if it is normal
+        """
+        try:
+            folder_id = self.ledger.folder_manager.get_folder_id(transaction['folder'])
+            merchant_id = self.ledger.merchant_registry.get_merchant_id(transaction['merchant'], create=False)
+            return self.ledger.score_amount(folder_id, merchant_id, transaction['amount'])
+        except Exception as e:
+            print(f"Error checking for anomalies: {str(e)}")
+            return []
+    
+    def check_folder_limits_upward(self, folder_name, folder_manager):
+        """Check the limits of a folder and every folder above it
+
+        A parent's limit covers its sub-folders, so spending in one folder can
+        exceed limits further up the tree. Each check is a lookup in the
+        subtree totals, so this costs O(depth).
+
+        Returns:
+            list: check_folder_limit() results, with a 'folder' key, for each
+            folder on the path that has a limit, innermost first
+        """
+        folder_id = folder_manager.get_folder_id(folder_name)
+        if folder_id is None:
+            return []
+        names = folder_manager.get_folder_names()
+        results = []
+        for path_id in [folder_id] + folder_manager.get_ancestor_ids(folder_id):
+            limit_info = self.check_folder_limit(names[path_id], folder_manager)
+            if limit_info['has_limit']:
+                results.append({'folder': names[path_id], **limit_info})
+        return results
+    
+    def export_for_powerbi(self, full=False, file_format='csv'):
+        """Export a star schema for Power BI, writing only what changed
+        
+        Writes dim_folder, dim_merchant and dim_date tables and a partition
+        of new, changed and deleted facts under data/powerbi_export (see
+        PowerBIExport).
+        
+        Args:
+            full: Start over with one partition holding every fact
+            file_format: 'csv' or 'parquet'
             
-            # Export files
-            export_path = "data/powerbi_export"
-            if not os.path.exists(export_path):
-                os.makedirs(export_path)
+        Returns:
+            dict: partition written (or None if nothing changed), inserted,
+            updated, deleted and sequence counts, or False on error
+        """
+        try:
+            folder_manager = self.ledger.folder_manager
+            folder_details = folder_manager.get_folder_details()
+            merchant_names = self.ledger.merchant_registry.get_merchant_names()
             
-            folders.to_csv(f"{export_path}/folders.csv", index=False)
-            merchants.to_csv(f"{export_path}/merchants.csv", index=False)
-            facts.to_csv(f"{export_path}/transactions.csv", index=False)
+            def build():
+                allocations = self.ledger.allocations(extra=('merchant_id', 'notes'))
+                facts = pd.DataFrame({
+                    'transaction_id': allocations['id'],
+                    'date_key': date_key(allocations['timestamp']),
+                    'folder_key': allocations['folder_id'].astype('int32'),
+                    'merchant_key': allocations['merchant_id'].astype('int32'),
+                    'amount': allocations['amount'].astype(float),
+                    'timestamp': allocations['timestamp'],
+                    'notes': allocations['notes'].fillna('')
+                })
+                folders = pd.DataFrame({
+                    'folder_key': folder_details['folder_id'].astype('int32'),
+                    'folder': folder_details['folder_name'],
+                    'path': [folder_manager.get_folder_path(name) for name in folder_details['folder_name']],
+                    'parent_key': folder_details['parent_id'].astype('Int32'),
+                    'spending_limit': pd.to_numeric(folder_details['spending_limit'], errors='coerce').fillna(0.0),
+                    'limit_period': folder_details['limit_period']
+                })
+                merchants = pd.DataFrame({'merchant_key': range(len(merchant_names)), 'merchant': merchant_names})
+                return facts, folders, merchants
             
-            return True
+            data_version = [self.ledger.data_version(), folder_details.to_csv(index=False), len(merchant_names)]
+            return PowerBIExport("data/powerbi_export", file_format).export(data_version, build, full)
         except Exception as e:
             print(f"Error exporting data: {str(e)}")
             return False
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+
+# A payment is flagged when it is this many standard deviations above the
+# usual (log-scale) amount and at least this many times the typical amount
+Z_THRESHOLD = 3.0
+RATIO_THRESHOLD = 3.0
+# Statistics need this many payments before they are trusted
+MIN_SAMPLES = 5
+# Floor on the log-scale standard deviation, so a history of identical
+# payments doesn't flag every small variation
+MIN_STD = 0.25
+
+
+class RunningStats:
+    """Welford running mean and variance that can also merge and unmerge batches"""
+
+    __slots__ = ('count', 'mean', 'm2')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def merge(self, count, mean, m2):
+        """Fold in a batch's count, mean and sum of squared deviations"""
+        if count <= 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+
+    def unmerge(self, count, mean, m2):
+        """Take back out a batch previously merged in"""
+        remaining = self.count - count
+        if remaining <= 0:
+            self.count, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        remaining_mean = (self.count * self.mean - count * mean) / remaining
+        delta = mean - remaining_mean
+        self.m2 = max(0.0, self.m2 - m2 - delta * delta * remaining * count / self.count)
+        self.mean = remaining_mean
+        self.count = remaining
+
+    def std(self):
+        return (self.m2 / (self.count - 1)) ** 0.5 if self.count > 1 else 0.0
+
+
+class AmountStats:
+    """Running statistics of payment sizes per folder and per merchant
+
+    Amounts are tracked on a log scale, where "ten times the usual bill" is
+    the same distance whatever the usual bill is. Batches of transactions
+    are merged in (or, for edits and deletes, unmerged) group-wise, so each
+    new payment costs O(1) and no pass over the history is needed.
+    """
+
+    KEYS = ('folder_id', 'merchant_id')
+
+    def __init__(self):
+        self.stats = {}     # (key column, ID) -> RunningStats
+
+    @classmethod
+    def from_transactions(cls, transactions):
+        stats = cls()
+        stats.add_transactions(transactions)
+        return stats
+
+    def add_transactions(self, transactions, sign=1):
+        """Merge (or with sign=-1, unmerge) a batch of transactions"""
+        if transactions.empty:
+            return
+        amounts = pd.to_numeric(transactions['amount'], errors='coerce')
+        logs = np.log1p(amounts.clip(lower=0))
+        for key in self.KEYS:
+            groups = logs.groupby(transactions[key].to_numpy()).agg(['count', 'mean', 'var'])
+            for group_id, count, mean, var in groups.itertuples():
+                if count == 0:
+                    continue
+                m2 = 0.0 if pd.isna(var) else var * (count - 1)
+                running = self.stats.setdefault((key, int(group_id)), RunningStats())
+                if sign > 0:
+                    running.merge(count, mean, m2)
+                else:
+                    running.unmerge(count, mean, m2)
+
+    def score(self, folder_id, merchant_id, amount):
+        """Check a payment against its folder's and merchant's usual amounts
+
+        Returns:
+            list: One dict per scope ('folder' or 'merchant') where the payment
+            is anomalous, with the typical amount, the ratio to it and the
+            z-score
+        """
+        findings = []
+        value = np.log1p(max(float(amount), 0.0))
+        for key, group_id in zip(self.KEYS, (folder_id, merchant_id)):
+            running = self.stats.get((key, group_id))
+            if group_id is None or running is None or running.count < MIN_SAMPLES:
+                continue
+            typical = float(np.expm1(running.mean))
+            z = float((value - running.mean) / max(running.std(), MIN_STD))
+            ratio = float(amount) / typical if typical > 0 else float('inf')
+            if z > Z_THRESHOLD and ratio >= RATIO_THRESHOLD:
+                findings.append({'scope': key.replace('_id', ''), 'typical': typical, 'ratio': ratio, 'z': z})
+        return findings
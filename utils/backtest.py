@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+from datetime import date
+from utils.budget_periods import month_number
+
+
+def backtest_limits(rollups, folder_ids, limits, today=None):
+    """Replay past calendar months against candidate monthly limits
+
+    The daily rollups of the folders are scattered once into a month x
+    day-of-month grid and summed cumulatively along each month; comparing
+    that grid with every candidate limit at once gives, for each limit and
+    month, whether and on which day the month's spending first went over.
+
+    Args:
+        rollups: SpendingRollups
+        folder_ids: Folder IDs whose spending the limit covers (a folder and
+            its sub-folders)
+        limits: Candidate limit amounts
+        today: Months before this day's month are replayed (defaults to today)
+
+    Returns:
+        DataFrame: One row per limit and month, with limit, month ('YYYY-MM'),
+        spent and first_breach (the date spending went over, or None)
+    """
+    today = today or date.today()
+    limits = np.asarray(sorted(set(float(limit) for limit in limits)), dtype=float)
+    columns = ['limit', 'month', 'spent', 'first_breach']
+    folder_ids = set(int(folder_id) for folder_id in folder_ids)
+    keys = [(day, amount) for (folder_id, day), amount in rollups.daily.items() if folder_id in folder_ids]
+    current = month_number(today.year, today.month)
+    keys = [(day, amount) for day, amount in keys if month_number(day.year, day.month) < current]
+    if not keys or not len(limits):
+        return pd.DataFrame(columns=columns)
+
+    days, amounts = zip(*keys)
+    month_numbers = np.array([month_number(day.year, day.month) for day in days])
+    first = month_numbers.min()
+    months = current - first
+    grid = np.zeros((months, 31))
+    np.add.at(grid, (month_numbers - first, np.array([day.day for day in days]) - 1), np.array(amounts, dtype=float))
+    cumulative = np.cumsum(grid, axis=1)
+
+    # limits x months x days: spending so far is over the limit
+    over = cumulative[None, :, :] > limits[:, None, None]
+    breached = over.any(axis=2)
+    breach_day = over.argmax(axis=2) + 1
+
+    labels = [f"{(first + i) // 12}-{(first + i) % 12 + 1:02d}" for i in range(months)]
+    results = pd.DataFrame({
+        'limit': np.repeat(limits, months),
+        'month': np.tile(labels, len(limits)),
+        'spent': np.tile(cumulative[:, -1], len(limits)),
+    })
+    month_starts = [date((first + i) // 12, (first + i) % 12 + 1, 1) for i in range(months)]
+    results['first_breach'] = [
+        month_starts[i % months].replace(day=int(day)) if hit else None
+        for i, (hit, day) in enumerate(zip(breached.ravel(), breach_day.ravel()))
+    ]
+    return results
+
+
+def summarize_backtest(results):
+    """Breach counts per candidate limit from backtest_limits() results
+
+    Returns:
+        DataFrame: limit, months, breaches, breach_rate (percent of months)
+        and typical_breach_day (median day of the month of first breaches)
+    """
+    breaches = results.assign(
+        breached=results['first_breach'].notna(),
+        breach_day=[day.day if day is not None else np.nan for day in results['first_breach']]
+    )
+    summary = breaches.groupby('limit').agg(
+        months=('month', 'size'),
+        breaches=('breached', 'sum'),
+        typical_breach_day=('breach_day', 'median')
+    ).reset_index()
+    summary['breach_rate'] = summary['breaches'] / summary['months'] * 100
+    return summary[['limit', 'months', 'breaches', 'breach_rate', 'typical_breach_day']]
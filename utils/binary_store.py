@@ -0,0 +1,295 @@
+import numpy as np
+import pandas as pd
+import os
+import threading
+from utils.storage import file_lock
+from utils.splits import parse_splits
+
+# "csv" keeps only the CSV logs; "binary" also maintains the fixed-width store
+STORAGE_MODE = os.environ.get("TRANSACTION_STORAGE", "csv")
+
+RECORD_DTYPE = np.dtype([
+    ('timestamp', '<i8'),     # microseconds since the epoch (wall-clock time)
+    ('amount_paise', '<i8'),
+    ('folder_id', '<i4'),
+    ('merchant_id', '<i4'),
+])
+DELETED = -1  # folder_id of a deleted record
+
+
+def to_epoch_micros(timestamp):
+    return pd.Timestamp(timestamp).value // 1000
+
+
+def to_paise(amount):
+    return int(round(float(amount) * 100))
+
+
+class BinaryTransactionStore:
+    """Transactions as fixed-width records in a memory-mapped file
+
+    Each record holds the timestamp, the amount in paise and the folder and
+    merchant IDs used by the ledger (see FolderManager and MerchantRegistry).
+    Appends write one record, edits and deletes overwrite one record in
+    place, and readers wrap the mapped file as NumPy arrays without parsing
+    or copying anything.
+
+    The splits fields of the (few) transactions split across folders are kept
+    in a side table, one `id<TAB>field` line per change, and every in-place
+    edit adds a line to an edit journal so version() moves on with it.
+    """
+
+    def __init__(self, directory="data/binary"):
+        self.directory = directory
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        self.records_file = os.path.join(directory, "transactions.bin")
+        self.ids_file = os.path.join(directory, "transaction_ids.txt")
+        self.splits_file = os.path.join(directory, "transaction_splits.txt")
+        self.edits_file = os.path.join(directory, "edits.txt")
+        # Stores written before the ledger had ID dictionaries kept their own
+        self.legacy_dictionaries = [os.path.join(directory, name) for name in ("folders.jsonl", "merchants.jsonl")]
+        self.needs_rebuild = any(os.path.exists(path) for path in self.legacy_dictionaries)
+        for path in (self.records_file, self.ids_file, self.splits_file, self.edits_file):
+            if not os.path.exists(path):
+                open(path, 'a').close()
+        # IDs and splits read so far, dropped when a rebuild replaces the
+        # files (from this store or another process)
+        self._rows = {}
+        self._ids_inode = None
+        self._ids_offset = 0
+        self._splits = {}
+        self._splits_inode = None
+        self._splits_offset = 0
+        self._lock = threading.Lock()
+
+    def _encode(self, transaction):
+        record = np.zeros(1, dtype=RECORD_DTYPE)
+        record['timestamp'] = to_epoch_micros(transaction['timestamp'])
+        record['amount_paise'] = to_paise(transaction['amount'])
+        record['folder_id'] = transaction['folder_id']
+        record['merchant_id'] = transaction['merchant_id']
+        return record
+
+    def __len__(self):
+        return os.path.getsize(self.records_file) // RECORD_DTYPE.itemsize
+
+    def version(self):
+        """Identify the current contents of the store
+
+        Returns:
+            tuple: (inode, size, mtime) of the record, splits and edit files;
+            appends grow the first two and in-place edits grow the journal
+        """
+        return tuple(
+            (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+            for stat in map(os.stat, (self.records_file, self.splits_file, self.edits_file))
+        )
+
+    def live_count(self):
+        """Number of records that are not deleted"""
+        return int((self.records()['folder_id'] != DELETED).sum())
+
+    def _journal(self, operation, count):
+        with open(self.edits_file, 'a', encoding='utf-8') as f:
+            f.write(f"{operation} {count}\n")
+
+    def _append_splits(self, fields):
+        lines = ''.join(f"{transaction_id}\t{field}\n" for transaction_id, field in fields)
+        if lines:
+            with open(self.splits_file, 'a', encoding='utf-8') as f:
+                f.write(lines)
+
+    def append(self, transaction):
+        """Append one transaction (dict with id, timestamp, amount, folder_id, merchant_id)"""
+        self.append_many([transaction])
+
+    def append_many(self, transactions):
+        """Append several transactions with one write per file"""
+        if not transactions:
+            return
+        records = np.concatenate([self._encode(tx) for tx in transactions])
+        ids = ''.join(f"{tx['id']}\n" for tx in transactions)
+        splits = [(tx['id'], tx['splits']) for tx in transactions if parse_splits(tx.get('splits'))]
+        with file_lock(self.records_file):
+            with open(self.records_file, 'ab') as f:
+                f.write(records.tobytes())
+            with open(self.ids_file, 'a', encoding='utf-8') as f:
+                f.write(ids)
+            self._append_splits(splits)
+
+    def _rows_for(self, transaction_ids):
+        """Row numbers of several transaction IDs (None for unknown IDs)
+
+        Only the IDs added since the last call are read, unless the ID file
+        was replaced by a rebuild since then.
+        """
+        with self._lock:
+            with open(self.ids_file, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                if stat.st_ino != self._ids_inode or stat.st_size < self._ids_offset:
+                    self._rows = {}
+                    self._ids_inode = stat.st_ino
+                    self._ids_offset = 0
+                f.seek(self._ids_offset)
+                data = f.read()
+            end = data.rfind(b'\n') + 1
+            for line in data[:end].decode('utf-8').splitlines():
+                self._rows[line] = len(self._rows)
+            self._ids_offset += end
+            return [self._rows.get(transaction_id) for transaction_id in transaction_ids]
+
+    def rows(self, transaction_ids):
+        """Record numbers of several transaction IDs (-1 for unknown IDs)"""
+        rows = self._rows_for(list(transaction_ids))
+        return np.array([-1 if row is None else row for row in rows], dtype=np.int64)
+
+    def update(self, transaction_id, changes):
+        """Overwrite the numeric fields of one record in place
+
+        Returns:
+            bool: False if the ID is not in the store
+        """
+        return self.update_many([transaction_id], changes) > 0
+
+    def update_many(self, transaction_ids, changes):
+        """Apply the same changes to several records with one mapping of the file
+
+        Returns:
+            int: Number of records changed
+        """
+        with file_lock(self.records_file):
+            # Looked up under the lock so a rebuild can't move the rows
+            rows = np.array([row for row in self._rows_for(transaction_ids) if row is not None], dtype=np.int64)
+            if len(rows) == 0:
+                return 0
+            records = self.records(mode='r+')
+            rows = rows[records['folder_id'][rows] != DELETED]
+            if 'timestamp' in changes:
+                records['timestamp'][rows] = to_epoch_micros(changes['timestamp'])
+            if 'amount' in changes:
+                records['amount_paise'][rows] = to_paise(changes['amount'])
+            if 'folder_id' in changes:
+                records['folder_id'][rows] = changes['folder_id']
+            if 'merchant_id' in changes:
+                records['merchant_id'][rows] = changes['merchant_id']
+            records.flush()
+            if 'splits' in changes:
+                self._append_splits((transaction_id, changes['splits']) for transaction_id in transaction_ids)
+            self._journal('update', len(rows))
+        return len(rows)
+
+    def set_splits(self, splits):
+        """Record new splits fields
+
+        Args:
+            splits: Dict of transaction ID -> stored splits field
+        """
+        if not splits:
+            return
+        with file_lock(self.records_file):
+            self._append_splits(splits.items())
+            self._journal('splits', len(splits))
+
+    def split_fields(self):
+        """Get the stored splits field of each transaction split across folders
+
+        Only the side-table lines added since the last call are read, unless
+        the side table was replaced by a rebuild since then.
+
+        Returns:
+            dict: Transaction ID -> splits field (deleted records included;
+            check their folder_id)
+        """
+        with self._lock:
+            with open(self.splits_file, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                if stat.st_ino != self._splits_inode or stat.st_size < self._splits_offset:
+                    self._splits = {}
+                    self._splits_inode = stat.st_ino
+                    self._splits_offset = 0
+                f.seek(self._splits_offset)
+                data = f.read()
+            end = data.rfind(b'\n') + 1
+            for line in data[:end].decode('utf-8').splitlines():
+                transaction_id, field = line.split('\t')
+                if parse_splits(field):
+                    self._splits[transaction_id] = field
+                else:
+                    self._splits.pop(transaction_id, None)
+            self._splits_offset += end
+            return dict(self._splits)
+
+    def delete(self, transaction_id):
+        """Mark one record as deleted in place"""
+        return self.delete_many([transaction_id]) > 0
+
+    def delete_many(self, transaction_ids):
+        """Mark several records as deleted with one mapping of the file
+
+        Returns:
+            int: Number of records found
+        """
+        with file_lock(self.records_file):
+            rows = np.array([row for row in self._rows_for(transaction_ids) if row is not None], dtype=np.int64)
+            if len(rows) == 0:
+                return 0
+            records = self.records(mode='r+')
+            records['folder_id'][rows] = DELETED
+            records['amount_paise'][rows] = 0
+            records.flush()
+            self._journal('delete', len(rows))
+        return len(rows)
+
+    def records(self, mode='r'):
+        """Memory-map the record file as a NumPy structured array"""
+        count = len(self)
+        if count == 0:
+            return np.zeros(0, dtype=RECORD_DTYPE)
+        return np.memmap(self.records_file, dtype=RECORD_DTYPE, mode=mode, shape=(count,))
+
+    def columns(self):
+        """Zero-copy NumPy views of each field of the live records
+
+        Returns:
+            dict: timestamp (epoch µs), amount_paise, folder_id and
+            merchant_id arrays over the mapped file. Deleted records have
+            folder_id == DELETED.
+        """
+        records = self.records()
+        return {name: records[name] for name in RECORD_DTYPE.names}
+
+    def rebuild_from(self, transactions):
+        """Replace the store's contents with the rows of a DataFrame
+
+        The files are swapped for new empty ones rather than truncated, so
+        other stores over the same directory see a new inode and drop the
+        row numbers they cached.
+        """
+        with file_lock(self.records_file):
+            for path in (self.records_file, self.ids_file, self.splits_file):
+                open(path + '.tmp', 'w').close()
+                os.replace(path + '.tmp', path)
+            self.append_many(transactions.to_dict('records'))
+            self._journal('rebuild', len(transactions))
+            for path in self.legacy_dictionaries:
+                if os.path.exists(path):
+                    os.remove(path)
+            self.needs_rebuild = False
+
+
+_stores = {}
+_stores_guard = threading.Lock()
+
+
+def get_binary_store(directory="data/binary"):
+    """Get the process-wide binary store for a directory
+
+    Analytics and TransactionManager share one store, so a rebuild from
+    either resets the row numbers cached for both.
+    """
+    key = os.path.abspath(directory)
+    with _stores_guard:
+        if key not in _stores:
+            _stores[key] = BinaryTransactionStore(directory)
+        return _stores[key]
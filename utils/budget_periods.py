@@ -0,0 +1,50 @@
+from datetime import date, timedelta
+
+# Periods a spending limit can be set for; 'days:N' is a rolling window of N days
+BUDGET_PERIODS = ['monthly', 'weekly', 'fortnightly']
+DEFAULT_PERIOD = 'monthly'
+
+# Fortnights are counted from this Monday so they line up with weeks
+FORTNIGHT_ANCHOR = date(2024, 1, 1)
+
+
+def month_number(year, month):
+    """Months since year 0, so calendar months can be subtracted and used as array positions"""
+    return year * 12 + month - 1
+
+
+def is_valid_period(period):
+    if period in BUDGET_PERIODS:
+        return True
+    if isinstance(period, str) and period.startswith('days:'):
+        days = period[len('days:'):]
+        return days.isdigit() and int(days) > 0
+    return False
+
+
+def period_bounds(period, today=None):
+    """Get the budget period containing a day
+
+    Args:
+        period: 'monthly', 'weekly', 'fortnightly' or 'days:N'
+        today: Day to evaluate (defaults to today)
+
+    Returns:
+        tuple: (start date, end date, label), both dates inclusive
+    """
+    today = today or date.today()
+    if period == 'weekly':
+        start = today - timedelta(days=today.weekday())
+        end = start + timedelta(days=6)
+        return start, end, f"Week of {start.strftime('%d %b %Y')}"
+    if period == 'fortnightly':
+        start = today - timedelta(days=(today - FORTNIGHT_ANCHOR).days % 14)
+        end = start + timedelta(days=13)
+        return start, end, f"{start.strftime('%d %b')} - {end.strftime('%d %b %Y')}"
+    if isinstance(period, str) and period.startswith('days:') and is_valid_period(period):
+        days = int(period[len('days:'):])
+        return today - timedelta(days=days - 1), today, f"Last {days} days"
+
+    start = today.replace(day=1)
+    next_month = (start + timedelta(days=32)).replace(day=1)
+    return start, next_month - timedelta(days=1), today.strftime('%B %Y')
@@ -0,0 +1,73 @@
+import threading
+
+# How often the compactor wakes up, and how much unfolded log data it waits for
+COMPACTION_INTERVAL_SECONDS = 300
+COMPACTION_MIN_BYTES = 64 * 1024
+
+
+class Compactor:
+    """Periodically folds append logs into their snapshots on a daemon thread
+
+    Sealing a log only holds the writers' lock for a rename, so payments and
+    notifications are never blocked behind a compaction.
+    """
+
+    def __init__(self, stores, interval=COMPACTION_INTERVAL_SECONDS, min_bytes=COMPACTION_MIN_BYTES):
+        """
+        Args:
+            stores: SegmentedStore instances to compact
+            interval: Seconds between compaction passes
+            min_bytes: Skip stores with less unfolded log data than this
+        """
+        self.stores = list(stores)
+        self.interval = interval
+        self.min_bytes = min_bytes
+        self._thread = None
+        self._stop = threading.Event()
+
+    def run_once(self, force=False):
+        """Compact every store that has enough pending log data
+
+        Args:
+            force: Compact regardless of how much data is pending
+
+        Returns:
+            int: Number of stores compacted
+        """
+        compacted = 0
+        for store in self.stores:
+            try:
+                if force or store.pending_bytes() >= self.min_bytes:
+                    store.compact()
+                    compacted += 1
+            except Exception as e:
+                print(f"Error compacting {store.snapshot.path}: {str(e)}")
+        return compacted
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def start(self):
+        """Start the background thread (no-op if already running)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="log-compactor", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+_compactor = None
+_compactor_guard = threading.Lock()
+
+
+def start_compactor(stores):
+    """Start the process-wide compactor once, however many sessions ask for it"""
+    global _compactor
+    with _compactor_guard:
+        if _compactor is None:
+            _compactor = Compactor(stores).start()
+        return _compactor
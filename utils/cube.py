@@ -0,0 +1,79 @@
+import pandas as pd
+from collections import defaultdict
+from utils.splits import allocate
+
+CUBE_DIMENSIONS = ['folder_id', 'month', 'merchant_id']
+
+
+class SpendingCube:
+    """Spending pre-aggregated by folder, calendar month and merchant
+
+    Each cell holds the amount and number of payments for one (folder,
+    'YYYY-MM', merchant) combination. Cells are adjusted as transactions are
+    added, edited or deleted, and the charts are answered by summing cells
+    rather than regrouping the transactions. Parts of a split transaction
+    count towards the folder they are allocated to.
+    """
+
+    def __init__(self):
+        self.amounts = defaultdict(float)   # (folder_id, month, merchant_id) -> amount
+        self.counts = defaultdict(int)      # (folder_id, month, merchant_id) -> payments
+
+    @classmethod
+    def from_transactions(cls, transactions):
+        cube = cls()
+        cube.add_transactions(transactions)
+        return cube
+
+    @classmethod
+    def from_frame(cls, cells):
+        """Restore a cube saved with to_frame()"""
+        cube = cls()
+        keys = list(zip(cells['folder_id'].tolist(), cells['month'].tolist(), cells['merchant_id'].tolist()))
+        cube.amounts.update(zip(keys, cells['amount'].tolist()))
+        cube.counts.update(zip(keys, cells['count'].tolist()))
+        return cube
+
+    def to_frame(self):
+        """The cells as a DataFrame of CUBE_DIMENSIONS plus amount and count"""
+        cells = pd.DataFrame(list(self.amounts), columns=CUBE_DIMENSIONS)
+        cells['amount'] = pd.Series(list(self.amounts.values()), dtype=float)
+        cells['count'] = pd.Series([self.counts[key] for key in self.amounts], dtype='int64')
+        return cells
+
+    def add_transactions(self, transactions, sign=1):
+        """Add (or with sign=-1, remove) a batch of transactions"""
+        if transactions.empty:
+            return
+        merchants = transactions['merchant_id'] if 'id' not in transactions.columns else transactions.set_index('id')['merchant_id']
+        allocations = allocate(transactions)
+        allocations['merchant_id'] = allocations['id'].map(merchants)
+        months = allocations['timestamp'].dt.to_period('M')
+        cells = allocations.groupby([allocations['folder_id'], months, allocations['merchant_id']])['amount'].agg(['sum', 'size'])
+        for (folder_id, month, merchant_id), amount, count in cells.itertuples():
+            key = (int(folder_id), str(month), int(merchant_id))
+            self.counts[key] += sign * count
+            if self.counts[key] <= 0:
+                # Drop emptied cells rather than keep rounding residue around
+                del self.counts[key]
+                self.amounts.pop(key, None)
+            else:
+                self.amounts[key] += sign * amount
+
+    def slice(self, by, folder_ids=None, months=None):
+        """Sum the cells matching a filter over the given dimensions
+
+        Args:
+            by: Dimensions to keep, from 'folder_id', 'month' and 'merchant_id'
+            folder_ids: Only these folders (None for all)
+            months: Only these 'YYYY-MM' months (None for all)
+
+        Returns:
+            DataFrame: The `by` columns plus amount and count
+        """
+        cells = self.to_frame()
+        if folder_ids is not None:
+            cells = cells[cells['folder_id'].isin(list(folder_ids))]
+        if months is not None:
+            cells = cells[cells['month'].isin(list(months))]
+        return cells.groupby(list(by), as_index=False)[['amount', 'count']].sum()
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+
+# Most points a trend chart is sent; longer series are downsampled
+TREND_MAX_POINTS = 1000
+# Series with more points than this are drawn with WebGL (Scattergl) traces
+WEBGL_MIN_POINTS = 500
+# Series spanning up to this many days are shown per day, then per week;
+# anything longer is shown per month. Two years per day is the one case
+# that goes past WEBGL_MIN_POINTS; ten years per week stay just above it.
+DAILY_MAX_DAYS = 730
+WEEKLY_MAX_DAYS = 3650
+
+
+def choose_resolution(start, end):
+    """Pick a trend resolution for a date range
+
+    Returns:
+        str: 'day', 'week' or 'month'
+    """
+    days = (pd.Timestamp(end) - pd.Timestamp(start)).days
+    if days <= DAILY_MAX_DAYS:
+        return 'day'
+    if days <= WEEKLY_MAX_DAYS:
+        return 'week'
+    return 'month'
+
+
+def resample_trend(trend, resolution):
+    """Sum a daily date/amount series into weeks (starting Monday) or months"""
+    if resolution == 'day' or trend.empty:
+        return trend
+    series = trend.set_index(pd.to_datetime(trend['date']))['amount']
+    # Weeks are labelled by their Monday, months by their first day
+    rule = 'W-MON' if resolution == 'week' else 'MS'
+    resampled = series.resample(rule, label='left', closed='left').sum()
+    return pd.DataFrame({'date': resampled.index.date, 'amount': resampled.to_numpy()})
+
+
+def lttb(x, y, threshold):
+    """Largest-Triangle-Three-Buckets downsampling
+
+    Keeps the first and last points and, from each of `threshold - 2`
+    equal buckets in between, the point forming the largest triangle with
+    the point kept from the previous bucket and the average of the next
+    bucket. Peaks and dips survive, unlike with plain averaging.
+
+    Args:
+        x: Increasing numeric x values
+        y: Values
+        threshold: Number of points to keep
+
+    Returns:
+        ndarray: Indices of the points kept
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    kept = np.empty(threshold, dtype=int)
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x = x[end:next_end].mean() if next_end > end else x[-1]
+        next_y = y[end:next_end].mean() if next_end > end else y[-1]
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        kept[bucket + 1] = previous
+    return kept
+
+
+def downsample_trend(trend, max_points=TREND_MAX_POINTS):
+    """Bring a daily spending trend down to a chartable size
+
+    The resolution is picked from the date range first; if the series is
+    still longer than `max_points`, LTTB picks the points to keep.
+
+    Args:
+        trend: DataFrame with one date/amount row per day with spending
+        max_points: Most points to return
+
+    Returns:
+        tuple: (DataFrame of date and amount, resolution name)
+    """
+    if trend.empty:
+        return trend, 'day'
+    trend = trend.sort_values('date')
+    resolution = choose_resolution(trend['date'].iloc[0], trend['date'].iloc[-1])
+    trend = resample_trend(trend, resolution)
+    if len(trend) > max_points:
+        days = pd.to_datetime(trend['date']).to_numpy().astype('datetime64[D]').astype(np.int64)
+        trend = trend.iloc[lttb(days, trend['amount'].to_numpy(), max_points)]
+    return trend.reset_index(drop=True), resolution
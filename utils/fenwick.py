@@ -0,0 +1,81 @@
+class FenwickTree:
+    """Binary indexed tree: point updates and prefix sums in O(log n)
+
+    The array grows on demand when a position past the end is updated.
+    """
+
+    def __init__(self, size=0):
+        self.tree = [0.0] * (size + 1)
+
+    def __len__(self):
+        return len(self.tree) - 1
+
+    def _grow(self, size):
+        values = [self.range_sum(i, i + 1) for i in range(len(self))]
+        values += [0.0] * (size - len(values))
+        self.tree = [0.0] + values
+        # Linear-time construction: push each node into its parent
+        for i in range(1, len(self.tree)):
+            parent = i + (i & -i)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[i]
+
+    def add(self, position, delta):
+        """Add delta to the value at a position"""
+        if position >= len(self):
+            self._grow(max(position + 1, 2 * len(self)))
+        i = position + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix_sum(self, end):
+        """Sum of the values at positions [0, end)"""
+        i = min(end, len(self))
+        total = 0.0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def range_sum(self, start, end):
+        """Sum of the values at positions [start, end)"""
+        if end <= start:
+            return 0.0
+        return self.prefix_sum(end) - self.prefix_sum(max(start, 0))
+
+
+class DailySpendIndex:
+    """Spending per calendar day, summed over any date range in O(log n)
+
+    Days are positions in a FenwickTree counted from an origin date. The
+    origin starts a year before the first day seen and moves back (with a
+    rebuild) if an even older day turns up.
+    """
+
+    MARGIN_DAYS = 366
+
+    def __init__(self):
+        self.origin = None
+        self.tree = FenwickTree()
+
+    def add(self, day, amount):
+        """Add an amount to a day's bucket"""
+        ordinal = day.toordinal()
+        if self.origin is None:
+            self.origin = ordinal - self.MARGIN_DAYS
+        if ordinal < self.origin:
+            shift = self.origin - (ordinal - self.MARGIN_DAYS)
+            values = [self.tree.range_sum(i, i + 1) for i in range(len(self.tree))]
+            self.origin -= shift
+            self.tree = FenwickTree()
+            for position, value in enumerate(values):
+                if value:
+                    self.tree.add(position + shift, value)
+        self.tree.add(ordinal - self.origin, amount)
+
+    def total(self, start, end):
+        """Spending from start to end, both dates inclusive"""
+        if self.origin is None:
+            return 0.0
+        return self.tree.range_sum(start.toordinal() - self.origin, end.toordinal() - self.origin + 1)
@@ -1,9 +1,20 @@
 import pandas as pd
 import os
+from utils.budget_periods import DEFAULT_PERIOD, is_valid_period
+from utils.storage import file_lock
+
+FOLDER_COLUMNS = ['folder_id', 'folder_name', 'spending_limit', 'parent_id', 'limit_period', 'deleted']
 
 class FolderManager:
     def __init__(self):
         self.folders_file = "data/folders.csv"
+        self._cache = None
+        self._cache_key = None
+        # Lookups built from the cached rows (live folders only)
+        self._ids = {}
+        self._names = {}
+        self._parents = {}
+        self._limits = {}
         self._initialize_storage()
 
     def _initialize_storage(self):
@@ -11,81 +22,332 @@ class FolderManager:
         if not os.path.exists('data'):
             os.makedirs('data')
         if not os.path.exists(self.folders_file):
-            pd.DataFrame(columns=['folder_name', 'spending_limit']).to_csv(self.folders_file, index=False)
+            pd.DataFrame(columns=FOLDER_COLUMNS).to_csv(self.folders_file, index=False)
+
+    def _refresh(self):
+        """Re-read folders.csv if it changed since the last read
+
+        Folder IDs are the dictionary codes transactions are stored with, so
+        a name or ID is looked up for every record written; the name -> ID,
+        ID -> name, parent and limit dicts are rebuilt here once per change
+        of the file, and lookups only cost a stat.
+        """
+        stat = os.stat(self.folders_file)
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if key != self._cache_key:
+            with file_lock(self.folders_file):
+                folders = pd.read_csv(self.folders_file)
+                changed = False
+                # Ensure spending_limit and folder_id columns exist (for backward compatibility)
+                if 'spending_limit' not in folders.columns:
+                    folders['spending_limit'] = 0.0
+                    changed = True
+                if 'folder_id' not in folders.columns:
+                    folders['folder_id'] = range(len(folders))
+                    changed = True
+                if 'parent_id' not in folders.columns:
+                    folders['parent_id'] = None
+                    changed = True
+                if 'limit_period' not in folders.columns:
+                    folders['limit_period'] = DEFAULT_PERIOD
+                    changed = True
+                if 'deleted' not in folders.columns:
+                    folders['deleted'] = False
+                    changed = True
+                folders['folder_id'] = folders['folder_id'].astype(int)
+                # Empty for top-level folders
+                folders['parent_id'] = pd.to_numeric(folders['parent_id']).astype('Int64')
+                folders['deleted'] = folders['deleted'].fillna(False).astype(bool)
+                if changed:
+                    self._write_all(folders)
+                    return self._refresh()
+                live = folders[~folders['deleted']]
+                children = live.dropna(subset=['parent_id'])
+                self._ids = dict(zip(live['folder_name'], live['folder_id'].tolist()))
+                self._names = dict(zip(live['folder_id'].tolist(), live['folder_name']))
+                self._parents = dict(zip(children['folder_id'].tolist(), children['parent_id'].astype(int).tolist()))
+                self._limits = dict(zip(live['folder_name'], zip(live['spending_limit'].tolist(), live['limit_period'].tolist())))
+                self._cache = folders
+                self._cache_key = key
+
+    def version(self):
+        """Identify the current contents of folders.csv
+
+        Returns:
+            tuple: (inode, mtime, size) of the file, which changes with any
+            change to the folders (names, tree or limits)
+        """
+        self._refresh()
+        return self._cache_key
+
+    def _read_all(self):
+        """Read every row of folders.csv, deleted folders included"""
+        self._refresh()
+        return self._cache.copy()
 
-    def create_folder(self, folder_name, spending_limit=0.0):
+    def _read_folders(self):
+        """Read the folders that haven't been deleted"""
+        folders = self._read_all()
+        return folders[~folders['deleted']].drop(columns='deleted').reset_index(drop=True)
+
+    def _write_all(self, folders):
+        temp_path = f"{self.folders_file}.tmp"
+        folders.reindex(columns=FOLDER_COLUMNS + [c for c in folders.columns if c not in FOLDER_COLUMNS]).to_csv(temp_path, index=False)
+        os.replace(temp_path, self.folders_file)
+
+    def _write_folders(self, folders, deleted_ids=()):
+        """Write the live folders, keeping the rows of deleted ones
+
+        Deleted folders stay in the file, marked deleted, so their IDs are
+        never handed out again.
+
+        Args:
+            folders: DataFrame of the live folders
+            deleted_ids: IDs of folders to mark deleted
+        """
+        existing = self._read_all()
+        tombstones = existing[existing['deleted'] & ~existing['folder_id'].isin(folders['folder_id'])]
+        deleted = folders['folder_id'].isin(list(deleted_ids))
+        self._write_all(pd.concat([
+            folders[~deleted].assign(deleted=False),
+            folders[deleted].assign(deleted=True),
+            tombstones
+        ], ignore_index=True))
+
+    def create_folder(self, folder_name, spending_limit=0.0, parent=None):
         """Create a new folder with optional spending limit
         
         Args:
             folder_name: Name of the folder
             spending_limit: Spending limit for this folder (0 = no limit)
+            parent: Name of the parent folder (None for a top-level folder)
         """
-        folders = pd.read_csv(self.folders_file)
-        if folder_name not in folders['folder_name'].values:
-            # Using concat instead of the deprecated append method
-            new_folder = pd.DataFrame({
-                'folder_name': [folder_name],
-                'spending_limit': [float(spending_limit)]
-            })
-            folders = pd.concat([folders, new_folder], ignore_index=True)
-            folders.to_csv(self.folders_file, index=False)
-            return True
-        return False
+        with file_lock(self.folders_file):
+            folders = self._read_folders()
+            if folder_name not in folders['folder_name'].values:
+                parent_id = self.get_folder_id(parent) if parent else None
+                if parent and parent_id is None:
+                    return False
+                # IDs are never reused (deleted folders keep theirs), so
+                # transactions keep pointing at the right folder
+                all_folders = self._read_all()
+                folder_id = int(all_folders['folder_id'].max()) + 1 if not all_folders.empty else 0
+                new_folder = pd.DataFrame({
+                    'folder_id': [folder_id],
+                    'folder_name': [folder_name],
+                    'spending_limit': [float(spending_limit)],
+                    'parent_id': pd.array([parent_id], dtype='Int64'),
+                    'limit_period': [DEFAULT_PERIOD]
+                })
+                folders = pd.concat([folders, new_folder], ignore_index=True)
+                self._write_folders(folders)
+                return True
+            return False
 
-    def delete_folder(self, folder_name):
-        """Delete an existing folder"""
-        folders = pd.read_csv(self.folders_file)
-        folders = folders[folders['folder_name'] != folder_name]
-        folders.to_csv(self.folders_file, index=False)
+    def delete_folder(self, folder_name, mode=None, reassign_to='Default', transaction_manager=None):
+        """Delete an existing folder
+
+        Args:
+            folder_name: Name of the folder
+            mode: What happens to the folder's transactions: None leaves them
+                where they are, 'reassign' moves them to `reassign_to` and
+                'archive' moves them out of the ledger into the archive
+            reassign_to: Folder that receives the transactions in 'reassign' mode
+            transaction_manager: TransactionManager holding the transactions,
+                needed for either mode
+
+        Returns:
+            int: Number of transactions reassigned or archived
+        """
+        folder_id = self.get_folder_id(folder_name)
+        moved = 0
+        if folder_id is not None and mode is not None:
+            if mode == 'reassign':
+                if reassign_to == folder_name:
+                    raise ValueError("Cannot reassign a folder's transactions to itself")
+                moved = transaction_manager.reassign_folder(folder_id, self.ensure_folder(reassign_to))
+            elif mode == 'archive':
+                moved = transaction_manager.archive_folder(folder_id)
+            else:
+                raise ValueError(f"Unknown delete mode: {mode}")
+
+        with file_lock(self.folders_file):
+            folders = self._read_folders()
+            if folder_id is not None:
+                # Sub-folders move up to the deleted folder's parent
+                parent_id = folders.loc[folders['folder_id'] == folder_id, 'parent_id'].iloc[0]
+                folders.loc[folders['parent_id'] == folder_id, 'parent_id'] = parent_id
+                self._write_folders(folders, deleted_ids=[folder_id])
+        return moved
+
+    def rename_folder(self, folder_name, new_name):
+        """Rename a folder
+
+        Transactions refer to folders by ID, so only the folder's own row
+        changes, however many transactions it holds.
+
+        Returns:
+            bool: True if renamed, False if the folder is missing or the new name is taken
+        """
+        with file_lock(self.folders_file):
+            folders = self._read_folders()
+            if folder_name not in folders['folder_name'].values or new_name in folders['folder_name'].values:
+                return False
+            folders.loc[folders['folder_name'] == folder_name, 'folder_name'] = new_name
+            self._write_folders(folders)
+            return True
 
     def get_folders(self):
         """Get list of all folders"""
-        folders = pd.read_csv(self.folders_file)
+        folders = self._read_folders()
         return folders['folder_name'].tolist()
         
     def get_folder_details(self):
         """Get all folder details including spending limits"""
-        folders = pd.read_csv(self.folders_file)
-        # Ensure spending_limit column exists (for backward compatibility)
-        if 'spending_limit' not in folders.columns:
-            folders['spending_limit'] = 0.0
-            folders.to_csv(self.folders_file, index=False)
-        return folders
-        
+        return self._read_folders()
+
+    def get_folder_id(self, folder_name):
+        """Get the ID of a folder
+
+        Returns:
+            int: Folder ID, or None if there is no such folder
+        """
+        self._refresh()
+        return self._ids.get(folder_name)
+
+    def ensure_folder(self, folder_name):
+        """Get the ID of a folder, creating the folder if it doesn't exist"""
+        folder_id = self.get_folder_id(folder_name)
+        if folder_id is None:
+            self.create_folder(folder_name)
+            folder_id = self.get_folder_id(folder_name)
+        return folder_id
+
+    def set_parent(self, folder_name, parent):
+        """Move a folder under another folder
+
+        Args:
+            folder_name: Name of the folder to move
+            parent: Name of the new parent folder (None for top level)
+
+        Returns:
+            bool: True if moved, False if a folder is missing or the move would create a cycle
+        """
+        folder_id = self.get_folder_id(folder_name)
+        parent_id = self.get_folder_id(parent) if parent else None
+        if folder_id is None or (parent and parent_id is None):
+            return False
+        if parent_id is not None and (parent_id == folder_id or folder_id in self.get_ancestor_ids(parent_id)):
+            return False
+        with file_lock(self.folders_file):
+            folders = self._read_folders()
+            folders.loc[folders['folder_id'] == folder_id, 'parent_id'] = parent_id
+            self._write_folders(folders)
+            return True
+
+    def get_parents(self):
+        """Get the folder tree
+
+        Returns:
+            dict: Folder ID -> parent folder ID, for folders that have a parent
+            (shared with the cache; don't modify it)
+        """
+        self._refresh()
+        return self._parents
+
+    def get_ancestor_ids(self, folder_id):
+        """Get the IDs of a folder's parent, grandparent and so on up to the top
+
+        Walks the parent links, so it costs O(depth).
+        """
+        parents = self.get_parents()
+        ancestors = []
+        while folder_id in parents and parents[folder_id] not in ancestors:
+            folder_id = parents[folder_id]
+            ancestors.append(folder_id)
+        return ancestors
+
+    def get_descendant_names(self, folder_name):
+        """Get the names of every folder below a folder"""
+        folder_id = self.get_folder_id(folder_name)
+        names = self.get_folder_names()
+        return [names[i] for i in self.get_parents() if folder_id in self.get_ancestor_ids(i)]
+
+    def get_folder_path(self, folder_name):
+        """Get a folder's name prefixed by its ancestors, e.g. bills/electricity"""
+        folder_id = self.get_folder_id(folder_name)
+        if folder_id is None:
+            return folder_name
+        names = self.get_folder_names()
+        path = [names[i] for i in reversed(self.get_ancestor_ids(folder_id))]
+        return '/'.join(path + [folder_name])
+
+    def get_folder_names(self):
+        """Get the folder dictionary
+
+        Returns:
+            dict: Folder ID -> folder name (shared with the cache; don't modify it)
+        """
+        self._refresh()
+        return self._names
+
+    def decode(self, folder_ids):
+        """Turn folder IDs into a categorical of folder names
+
+        The IDs are used as the category codes directly, so no string is
+        materialized per row. IDs of deleted folders get a placeholder name.
+        """
+        names = self.get_folder_names()
+        size = max([int(folder_ids.max()) + 1 if len(folder_ids) else 0] + [i + 1 for i in names])
+        categories = [names.get(i, f"Deleted folder #{i}") for i in range(size)]
+        return pd.Categorical.from_codes(pd.Series(folder_ids).to_numpy(), categories=categories)
+
     def get_spending_limit(self, folder_name):
         """Get spending limit for a folder
         
         Returns:
             float: Spending limit (0 means no limit set)
         """
-        folders = pd.read_csv(self.folders_file)
-        # Ensure spending_limit column exists
-        if 'spending_limit' not in folders.columns:
-            folders['spending_limit'] = 0.0
-            folders.to_csv(self.folders_file, index=False)
-            
-        if folder_name in folders['folder_name'].values:
-            folder = folders[folders['folder_name'] == folder_name]
-            return float(folder['spending_limit'].values[0])
+        self._refresh()
+        if folder_name in self._limits:
+            limit = float(self._limits[folder_name][0])
+            # A blank limit cell means no limit, like 0
+            return 0.0 if pd.isna(limit) else limit
         return 0.0
     
-    def set_spending_limit(self, folder_name, limit):
+    def get_limit_period(self, folder_name):
+        """Get the budget period a folder's spending limit applies to
+        
+        Returns:
+            str: 'monthly', 'weekly', 'fortnightly' or 'days:N'
+        """
+        self._refresh()
+        period = self._limits.get(folder_name, (0.0, DEFAULT_PERIOD))[1]
+        if not is_valid_period(period):
+            return DEFAULT_PERIOD
+        return period
+    
+    def set_spending_limit(self, folder_name, limit, period=None):
         """Set spending limit for a folder
         
         Args:
             folder_name: Name of the folder
             limit: Spending limit (0 = no limit)
+            period: Budget period the limit applies to: 'monthly', 'weekly',
+                'fortnightly' or 'days:N' for a rolling N-day window
+                (None keeps the current period)
             
         Returns:
             bool: True if successful, False if folder not found
         """
-        folders = pd.read_csv(self.folders_file)
-        # Ensure spending_limit column exists
-        if 'spending_limit' not in folders.columns:
-            folders['spending_limit'] = 0.0
-            
-        if folder_name in folders['folder_name'].values:
-            folders.loc[folders['folder_name'] == folder_name, 'spending_limit'] = float(limit)
-            folders.to_csv(self.folders_file, index=False)
-            return True
-        return False
\ No newline at end of file
+        if period is not None and not is_valid_period(period):
+            raise ValueError(f"Unknown budget period: {period}")
+        with file_lock(self.folders_file):
+            folders = self._read_folders()
+            if folder_name in folders['folder_name'].values:
+                folders.loc[folders['folder_name'] == folder_name, 'spending_limit'] = float(limit)
+                if period is not None:
+                    folders.loc[folders['folder_name'] == folder_name, 'limit_period'] = period
+                self._write_folders(folders)
+                return True
+            return False
\ No newline at end of file
@@ -0,0 +1,101 @@
+import calendar
+import numpy as np
+import pandas as pd
+from datetime import date
+from utils.budget_periods import month_number
+
+# Prior months whose spending after the same day of the month is averaged
+HISTORY_MONTHS = 6
+# Bounds on the seasonal factor (same month last year vs. that year's average)
+SEASONAL_CLIP = (0.5, 2.0)
+
+
+def forecast_month_end(rollups, folder_ids, today=None, history_months=HISTORY_MONTHS):
+    """Forecast each folder's spending by the end of the current month
+
+    Two estimates of the rest of the month are blended: the current month's
+    daily rate so far, and what was spent after the same day of the month in
+    recent months, scaled by how this calendar month compared with its year
+    last year. The current rate gets more weight as the month goes on.
+
+    The daily rollups are scattered once into a folder x month grid, and
+    folder totals include sub-folders through one product with the tree's
+    ancestor matrix, so every folder is forecast in a single vectorized pass.
+
+    Args:
+        rollups: SpendingRollups with the folder tree set
+        folder_ids: Folder IDs to forecast
+        today: Day to forecast from (defaults to today)
+        history_months: Number of prior months to learn from
+
+    Returns:
+        DataFrame: Indexed by folder_id, with spent (so far this month),
+        forecast (by month end) and days_left columns
+    """
+    today = today or date.today()
+    folder_ids = [int(folder_id) for folder_id in folder_ids]
+    positions = {folder_id: i for i, folder_id in enumerate(folder_ids)}
+    months = max(history_months, 12) + 1
+    current = month_number(today.year, today.month)
+    first = current - months + 1
+
+    # Every folder's spending, in total and up to today's day of the month,
+    # for each month of the window (the last column is the current month)
+    month_totals = np.zeros((len(folder_ids), months))
+    to_day = np.zeros((len(folder_ids), months))
+    if rollups.daily:
+        keys, amounts = zip(*rollups.daily.items())
+        folders = np.array([positions.get(folder_id, -1) for folder_id, _ in keys])
+        columns = np.array([month_number(day.year, day.month) - first for _, day in keys])
+        days = np.array([day.day for _, day in keys])
+        amounts = np.array(amounts, dtype=float)
+        keep = (folders >= 0) & (columns >= 0) & (columns < months)
+        np.add.at(month_totals, (folders[keep], columns[keep]), amounts[keep])
+        early = keep & (days <= today.day)
+        np.add.at(to_day, (folders[early], columns[early]), amounts[early])
+
+    # Roll each folder's spending up into every folder above it
+    tree = np.eye(len(folder_ids))
+    for folder_id in folder_ids:
+        for ancestor_id in rollups._path_to_root(folder_id)[1:]:
+            if ancestor_id in positions:
+                tree[positions[ancestor_id], positions[folder_id]] = 1.0
+    month_totals = tree @ month_totals
+    to_day = tree @ to_day
+
+    days_in_month = calendar.monthrange(today.year, today.month)[1]
+    days_left = days_in_month - today.day
+    spent = to_day[:, -1]
+    pace_rest = spent / today.day * days_left
+
+    # Spending after today's day of the month in recent months, rescaled to
+    # the days left in this one. Months before any spending was recorded
+    # are left out rather than counted as zero.
+    prior = slice(months - 1 - history_months, months - 1)
+    calendar_months = [divmod(first + column, 12) for column in range(months)]
+    calendar_months = [(year, month + 1) for year, month in calendar_months][prior]
+    lengths = np.array([calendar.monthrange(year, month)[1] for year, month in calendar_months])
+    rest_days = np.maximum(lengths - today.day, 0)
+    scale = np.divide(days_left, rest_days, out=np.zeros(len(rest_days)), where=rest_days > 0)
+    recorded = np.array([rollups.monthly_total.get(key, 0.0) != 0 for key in calendar_months], dtype=bool)
+    history_rest = ((month_totals[:, prior] - to_day[:, prior]) * scale)[:, recorded]
+    has_history = history_rest.shape[1] > 0
+
+    # Seasonality: this calendar month last year against the average of the
+    # twelve months that followed it
+    last_year = month_totals[:, months - 13]
+    year_average = month_totals[:, months - 13:months - 1].mean(axis=1)
+    seasonal = np.divide(last_year, year_average, out=np.ones(len(folder_ids)),
+                         where=(last_year > 0) & (year_average > 0))
+    seasonal = np.clip(seasonal, *SEASONAL_CLIP)
+
+    if has_history:
+        weight = today.day / days_in_month
+        rest = weight * pace_rest + (1 - weight) * history_rest.mean(axis=1) * seasonal
+    else:
+        rest = pace_rest
+
+    return pd.DataFrame(
+        {'spent': spent, 'forecast': spent + np.maximum(rest, 0.0), 'days_left': days_left},
+        index=pd.Index(folder_ids, name='folder_id')
+    )
@@ -0,0 +1,538 @@
+import pandas as pd
+import atexit
+import os
+import threading
+from utils.storage import AppendLog, SegmentedStore, file_lock
+from utils.rollups import SpendingRollups
+from utils.anomaly import AmountStats
+from utils.sketches import AmountSketches
+from utils.cube import SpendingCube
+from utils.forecast import forecast_month_end
+from utils.backtest import backtest_limits
+from utils.warm_start import WarmStart
+from utils.folder_manager import FolderManager
+from utils.merchant_registry import MerchantRegistry
+from utils.tag_index import TagIndex, TAG_SEPARATOR
+from utils.splits import SPLIT_SEPARATOR, allocate
+
+TRANSACTION_COLUMNS = ['folder_id', 'amount', 'merchant_id', 'notes', 'timestamp', 'id', 'tags', 'splits']
+# `cleared` lists fields an update empties, separated by CLEARED_SEPARATOR,
+# since an empty field in a patch means "unchanged"
+PATCH_COLUMNS = ['id', 'op', 'folder_id', 'amount', 'merchant_id', 'notes', 'timestamp', 'tags', 'splits', 'cleared']
+# Fields that can be emptied (tags and splits have their own empty values)
+CLEARABLE_FIELDS = ['notes']
+CLEARED_SEPARATOR = '|'
+_CLEARED = object()
+EDITABLE_FIELDS = ['folder_id', 'amount', 'merchant_id', 'notes', 'timestamp', 'tags', 'splits']
+# Dictionary-encoded fields, stored as int32 codes
+ID_FIELDS = ['folder_id', 'merchant_id']
+
+
+def _parse(records):
+    """Type the columns of freshly read log records"""
+    records = records.copy()
+    if 'timestamp' in records.columns:
+        records['timestamp'] = pd.to_datetime(records['timestamp'], format='mixed')
+    if 'amount' in records.columns:
+        records['amount'] = pd.to_numeric(records['amount'], errors='coerce')
+    for field in ID_FIELDS:
+        if field in records.columns:
+            # Nullable, since a patch leaves fields it doesn't change empty
+            records[field] = pd.to_numeric(records[field]).astype('Int32')
+    return records
+
+
+def _index(records):
+    """Type transaction records and index them by id"""
+    # Records written before tags and splits existed have no such fields
+    transactions = _parse(records).set_index('id').reindex(columns=EDITABLE_FIELDS)
+    transactions['tags'] = transactions['tags'].fillna(TAG_SEPARATOR).astype(object)
+    transactions['splits'] = transactions['splits'].fillna(SPLIT_SEPARATOR).astype(object)
+    return transactions.astype({field: 'int32' for field in ID_FIELDS})
+
+
+def _append_rows(transactions, rows, trackers=()):
+    """Append new transaction records to the id-indexed frame"""
+    if rows.empty:
+        return transactions
+    rows = _index(rows)
+    for tracker in trackers:
+        tracker.add_transactions(rows)
+    if transactions.empty:
+        return rows
+    return pd.concat([transactions, rows])
+
+
+def _apply_patches(transactions, patches, trackers=()):
+    """Fold patch and tombstone records into the id-indexed frame
+
+    Applying a patch sets fields to absolute values, so replaying the same
+    patch twice is harmless.
+    """
+    if patches.empty:
+        return transactions
+    patches = _parse(patches)
+    patches = patches[patches['id'].isin(transactions.index)]
+    if patches.empty:
+        return transactions
+
+    affected = patches['id'].unique()
+    for tracker in trackers:
+        tracker.add_transactions(transactions.loc[affected], sign=-1)
+
+    # Last non-empty value per field wins; a field listed in `cleared`
+    # counts as set to empty
+    updates = patches[patches['op'] == 'update']
+    if 'cleared' in updates.columns and updates['cleared'].notna().any():
+        updates = updates.copy()
+        cleared = updates['cleared'].fillna('').str.split(CLEARED_SEPARATOR)
+        for field in CLEARABLE_FIELDS:
+            emptied = cleared.map(lambda fields: field in fields)
+            updates[field] = updates[field].astype(object).mask(emptied, _CLEARED)
+    updates = updates.groupby('id')[EDITABLE_FIELDS].last()
+    for field in EDITABLE_FIELDS:
+        changed = updates[field].dropna()
+        if field in ID_FIELDS:
+            changed = changed.astype('int32')
+        if field in CLEARABLE_FIELDS:
+            changed = changed.map(lambda value: None if value is _CLEARED else value)
+        if not changed.empty:
+            transactions.loc[changed.index, field] = changed
+
+    # Archived transactions leave the ledger just like deleted ones
+    deleted = patches.loc[patches['op'].isin(['delete', 'archive']), 'id'].unique()
+    transactions = transactions.drop(index=deleted)
+
+    remaining = transactions.index.intersection(affected)
+    for tracker in trackers:
+        tracker.add_transactions(transactions.loc[remaining])
+    return transactions
+
+
+def _fold(state, records):
+    """Fold one sealed segment of both logs into snapshot state"""
+    transactions = _index(state) if not state.empty else state.set_index('id')[EDITABLE_FIELDS]
+    transactions = _append_rows(transactions, records['transactions'])
+    transactions = _apply_patches(transactions, records['patches'])
+    return transactions.reset_index()
+
+
+class Ledger:
+    """In-memory view of the transaction log merged with its patch log
+
+    `transactions.csv` only ever gets new rows appended, and edits, moves and
+    deletes are appended to `transaction_patches.csv` as patch and tombstone
+    records. Both are periodically compacted into a snapshot (see
+    SegmentedStore). The ledger loads the snapshot plus whatever was logged
+    after it, then tails the live logs so each sync only parses what was
+    written since the last one, keeping the spending rollups up to date as
+    records arrive.
+    """
+
+    def __init__(self, transactions_file, patches_file, snapshot_file, warm_start_dir=None):
+        # Dictionaries behind the folder_id and merchant_id columns
+        self.folder_manager = FolderManager()
+        self.merchant_registry = MerchantRegistry()
+        self._migrate_legacy_file(transactions_file)
+        self.transactions_log = AppendLog(transactions_file, TRANSACTION_COLUMNS, dtype={'id': str, 'tags': str, 'splits': str})
+        self.patches_log = AppendLog(patches_file, PATCH_COLUMNS, dtype={'id': str, 'tags': str, 'splits': str, 'cleared': str})
+        # Patches are read before transactions: any patch we see was written
+        # after the transaction it refers to, so that row is in the same read.
+        self.store = SegmentedStore(
+            {'patches': self.patches_log, 'transactions': self.transactions_log},
+            snapshot_file,
+            TRANSACTION_COLUMNS,
+            _fold,
+        )
+        # Typed copy of the in-memory state so a new process can skip the
+        # snapshot load, the log replay and the rollup rebuild
+        self.warm_start = WarmStart(warm_start_dir or os.path.join(os.path.dirname(snapshot_file), 'warm'))
+        self.store.on_compact.append(self._after_compaction)
+        self._migrate_names()
+        self._lock = threading.RLock()
+        self._clear()
+
+    @staticmethod
+    def _migrate_legacy_file(transactions_file):
+        """Give transactions written before IDs existed their row number as ID"""
+        if not os.path.exists(transactions_file):
+            return
+        with file_lock(transactions_file):
+            with open(transactions_file, encoding='utf-8') as f:
+                header = f.readline().strip().split(',')
+            if 'id' in header or header == ['']:
+                return
+            transactions = pd.read_csv(transactions_file)
+            transactions['id'] = [str(i) for i in range(len(transactions))]
+            transactions.reindex(columns=[c for c in transactions.columns if c != 'id'] + ['id']).to_csv(transactions_file, index=False)
+
+    def _encode_names(self, records, fill_merchant):
+        """Replace folder and merchant name columns with their dictionary IDs"""
+        records = records.copy()
+        if 'folder' in records.columns:
+            ids = {name: self.folder_manager.ensure_folder(name) for name in records['folder'].dropna().unique()}
+            records['folder_id'] = records['folder'].map(ids).astype('Int32')
+        if 'merchant' in records.columns:
+            merchants = records['merchant'].fillna('') if fill_merchant else records['merchant']
+            ids = {name: self.merchant_registry.get_merchant_id(name) for name in merchants.dropna().unique()}
+            records['merchant_id'] = merchants.map(ids).astype('Int32')
+        return records
+
+    def _migrate_names(self):
+        """Convert logs, segments and the snapshot written with folder and
+        merchant names to the ID-encoded layout"""
+        for name, log in (('transactions', self.transactions_log), ('patches', self.patches_log)):
+            paths = [log.path] + [log.segment_path(sequence) for sequence in log.sealed_sequences()]
+            for path in paths:
+                with file_lock(path):
+                    with open(path, encoding='utf-8') as f:
+                        header = f.readline().strip().split(',')
+                    if 'folder' not in header and 'merchant' not in header:
+                        continue
+                    records = pd.read_csv(path, dtype={'id': str, 'op': str, 'notes': str, 'timestamp': str})
+                    records = self._encode_names(records, fill_merchant=(name == 'transactions'))
+                    temp_path = f"{path}.tmp"
+                    records.reindex(columns=log.columns).to_csv(temp_path, index=False)
+                    os.replace(temp_path, path)
+
+        snapshot = self.store.snapshot
+        with file_lock(snapshot.path):
+            state, generation = snapshot.read()
+            if state is not None and 'folder' in state.columns:
+                state = self._encode_names(state, fill_merchant=True)
+                snapshot.write(state.reindex(columns=TRANSACTION_COLUMNS).astype({field: 'int32' for field in ID_FIELDS}), generation)
+
+    def _clear(self):
+        self.transactions = pd.DataFrame(columns=EDITABLE_FIELDS, index=pd.Index([], name='id', dtype=str))
+        self.transactions['timestamp'] = pd.to_datetime(self.transactions['timestamp'])
+        self.transactions = self.transactions.astype({field: 'int32' for field in ID_FIELDS})
+        self.rollups = SpendingRollups()
+        self.amount_stats = AmountStats()
+        self.amount_sketches = AmountSketches()
+        self.cube = SpendingCube()
+        self._slices = {}
+        self._slices_version = None
+        self.tag_index = TagIndex()
+        self._cursors = None
+
+    def data_version(self):
+        """Describe which log contents the in-memory state reflects
+
+        Returns:
+            dict: Snapshot generation, pending sealed segments and the
+            (inode, offset) cursor of each live log
+        """
+        with self._lock:
+            return {
+                'generation': self.store.snapshot.generation(),
+                'sealed': self.store.sealed_sequences(),
+                'patches': list(self._cursors['patches']) if self._cursors else None,
+                'transactions': list(self._cursors['transactions']) if self._cursors else None
+            }
+
+    def _load_warm_state(self):
+        """Adopt the saved warm state if it is a prefix of the current logs
+
+        Returns:
+            bool: True if the warm state was adopted
+        """
+        saved = self.warm_start.load()
+        if saved is None:
+            return False
+        frames, version = saved
+
+        # The snapshot and sealed segments must be exactly as they were, and
+        # the live logs the same files, at least as long as when saved
+        if (version.get('generation') != self.store.snapshot.generation()
+                or version.get('sealed') != self.store.sealed_sequences()):
+            return False
+        for name, log in (('patches', self.patches_log), ('transactions', self.transactions_log)):
+            inode, size = log.version()
+            if not version.get(name) or version[name][0] != inode or version[name][1] > size:
+                return False
+
+        transactions = frames['transactions']
+        self.transactions = _index(transactions) if not transactions.empty else self.transactions
+        self.rollups = SpendingRollups.from_frame(frames['rollups'])
+        self.amount_stats = AmountStats.from_transactions(self.transactions)
+        self.amount_sketches = AmountSketches.from_frames(frames)
+        self.cube = SpendingCube.from_frame(frames['cube'])
+        self.tag_index = TagIndex.from_frames(frames)
+        self._cursors = {'patches': tuple(version['patches']), 'transactions': tuple(version['transactions'])}
+        return True
+
+    def save_warm_state(self):
+        """Write the current in-memory state for the next process to start from"""
+        try:
+            with self._lock:
+                self.sync()
+                self.warm_start.save(
+                    {
+                        'transactions': self.transactions.reset_index(),
+                        'rollups': self.rollups.to_frame(),
+                        'cube': self.cube.to_frame(),
+                        **self.amount_sketches.to_frames(),
+                        **self.tag_index.to_frames()
+                    },
+                    self.data_version()
+                )
+        except Exception as e:
+            print(f"Error saving warm state: {str(e)}")
+
+    def _after_compaction(self):
+        """Reload from the new snapshot and refresh the warm state to match it"""
+        with self._lock:
+            self._cursors = None
+            self.save_warm_state()
+
+    def _load(self, warm=True):
+        """Load the snapshot, replay everything logged after it and rebuild rollups
+
+        Args:
+            warm: Start from the saved warm state when it is still valid
+        """
+        self._clear()
+        if warm and self._load_warm_state():
+            # Only what was logged after the warm state was saved is replayed
+            self._sync_tail()
+            return
+        state, live = self.store.load()
+        transactions = _index(state) if not state.empty else self.transactions
+        patches, patches_cursor = live['patches']
+        new_rows, transactions_cursor = live['transactions']
+        transactions = _append_rows(transactions, new_rows)
+        self.transactions = _apply_patches(transactions, patches)
+        self.rollups = SpendingRollups.from_transactions(self.transactions)
+        self.amount_stats = AmountStats.from_transactions(self.transactions)
+        self.amount_sketches = AmountSketches.from_transactions(self.transactions)
+        self.cube = SpendingCube.from_transactions(self.transactions)
+        self.tag_index = TagIndex.from_transactions(self.transactions)
+        self._cursors = {'patches': patches_cursor, 'transactions': transactions_cursor}
+
+    def sync(self):
+        """Bring the in-memory state up to date with the log files
+
+        Returns:
+            Ledger: self, for chaining
+        """
+        with self._lock:
+            patches_version, transactions_version = self.patches_log.version(), self.transactions_log.version()
+            if (self._cursors is None
+                    or patches_version[0] != self._cursors['patches'][0]
+                    or transactions_version[0] != self._cursors['transactions'][0]):
+                # First use, or the live logs were sealed by compaction
+                self._load()
+                return self
+            if (patches_version == tuple(self._cursors['patches'])
+                    and transactions_version == tuple(self._cursors['transactions'])):
+                # Nothing appended since the last sync
+                return self
+
+            self._sync_tail()
+        return self
+
+    def _sync_tail(self):
+        """Apply whatever was appended to the live logs since the last sync"""
+        patches, patches_cursor = self.patches_log.read_since(self._cursors['patches'][1])
+        new_rows, transactions_cursor = self.transactions_log.read_since(self._cursors['transactions'][1])
+        if patches_cursor[0] != self._cursors['patches'][0] or transactions_cursor[0] != self._cursors['transactions'][0]:
+            # Compaction sealed a log between the version check and the read
+            self._cursors = None
+            self._load()
+            return
+
+        trackers = (self.rollups, self.amount_stats, self.amount_sketches, self.cube)
+        self.transactions = _append_rows(self.transactions, new_rows, trackers)
+        self.transactions = _apply_patches(self.transactions, patches, trackers)
+        self.amount_sketches.refresh(self.transactions)
+        self._cursors = {'patches': patches_cursor, 'transactions': transactions_cursor}
+
+        # Re-index the tags of just the rows that were added or patched
+        for transaction_id in set(new_rows['id']) | set(patches['id']):
+            if transaction_id in self.transactions.index:
+                self.tag_index.set_tags(transaction_id, self.transactions.at[transaction_id, 'tags'])
+            else:
+                self.tag_index.remove(transaction_id)
+
+    def rebuild(self):
+        """Rebuild the transactions, rollups and indexes from the snapshot and
+        logs, bypassing the warm state, then save a fresh warm state
+
+        Returns:
+            int: Number of transactions loaded
+        """
+        with self._lock:
+            self._load(warm=False)
+            self.save_warm_state()
+            return len(self.transactions)
+
+    def frame(self):
+        """Get a copy of the merged transactions with an `id` column
+
+        Folder and merchant names are added as categoricals decoded from
+        the ID columns, so each distinct name is held once.
+        """
+        with self._lock:
+            self.sync()
+            transactions = self.transactions.reset_index()
+        transactions['folder'] = self.folder_manager.decode(transactions['folder_id'])
+        transactions['merchant'] = self.merchant_registry.decode(transactions['merchant_id'])
+        return transactions
+
+    def tree_rollups(self):
+        """Get the synced rollups with subtree totals for the current folder tree"""
+        parents = self.folder_manager.get_parents()
+        with self._lock:
+            self.sync()
+            self.rollups.set_tree(parents)
+            return self.rollups
+
+    def rolling_spend(self, today=None):
+        """Get the rolling window totals, moved forward to end on `today`
+
+        Returns:
+            dict: (folder_id or None for all folders, window days) -> amount
+        """
+        with self._lock:
+            self.sync()
+            self.rollups.advance_rolling(today)
+            return dict(self.rollups.rolling)
+
+    def month_end_forecast(self, today=None):
+        """Forecast every folder's spending by the end of the month (see forecast_month_end)"""
+        parents = self.folder_manager.get_parents()
+        folder_ids = list(self.folder_manager.get_folder_names())
+        with self._lock:
+            self.sync()
+            self.rollups.set_tree(parents)
+            return forecast_month_end(self.rollups, folder_ids, today)
+
+    def limit_backtest(self, folder_name, limits, today=None):
+        """Replay a folder's past months against candidate limits (see backtest_limits)"""
+        folder_id = self.folder_manager.get_folder_id(folder_name)
+        subtree = [self.folder_manager.get_folder_id(name) for name in self.folder_manager.get_descendant_names(folder_name)]
+        with self._lock:
+            self.sync()
+            return backtest_limits(self.rollups, [folder_id] + subtree, limits, today)
+
+    def score_amount(self, folder_id, merchant_id, amount):
+        """Check a payment against the running amount statistics (see AmountStats.score)"""
+        with self._lock:
+            self.sync()
+            return self.amount_stats.score(folder_id, merchant_id, amount)
+
+    def cube_slice(self, by, folder_ids=None, months=None):
+        """Sum the spending cube over the given dimensions (see SpendingCube.slice)
+
+        Slices are cached until the logs change, so rerunning the same view
+        doesn't even re-sum the cells.
+        """
+        with self._lock:
+            self.sync()
+            version = repr(self.data_version())
+            if version != self._slices_version:
+                self._slices = {}
+                self._slices_version = version
+            key = (tuple(by),
+                   tuple(folder_ids) if folder_ids is not None else None,
+                   tuple(months) if months is not None else None)
+            if key not in self._slices:
+                self._slices[key] = self.cube.slice(by, folder_ids, months)
+            return self._slices[key].copy()
+
+    def amount_distribution(self, key, month=None):
+        """Get sketched payment-size quantiles for every folder or merchant
+
+        Args:
+            key: 'folder_id' or 'merchant_id'
+            month: 'YYYY-MM' for one calendar month (None for all time)
+
+        Returns:
+            dict: ID -> AmountSketches.summary(), plus 'merchants' (distinct
+            merchants, approximate) for folders
+        """
+        with self._lock:
+            self.sync()
+            sketches = self.amount_sketches
+            ids = {group_id for sketch_key, group_id, period in sketches.quantiles if sketch_key == key and period == month}
+            distribution = {group_id: sketches.summary(key, group_id, month) for group_id in ids}
+            if key == 'folder_id':
+                for group_id, summary in distribution.items():
+                    summary['merchants'] = sketches.distinct_merchants(group_id, month)
+            return distribution
+
+    def tagged_ids(self, all_of=None, any_of=None):
+        """Get the IDs of transactions with every tag in `all_of` and at
+        least one tag in `any_of`, from the tag bitmaps"""
+        with self._lock:
+            self.sync()
+            return self.tag_index.ids_for(self.tag_index.match(all_of, any_of))
+
+    def all_tags(self):
+        """Get every tag in use"""
+        with self._lock:
+            self.sync()
+            return self.tag_index.all_tags()
+
+    def allocations(self, extra=()):
+        """Get the current transactions spread over the folders they are
+        allocated to (see allocate): id, folder_id, amount and timestamp,
+        plus any `extra` columns of the transactions they come from"""
+        with self._lock:
+            self.sync()
+            allocations = allocate(self.transactions)
+            for column in extra:
+                allocations[column] = allocations['id'].map(self.transactions[column])
+            return allocations
+
+    def count(self):
+        """Number of transactions in the ledger"""
+        with self._lock:
+            self.sync()
+            return len(self.transactions)
+
+    def split_transactions(self):
+        """Get a copy of the transactions that are split across folders, indexed by id"""
+        with self._lock:
+            self.sync()
+            return self.transactions[self.transactions['splits'] != SPLIT_SEPARATOR].copy()
+
+    def get_transaction(self, transaction_id):
+        """Get the current stored fields of one transaction
+
+        Returns:
+            dict: EDITABLE_FIELDS values, or None if there is no such transaction
+        """
+        with self._lock:
+            self.sync()
+            if transaction_id not in self.transactions.index:
+                return None
+            return self.transactions.loc[transaction_id].to_dict()
+
+    def folder_rows(self, folder_id):
+        """Get a copy of the current transactions in one folder, indexed by id"""
+        with self._lock:
+            self.sync()
+            return self.transactions[self.transactions['folder_id'] == folder_id].copy()
+
+
+_ledgers = {}
+_ledgers_guard = threading.Lock()
+
+
+def get_ledger(transactions_file="data/transactions.csv",
+               patches_file="data/transaction_patches.csv",
+               snapshot_file="data/snapshots/transactions.feather"):
+    """Get the process-wide ledger for a set of log files
+
+    All sessions in a Streamlit process share one ledger, so the logs are
+    loaded once per process and then only tailed.
+    """
+    key = (os.path.abspath(transactions_file), os.path.abspath(patches_file))
+    with _ledgers_guard:
+        if key not in _ledgers:
+            ledger = Ledger(transactions_file, patches_file, snapshot_file)
+            # Leave warm state behind for the next worker on shutdown
+            atexit.register(ledger.save_warm_state)
+            _ledgers[key] = ledger
+        return _ledgers[key]
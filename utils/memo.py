@@ -0,0 +1,89 @@
+import copy
+import functools
+import sys
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+# Default cap on the memory held by cached results
+MEMO_MAX_BYTES = 64 * 1024 * 1024
+MEMO_MAX_ENTRIES = 256
+
+
+def _sizeof(value):
+    """Rough size in bytes of a cached value"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_sizeof(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_sizeof(item) for item in value)
+    return sys.getsizeof(value)
+
+
+def _freeze(value):
+    """Turn filter arguments into something hashable"""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, set):
+        return tuple(sorted(value))
+    return value
+
+
+class MemoCache:
+    """Least-recently-used cache with caps on entries and on total size
+
+    Keys should include the data version, so an entry is never stale: once
+    the data changes, old entries are simply never asked for again and get
+    evicted as new ones come in.
+    """
+
+    def __init__(self, max_bytes=MEMO_MAX_BYTES, max_entries=MEMO_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.entries = OrderedDict()    # key -> (value, size)
+        self.size = 0
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        """Get the value cached for a key, computing and caching it if missing
+
+        Cached values are copied on the way out, so callers may modify them.
+        """
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return copy.deepcopy(self.entries[key][0])
+        value = compute()
+        size = _sizeof(value)
+        with self._lock:
+            if size <= self.max_bytes:
+                if key in self.entries:
+                    self.size -= self.entries.pop(key)[1]
+                self.entries[key] = (value, size)
+                self.size += size
+                while self.size > self.max_bytes or len(self.entries) > self.max_entries:
+                    _, (_, evicted) = self.entries.popitem(last=False)
+                    self.size -= evicted
+        return copy.deepcopy(value)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.size = 0
+
+
+def memoized(method):
+    """Cache a method's results by its arguments and the owner's data version
+
+    The owner needs a `memo` MemoCache and a `data_version()` method.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = (method.__name__, self.data_version(), _freeze(args), _freeze(kwargs))
+        return self.memo.get_or_compute(key, lambda: method(self, *args, **kwargs))
+    return wrapper
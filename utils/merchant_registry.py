@@ -0,0 +1,64 @@
+import pandas as pd
+import threading
+from utils.storage import AppendLog, file_lock
+
+MERCHANT_COLUMNS = ['merchant_id', 'merchant']
+
+
+class MerchantRegistry:
+    """Dictionary of merchant names, each given a dense integer ID
+
+    Transactions store the ID instead of repeating the name on every row.
+    Merchants are only ever added, so the registry is an append log and a
+    merchant's ID is the order it was first seen in.
+    """
+
+    def __init__(self, merchants_file="data/merchants.csv"):
+        self.merchants_file = merchants_file
+        self.log = AppendLog(merchants_file, MERCHANT_COLUMNS, dtype={'merchant': str})
+        self._ids = {}
+        self._names = []
+        self._offset = 0
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        """Pick up merchants registered by other processes since the last read"""
+        records, (_, self._offset) = self.log.read_since(self._offset)
+        for merchant_id, name in records[MERCHANT_COLUMNS].itertuples(index=False):
+            name = '' if pd.isna(name) else name
+            self._ids[name] = int(merchant_id)
+            while len(self._names) <= int(merchant_id):
+                self._names.append(None)
+            self._names[int(merchant_id)] = name
+
+    def get_merchant_id(self, merchant, create=True):
+        """Get the ID of a merchant
+
+        Args:
+            merchant: Merchant name
+            create: Register the merchant if it is new
+
+        Returns:
+            int: Merchant ID, or None if unknown and create is False
+        """
+        merchant = '' if pd.isna(merchant) else str(merchant)
+        with self._lock:
+            if merchant in self._ids:
+                return self._ids[merchant]
+            with file_lock(self.merchants_file):
+                self._refresh()
+                if merchant not in self._ids and create:
+                    self.log.append({'merchant_id': len(self._names), 'merchant': merchant})
+                    self._refresh()
+            return self._ids.get(merchant)
+
+    def get_merchant_names(self):
+        """Get all merchant names, indexed by ID"""
+        with self._lock:
+            self._refresh()
+            return list(self._names)
+
+    def decode(self, merchant_ids):
+        """Turn merchant IDs into a categorical of merchant names"""
+        names = self.get_merchant_names()
+        return pd.Categorical.from_codes(pd.Series(merchant_ids).to_numpy(), categories=pd.Index(names).fillna(''))
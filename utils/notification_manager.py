@@ -1,21 +1,81 @@
 import pandas as pd
 import os
+import uuid
 from datetime import datetime
+from utils.storage import AppendLog, SegmentedStore, file_lock
+
+NOTIFICATION_COLUMNS = ['timestamp', 'type', 'message', 'read', 'id']
+READ_MARKER_COLUMNS = ['id', 'timestamp']
+ALL_NOTIFICATIONS = '*'
+
+
+def _fold(state, records):
+    """Fold new notifications and read markers into notification state
+
+    A read marker either names a single notification ID or, for
+    mark-all-as-read, carries the ID '*' and marks everything created up to
+    its timestamp.
+    """
+    notifications = records['notifications']
+    if not notifications.empty:
+        notifications = notifications.copy()
+        notifications['timestamp'] = pd.to_datetime(notifications['timestamp'], format='mixed')
+        notifications['read'] = notifications['read'].astype(str) == 'True'
+        state = notifications if state.empty else pd.concat([state, notifications], ignore_index=True)
+
+    markers = records['reads']
+    if not markers.empty and not state.empty:
+        state = state.copy()
+        read = state['read'].astype(bool) | state['id'].isin(markers['id'])
+        read_all = markers.loc[markers['id'] == ALL_NOTIFICATIONS, 'timestamp']
+        if not read_all.empty:
+            latest = pd.to_datetime(read_all, format='mixed').max()
+            read = read | (pd.to_datetime(state['timestamp']) <= latest)
+        state['read'] = read
+    return state
+
 
 class NotificationManager:
     def __init__(self):
         self.notifications_file = "data/notifications.csv"
+        self.read_markers_file = "data/notification_reads.csv"
+        self.snapshot_file = "data/snapshots/notifications.feather"
         self._initialize_storage()
     
     def _initialize_storage(self):
-        """Initialize the notifications storage file if it doesn't exist"""
+        """Initialize the notification and read marker logs if they don't exist"""
         if not os.path.exists(os.path.dirname(self.notifications_file)):
             os.makedirs(os.path.dirname(self.notifications_file))
-            
+        
+        self._migrate_legacy_file()
+        self.notifications_log = AppendLog(self.notifications_file, NOTIFICATION_COLUMNS, dtype={'id': str})
+        self.read_markers_log = AppendLog(self.read_markers_file, READ_MARKER_COLUMNS, dtype={'id': str})
+        # Read markers are read before notifications so every marker we see
+        # refers to a notification in the same read
+        self.store = SegmentedStore(
+            {'reads': self.read_markers_log, 'notifications': self.notifications_log},
+            self.snapshot_file,
+            NOTIFICATION_COLUMNS,
+            _fold,
+        )
+    
+    def _migrate_legacy_file(self):
+        """Give notifications written before IDs existed their row number as ID"""
         if not os.path.exists(self.notifications_file):
-            # Create empty file with headers
-            df = pd.DataFrame(columns=['timestamp', 'type', 'message', 'read'])
-            df.to_csv(self.notifications_file, index=False)
+            return
+        with file_lock(self.notifications_file):
+            with open(self.notifications_file, encoding='utf-8') as f:
+                header = f.readline().strip().split(',')
+            if 'id' in header or header == ['']:
+                return
+            notifications = pd.read_csv(self.notifications_file)
+            notifications['id'] = [str(i) for i in range(len(notifications))]
+            notifications.reindex(columns=NOTIFICATION_COLUMNS).to_csv(self.notifications_file, index=False)
+    
+    def _load(self):
+        """Load the snapshot and replay the notifications and markers logged after it"""
+        state, live = self.store.load()
+        return _fold(state, {name: records for name, (records, _) in live.items()})
     
     def add_limit_exceeded_notification(self, folder_name, current_amount, limit):
         """Add a notification when a user exceeds a spending limit
@@ -29,11 +89,40 @@ class NotificationManager:
         
         self.add_notification("limit_exceeded", message)
         
+    def add_projected_overrun_notification(self, folder_name, forecast, limit):
+        """Add a notification when a folder is on course to exceed its monthly limit
+        
+        Args:
+            folder_name: The folder projected to exceed its limit
+            forecast: Projected spending by the end of the month
+            limit: The monthly limit
+        """
+        message = f"📈 '{folder_name}' is on course to exceed its limit: about ₹{forecast:.2f} by the end of the month against your ₹{limit:.2f} limit."
+        
+        self.add_notification("projected_overrun", message)
+        
+    def add_anomaly_notification(self, merchant, folder_name, amount, findings):
+        """Add a notification for an unusually large payment
+        
+        Args:
+            merchant: Merchant that was paid
+            folder_name: Folder the payment went to
+            amount: Payment amount
+            findings: Output of Analytics.check_anomaly()
+        """
+        reasons = ", ".join(
+            f"{finding['ratio']:.1f}x the usual ₹{finding['typical']:.2f} for {'this merchant' if finding['scope'] == 'merchant' else f'{folder_name!r}'}"
+            for finding in findings
+        )
+        message = f"🔍 Unusual payment of ₹{amount:.2f} to {merchant}: {reasons}."
+        
+        self.add_notification("anomaly", message)
+        
     def add_notification(self, notification_type, message):
         """Add a generic notification
         
         Args:
-            notification_type: Type of notification (e.g., limit_exceeded, reminder)
+            notification_type: Type of notification (e.g., limit_exceeded, anomaly, reminder)
             message: The notification message
         """
         # Create notification entry
@@ -41,21 +130,13 @@ class NotificationManager:
             'timestamp': datetime.now(),
             'type': notification_type,
             'message': message,
-            'read': False
+            'read': False,
+            'id': uuid.uuid4().hex[:12]
         }
         
         try:
-            # Read existing notifications
-            if os.path.exists(self.notifications_file):
-                notifications = pd.read_csv(self.notifications_file)
-            else:
-                notifications = pd.DataFrame(columns=['timestamp', 'type', 'message', 'read'])
-            
-            # Append new notification
-            notifications = pd.concat([notifications, pd.DataFrame([notification])], ignore_index=True)
-            
-            # Save to file
-            notifications.to_csv(self.notifications_file, index=False)
+            # Append a single line instead of rewriting the whole file
+            self.notifications_log.append(notification)
             return True
         except Exception as e:
             print(f"Error adding notification: {str(e)}")
@@ -68,45 +149,38 @@ class NotificationManager:
             unread_only: If True, return only unread notifications
         
         Returns:
-            DataFrame containing notifications
+            DataFrame containing notifications, indexed by notification ID
         """
         try:
-            if os.path.exists(self.notifications_file):
-                notifications = pd.read_csv(self.notifications_file)
-                
-                # Convert timestamp to datetime
-                notifications['timestamp'] = pd.to_datetime(notifications['timestamp'])
-                
-                # Sort by newest first
-                notifications = notifications.sort_values('timestamp', ascending=False)
-                
-                if unread_only:
-                    return notifications[notifications['read'] == False]
-                return notifications
-            else:
+            notifications = self._load()
+            if notifications.empty:
                 return pd.DataFrame(columns=['timestamp', 'type', 'message', 'read'])
+            
+            # Convert timestamp to datetime
+            notifications['timestamp'] = pd.to_datetime(notifications['timestamp'])
+            
+            # Sort by newest first
+            notifications = notifications.sort_values('timestamp', ascending=False).set_index('id')
+            
+            if unread_only:
+                return notifications[notifications['read'] == False]
+            return notifications
         except Exception as e:
             print(f"Error getting notifications: {str(e)}")
             return pd.DataFrame(columns=['timestamp', 'type', 'message', 'read'])
     
-    def mark_as_read(self, notification_index):
+    def mark_as_read(self, notification_id):
         """Mark a notification as read
         
         Args:
-            notification_index: Index of the notification to mark as read
+            notification_id: ID of the notification to mark as read
         
         Returns:
             bool: True if successful, False otherwise
         """
         try:
-            notifications = pd.read_csv(self.notifications_file)
-            
-            # Check if index exists
-            if notification_index < len(notifications):
-                notifications.loc[notification_index, 'read'] = True
-                notifications.to_csv(self.notifications_file, index=False)
-                return True
-            return False
+            self.read_markers_log.append({'id': notification_id, 'timestamp': datetime.now()})
+            return True
         except Exception as e:
             print(f"Error marking notification as read: {str(e)}")
             return False
@@ -118,9 +192,7 @@ class NotificationManager:
             bool: True if successful, False otherwise
         """
         try:
-            notifications = pd.read_csv(self.notifications_file)
-            notifications['read'] = True
-            notifications.to_csv(self.notifications_file, index=False)
+            self.read_markers_log.append({'id': ALL_NOTIFICATIONS, 'timestamp': datetime.now()})
             return True
         except Exception as e:
             print(f"Error marking all notifications as read: {str(e)}")
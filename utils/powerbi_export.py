@@ -0,0 +1,189 @@
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as parquet
+import json
+import os
+import pandas as pd
+from datetime import datetime
+from utils.storage import file_lock
+
+# Bump when the layout of the export changes; a mismatch forces a full export
+EXPORT_FORMAT = 1
+EXPORT_FILE_FORMATS = ('csv', 'parquet')
+FACT_COLUMNS = ['transaction_id', 'date_key', 'folder_key', 'merchant_key', 'amount', 'timestamp', 'notes']
+# Files written by the earlier, flat export
+LEGACY_FILES = ['folders.csv', 'merchants.csv', 'transactions.csv']
+
+
+def date_key(timestamps):
+    """Integer YYYYMMDD keys for a Series of timestamps"""
+    return (timestamps.dt.year * 10000 + timestamps.dt.month * 100 + timestamps.dt.day).astype('int32')
+
+
+def date_dimension(start, end):
+    """One row per calendar day between two dates (inclusive)"""
+    days = pd.Series(pd.date_range(pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize(), freq='D'))
+    return pd.DataFrame({
+        'date_key': date_key(days),
+        'date': days.dt.date,
+        'year': days.dt.year,
+        'quarter': days.dt.quarter,
+        'month': days.dt.month,
+        'month_name': days.dt.strftime('%B'),
+        'year_month': days.dt.strftime('%Y-%m'),
+        'day': days.dt.day,
+        'weekday': days.dt.weekday + 1,
+        'weekday_name': days.dt.strftime('%A'),
+        'is_weekend': days.dt.weekday >= 5
+    })
+
+
+class PowerBIExport:
+    """Star-schema export that only writes what changed since the last run
+
+    The fact table has one row per transaction and folder it is allocated
+    to, keyed by integer folder, merchant and date keys into the dimension
+    tables. Facts are written as numbered, append-only partitions under
+    facts/; each row carries a `change` of insert, update or delete and the
+    partition's `export_sequence`, so the latest row per (transaction_id,
+    folder_key) is the current one. The small dimension tables are
+    rewritten each time.
+
+    The watermark is the ledger's data version at the last export plus a
+    hash of every exported fact row; an export with nothing new stops at
+    the version check, and otherwise only rows whose hash changed are
+    written. A manifest written last records the watermark.
+    """
+
+    def __init__(self, directory, file_format='csv'):
+        if file_format not in EXPORT_FILE_FORMATS:
+            raise ValueError(f"file_format must be one of {', '.join(EXPORT_FILE_FORMATS)}")
+        self.directory = directory
+        self.file_format = file_format
+        self.facts_directory = os.path.join(directory, 'facts')
+        self.manifest_path = os.path.join(directory, 'manifest.json')
+        self.hashes_path = os.path.join(directory, 'watermark.arrow')
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get('format') != EXPORT_FORMAT or manifest.get('file_format') != self.file_format:
+            return None
+        if not os.path.exists(self.hashes_path):
+            return None
+        return manifest
+
+    def _write_table(self, frame, path):
+        temp_path = f"{path}.tmp"
+        if self.file_format == 'parquet':
+            parquet.write_table(pa.Table.from_pandas(frame, preserve_index=False), temp_path)
+        else:
+            frame.to_csv(temp_path, index=False)
+        os.replace(temp_path, path)
+
+    def _reset(self):
+        """Remove the fact partitions, the dimensions and files of the earlier export layout"""
+        if os.path.exists(self.facts_directory):
+            for name in os.listdir(self.facts_directory):
+                os.remove(os.path.join(self.facts_directory, name))
+        dimensions = [f"dim_{table}.{extension}" for table in ('folder', 'merchant', 'date') for extension in EXPORT_FILE_FORMATS]
+        for name in LEGACY_FILES + dimensions:
+            path = os.path.join(self.directory, name)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def export(self, data_version, build, full=False):
+        """Write the dimensions and a partition of changed facts
+
+        Args:
+            data_version: JSON-serializable version of the data being exported
+            build: Function returning (facts, folders, merchants) DataFrames;
+                only called when the data version moved on
+            full: Start over with a single partition of every fact
+
+        Returns:
+            dict: partition (path, or None if nothing changed), inserted,
+            updated, deleted and sequence
+        """
+        # Compare as it will read back from the manifest (tuples become lists)
+        data_version = json.loads(json.dumps(data_version))
+        for path in (self.directory, self.facts_directory):
+            if not os.path.exists(path):
+                os.makedirs(path)
+
+        with file_lock(self.manifest_path):
+            manifest = None if full else self._read_manifest()
+            if manifest is not None and manifest['data_version'] == data_version:
+                return {'partition': None, 'inserted': 0, 'updated': 0, 'deleted': 0, 'sequence': manifest['sequence']}
+
+            facts, folders, merchants = build()
+            facts = facts.reset_index(drop=True)
+            keys = facts['transaction_id'].astype(str) + '|' + facts['folder_key'].astype(str)
+            hashes = pd.Series(pd.util.hash_pandas_object(facts[FACT_COLUMNS], index=False).to_numpy(), index=keys.to_numpy())
+
+            if manifest is None:
+                self._reset()
+                sequence = 1
+                previous = pd.Series(dtype='uint64')
+                date_range = None
+            else:
+                sequence = manifest['sequence'] + 1
+                saved = feather.read_table(self.hashes_path).to_pandas()
+                previous = pd.Series(saved['hash'].to_numpy(), index=saved['key'].to_numpy())
+                date_range = manifest.get('date_range')
+
+            # Compare row hashes with the ones exported so far
+            known = hashes.index.isin(previous.index)
+            changed = ~known | (hashes.to_numpy() != previous.reindex(hashes.index).to_numpy())
+            removed = previous.index[~previous.index.isin(hashes.index)]
+            partition = facts[changed].assign(change=['update' if seen else 'insert' for seen in known[changed]])
+            deleted = pd.DataFrame([key.rsplit('|', 1) for key in removed], columns=['transaction_id', 'folder_key'])
+            deleted['folder_key'] = deleted['folder_key'].astype('int32')
+            partition = pd.concat([partition, deleted.assign(change='delete')], ignore_index=True) if len(deleted) else partition
+            partition['export_sequence'] = sequence
+
+            # Dimensions are small, so they are rewritten whole; the date
+            # dimension also keeps covering days referenced by earlier partitions
+            timestamps = facts['timestamp']
+            if len(timestamps):
+                start, end = timestamps.min().date().isoformat(), timestamps.max().date().isoformat()
+                date_range = [min(start, date_range[0]), max(end, date_range[1])] if date_range else [start, end]
+            extension = 'parquet' if self.file_format == 'parquet' else 'csv'
+            self._write_table(folders, os.path.join(self.directory, f"dim_folder.{extension}"))
+            self._write_table(merchants, os.path.join(self.directory, f"dim_merchant.{extension}"))
+            if date_range:
+                self._write_table(date_dimension(*date_range), os.path.join(self.directory, f"dim_date.{extension}"))
+
+            partition_path = None
+            if len(partition):
+                partition_path = os.path.join(self.facts_directory, f"part-{sequence:06d}.{extension}")
+                self._write_table(partition, partition_path)
+            else:
+                sequence -= 1
+
+            temp_path = f"{self.hashes_path}.tmp"
+            feather.write_feather(pd.DataFrame({'key': hashes.index, 'hash': hashes.to_numpy()}), temp_path)
+            os.replace(temp_path, self.hashes_path)
+            manifest = {
+                'format': EXPORT_FORMAT,
+                'file_format': self.file_format,
+                'exported_at': datetime.now().isoformat(),
+                'data_version': data_version,
+                'sequence': sequence,
+                'date_range': date_range
+            }
+            temp_path = f"{self.manifest_path}.tmp"
+            with open(temp_path, 'w') as f:
+                json.dump(manifest, f)
+            os.replace(temp_path, self.manifest_path)
+
+            return {
+                'partition': partition_path,
+                'inserted': int((partition['change'] == 'insert').sum()),
+                'updated': int((partition['change'] == 'update').sum()),
+                'deleted': int(len(deleted)),
+                'sequence': sequence
+            }
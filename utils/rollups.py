@@ -0,0 +1,208 @@
+import pandas as pd
+from collections import defaultdict
+from datetime import date, timedelta
+from utils.splits import allocate
+from utils.fenwick import DailySpendIndex
+
+# Lengths in days of the rolling spend windows
+ROLLING_WINDOWS = (7, 30, 90)
+
+
+class SpendingRollups:
+    """Daily and monthly spending totals per folder
+
+    Totals are adjusted one transaction at a time, so adding, editing or
+    deleting a transaction never requires rescanning the history.
+    """
+
+    def __init__(self):
+        self.daily = defaultdict(float)     # (folder_id, date) -> amount
+        self.monthly = defaultdict(float)   # (folder_id, year, month) -> amount
+        self.monthly_total = defaultdict(float)  # (year, month) -> amount
+        # Folder tree index: each folder's total includes all its sub-folders
+        self.parents = {}                           # folder_id -> parent folder_id
+        self.subtree_monthly = defaultdict(float)   # (folder_id, year, month) -> amount
+        # Daily range-sum index per folder subtree, plus None for all folders
+        self.day_index = defaultdict(DailySpendIndex)
+        # Rolling windows ending on rolling_as_of, slid forward a day at a time
+        self.by_day = defaultdict(lambda: defaultdict(float))  # date -> folder_id -> amount
+        self.rolling_as_of = None
+        self.rolling = defaultdict(float)   # (folder_id or None, window) -> amount
+
+    @classmethod
+    def from_transactions(cls, transactions):
+        """Build rollups from a DataFrame with folder_id, amount and timestamp columns"""
+        rollups = cls()
+        rollups.add_transactions(transactions)
+        return rollups
+
+    @classmethod
+    def from_frame(cls, daily):
+        """Rebuild rollups from the output of to_frame()"""
+        rollups = cls()
+        for folder_id, day, amount in daily[['folder_id', 'date', 'amount']].itertuples(index=False):
+            rollups._add_day(int(folder_id), day, amount)
+        return rollups
+
+    def to_frame(self):
+        """Daily totals as a DataFrame with folder_id, date and amount columns"""
+        return pd.DataFrame(
+            [(folder_id, day, amount) for (folder_id, day), amount in self.daily.items()],
+            columns=['folder_id', 'date', 'amount']
+        )
+
+    def _add_day(self, folder_id, day, amount):
+        folder_id = int(folder_id)
+        self.daily[(folder_id, day)] += amount
+        self.monthly[(folder_id, day.year, day.month)] += amount
+        self.monthly_total[(day.year, day.month)] += amount
+        self.day_index[None].add(day, amount)
+        for ancestor_id in self._path_to_root(folder_id):
+            self.subtree_monthly[(ancestor_id, day.year, day.month)] += amount
+            self.day_index[ancestor_id].add(day, amount)
+        self.by_day[day][folder_id] += amount
+        if self.rolling_as_of is not None:
+            age = (self.rolling_as_of - day).days
+            for window in ROLLING_WINDOWS:
+                if 0 <= age < window:
+                    self.rolling[(folder_id, window)] += amount
+                    self.rolling[(None, window)] += amount
+
+    def _slide_rolling(self, day, sign):
+        """Add (sign=1) or drop (sign=-1) one day's spending from the windows
+        it enters or leaves when the windows move forward to end on `day`"""
+        for window in ROLLING_WINDOWS:
+            changed = day if sign > 0 else day - timedelta(days=window)
+            for folder_id, amount in self.by_day.get(changed, {}).items():
+                self.rolling[(folder_id, window)] += sign * amount
+                self.rolling[(None, window)] += sign * amount
+
+    def advance_rolling(self, today=None):
+        """Move the rolling windows forward to end on `today`
+
+        Each day moved adds the day entering every window and drops the day
+        leaving it, so the cost depends on the days moved, not on history.
+        """
+        today = today or date.today()
+        if self.rolling_as_of == today:
+            return
+        if (self.rolling_as_of is None or today < self.rolling_as_of
+                or (today - self.rolling_as_of).days > max(ROLLING_WINDOWS)):
+            # Start over from the days inside the longest window
+            self.rolling = defaultdict(float)
+            self.rolling_as_of = today
+            for age in range(max(ROLLING_WINDOWS)):
+                day = today - timedelta(days=age)
+                for folder_id, amount in self.by_day.get(day, {}).items():
+                    for window in ROLLING_WINDOWS:
+                        if age < window:
+                            self.rolling[(folder_id, window)] += amount
+                            self.rolling[(None, window)] += amount
+            return
+        while self.rolling_as_of < today:
+            self.rolling_as_of += timedelta(days=1)
+            self._slide_rolling(self.rolling_as_of, 1)
+            self._slide_rolling(self.rolling_as_of, -1)
+
+    def rolling_total(self, window, folder_id=None, today=None):
+        """Spending over the last `window` days up to and including today
+
+        Args:
+            window: One of ROLLING_WINDOWS
+            folder_id: Folder ID (None for all folders)
+            today: Last day of the window (defaults to today)
+
+        Returns:
+            float: Amount spent
+        """
+        self.advance_rolling(today)
+        return self.rolling.get((folder_id, window), 0.0)
+
+    def _path_to_root(self, folder_id):
+        path = [folder_id]
+        while path[-1] in self.parents and self.parents[path[-1]] not in path:
+            path.append(self.parents[path[-1]])
+        return path
+
+    def set_tree(self, parents):
+        """Set the folder tree used for subtree totals
+
+        Subtree totals are rebuilt from the per-folder monthly totals only
+        when the tree actually changes.
+
+        Args:
+            parents: Dict of folder ID -> parent folder ID
+        """
+        if parents == self.parents:
+            return
+        self.parents = dict(parents)
+        self.subtree_monthly = defaultdict(float)
+        for (folder_id, year, month), amount in self.monthly.items():
+            for ancestor_id in self._path_to_root(folder_id):
+                self.subtree_monthly[(ancestor_id, year, month)] += amount
+        overall = self.day_index[None]
+        self.day_index = defaultdict(DailySpendIndex, {None: overall})
+        for (folder_id, day), amount in self.daily.items():
+            for ancestor_id in self._path_to_root(folder_id):
+                self.day_index[ancestor_id].add(day, amount)
+
+    def add_transactions(self, transactions, sign=1):
+        """Add (or with sign=-1, remove) a batch of transactions
+
+        The batch is grouped by folder and day first, so the cost depends on
+        the number of buckets touched rather than the number of rows. Split
+        transactions count towards each folder they are allocated to.
+        """
+        if transactions.empty:
+            return
+        transactions = allocate(transactions)
+        days = transactions['timestamp'].dt.date
+        daily = transactions.groupby([transactions['folder_id'], days])['amount'].sum()
+        for (folder_id, day), amount in daily.items():
+            self._add_day(folder_id, day, sign * amount)
+
+    def add(self, folder_id, timestamp, amount):
+        """Add a transaction's amount to its folder/day bucket"""
+        if pd.isna(amount) or pd.isna(timestamp):
+            return
+        self._add_day(folder_id, timestamp.date(), float(amount))
+
+    def remove(self, folder_id, timestamp, amount):
+        """Take a transaction's amount back out of its folder/day bucket"""
+        if pd.isna(amount) or pd.isna(timestamp):
+            return
+        self._add_day(folder_id, timestamp.date(), -float(amount))
+
+    def month_total(self, year, month, folder_id=None):
+        """Total spending for a calendar month
+
+        Args:
+            year: Calendar year
+            month: Calendar month (1-12)
+            folder_id: Folder ID (None for all folders)
+
+        Returns:
+            float: Amount spent
+        """
+        if folder_id is None:
+            return self.monthly_total.get((year, month), 0.0)
+        return self.monthly.get((folder_id, year, month), 0.0)
+
+    def subtree_month_total(self, year, month, folder_id):
+        """Total spending for a calendar month in a folder and all its sub-folders"""
+        return self.subtree_monthly.get((folder_id, year, month), 0.0)
+
+    def range_total(self, start, end, folder_id=None):
+        """Total spending between two dates (inclusive) in O(log n)
+
+        Args:
+            start: First day of the range
+            end: Last day of the range
+            folder_id: Folder ID, including its sub-folders (None for all folders)
+
+        Returns:
+            float: Amount spent
+        """
+        if folder_id not in self.day_index:
+            return 0.0
+        return self.day_index[folder_id].total(start, end)
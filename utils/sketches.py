@@ -0,0 +1,247 @@
+import random
+import numpy as np
+import pandas as pd
+
+# Accuracy of the quantile sketches: rank error is roughly 1.7 / KLL_K
+KLL_K = 200
+# HyperLogLog registers are 2 ** HLL_PRECISION; relative error ~1.04 / sqrt(registers)
+HLL_PRECISION = 10
+QUANTILES = {'median': 0.5, 'p90': 0.9, 'p99': 0.99}
+# Coin flips for compaction; one generator is shared, as seeding one per
+# sketch costs more than the sketch itself
+_RANDOM = random.Random()
+
+
+class KLLSketch:
+    """KLL quantile sketch: mergeable, with at most about 3 * k values kept
+
+    Values go into level 0. When a level fills up it is sorted and every
+    other value (starting at random) is promoted to the level above, where
+    each value stands for twice as many. Levels near the top keep k values,
+    lower ones geometrically fewer.
+    """
+
+    def __init__(self, k=KLL_K):
+        self.k = k
+        self.levels = [[]]
+        self.count = 0
+        self._random = _RANDOM
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(self.k * (2 / 3) ** depth) + 1)
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append([])
+                values = sorted(self.levels[level])
+                # An odd value out stays behind so no weight is lost
+                self.levels[level] = [values.pop()] if len(values) % 2 else []
+                self.levels[level + 1].extend(values[self._random.getrandbits(1)::2])
+            level += 1
+
+    def update_many(self, values):
+        """Add a batch of values"""
+        values = [float(value) for value in values if not pd.isna(value)]
+        self.levels[0].extend(values)
+        self.count += len(values)
+        self._compress()
+
+    def merge(self, other):
+        """Fold another sketch into this one"""
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, values in enumerate(other.levels):
+            self.levels[level].extend(values)
+        self.count += other.count
+        self._compress()
+
+    def quantile(self, q):
+        """Approximate value at quantile q (0-1); None for an empty sketch"""
+        values, weights = [], []
+        for level, items in enumerate(self.levels):
+            values.extend(items)
+            weights.extend([2 ** level] * len(items))
+        if not values:
+            return None
+        order = np.argsort(values)
+        cumulative = np.cumsum(np.asarray(weights)[order])
+        position = np.searchsorted(cumulative, q * cumulative[-1])
+        return float(np.asarray(values)[order][min(position, len(values) - 1)])
+
+
+def _hash64(values):
+    """SplitMix64 finalizer, so consecutive IDs land in unrelated registers"""
+    x = np.asarray(values, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter over integer IDs, mergeable register-wise"""
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def update_many(self, ids):
+        """Add a batch of integer IDs"""
+        hashes = _hash64(ids)
+        if not len(hashes):
+            return
+        registers = (hashes >> np.uint64(64 - self.precision)).astype(np.int64)
+        # Rank = position of the first set bit in the next 32 bits of the hash
+        rest = ((hashes >> np.uint64(32 - self.precision)) & np.uint64(0xFFFFFFFF)).astype(np.float64)
+        ranks = 33 - np.frexp(rest)[1]
+        np.maximum.at(self.registers, registers, ranks.astype(np.uint8))
+
+    def merge(self, other):
+        """Fold another counter into this one"""
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self):
+        """Approximate number of distinct IDs added"""
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        empty = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and empty:
+            # Linear counting is more accurate for small cardinalities
+            estimate = m * np.log(m / empty)
+        return int(round(estimate))
+
+
+class AmountSketches:
+    """Payment-size quantile sketches and distinct-merchant counters
+
+    A KLL sketch of amounts is kept per folder and per merchant, both for
+    each calendar month and for all time, and a HyperLogLog of merchant IDs
+    per folder and month (and all time). New transactions are added as they
+    are synced, so answering a query never touches the transactions.
+
+    Sketches can't take values back out, so an edit or delete just marks the
+    sketches it touches as stale; those few are rebuilt from the ledger's
+    rows the next time the ledger syncs (see refresh()).
+    """
+
+    KEYS = ('folder_id', 'merchant_id')
+
+    def __init__(self):
+        self.quantiles = {}     # (key column, ID, month or None) -> KLLSketch
+        self.merchants = {}     # (folder ID, month or None) -> HyperLogLog
+        self.stale = set()      # (key column, ID) with out-of-date sketches
+
+    @classmethod
+    def from_transactions(cls, transactions):
+        sketches = cls()
+        sketches.add_transactions(transactions)
+        return sketches
+
+    @classmethod
+    def from_frames(cls, frames):
+        """Restore sketches saved with to_frames()"""
+        sketches = cls()
+        values = frames['sketch_values']
+        levels = {}
+        if not values.empty:
+            # Split the value column at group boundaries rather than iterate a groupby
+            columns = ['key', 'group_id', 'month', 'level']
+            groups = values.groupby(columns, dropna=False, sort=False).ngroup().to_numpy()
+            order = np.argsort(groups, kind='stable')
+            starts = np.flatnonzero(np.diff(groups[order], prepend=-1))
+            chunks = np.split(values['value'].to_numpy()[order], starts[1:])
+            firsts = values[columns].iloc[order[starts]]
+            for (key, group_id, month, level), chunk in zip(firsts.itertuples(index=False), chunks):
+                levels[(key, int(group_id), None if pd.isna(month) else month, int(level))] = chunk.tolist()
+        for key, group_id, month, count, depth in frames['sketch_counts'].itertuples(index=False):
+            month = None if pd.isna(month) else month
+            sketch = KLLSketch()
+            sketch.count = int(count)
+            sketch.levels = [levels.get((key, int(group_id), month, level), []) for level in range(int(depth))]
+            sketches.quantiles[(key, int(group_id), month)] = sketch
+        for folder_id, month, registers in frames['merchant_counters'].itertuples(index=False):
+            counter = HyperLogLog()
+            counter.registers = np.frombuffer(registers, dtype=np.uint8).copy()
+            sketches.merchants[(int(folder_id), None if pd.isna(month) else month)] = counter
+        return sketches
+
+    def to_frames(self):
+        """The sketches as DataFrames: sketch_values (one row per kept value),
+        sketch_counts (one row per quantile sketch) and merchant_counters"""
+        values, counts = [], []
+        for (key, group_id, month), sketch in self.quantiles.items():
+            counts.append((key, group_id, month, sketch.count, len(sketch.levels)))
+            for level, items in enumerate(sketch.levels):
+                values.extend((key, group_id, month, level, value) for value in items)
+        return {
+            'sketch_values': pd.DataFrame(values, columns=['key', 'group_id', 'month', 'level', 'value']),
+            'sketch_counts': pd.DataFrame(counts, columns=['key', 'group_id', 'month', 'count', 'levels']),
+            'merchant_counters': pd.DataFrame(
+                [(folder_id, month, counter.registers.tobytes()) for (folder_id, month), counter in self.merchants.items()],
+                columns=['folder_id', 'month', 'registers']
+            )
+        }
+
+    def add_transactions(self, transactions, sign=1):
+        """Add a batch of transactions (or with sign=-1, mark their sketches stale)"""
+        if transactions.empty:
+            return
+        if sign < 0:
+            for key in self.KEYS:
+                self.stale.update((key, int(group_id)) for group_id in transactions[key].unique())
+            return
+        months = transactions['timestamp'].dt.to_period('M')
+        for key in self.KEYS:
+            for (group_id, month), amounts in transactions['amount'].groupby([transactions[key], months]):
+                for period in (str(month), None):
+                    sketch = self.quantiles.setdefault((key, int(group_id), period), KLLSketch())
+                    sketch.update_many(amounts.to_numpy())
+        for (folder_id, month), merchant_ids in transactions['merchant_id'].groupby([transactions['folder_id'], months]):
+            for period in (str(month), None):
+                self.merchants.setdefault((int(folder_id), period), HyperLogLog()).update_many(merchant_ids.to_numpy())
+
+    def refresh(self, transactions):
+        """Rebuild the stale sketches from the current id-indexed transactions"""
+        if not self.stale:
+            return
+        stale, self.stale = self.stale, set()
+        for key in self.KEYS:
+            ids = {group_id for stale_key, group_id in stale if stale_key == key}
+            if not ids:
+                continue
+            self.quantiles = {k: sketch for k, sketch in self.quantiles.items() if not (k[0] == key and k[1] in ids)}
+            if key == 'folder_id':
+                self.merchants = {k: counter for k, counter in self.merchants.items() if k[0] not in ids}
+            rows = transactions[transactions[key].isin(ids)]
+            # Only the rebuilt key's sketches are replaced; the other key's
+            # sketches of these rows are still current
+            rebuilt = AmountSketches.from_transactions(rows)
+            self.quantiles.update({k: sketch for k, sketch in rebuilt.quantiles.items() if k[0] == key})
+            if key == 'folder_id':
+                self.merchants.update(rebuilt.merchants)
+
+    def summary(self, key, group_id, month=None):
+        """Payment count and median/p90/p99 amounts for one folder or merchant
+
+        Args:
+            key: 'folder_id' or 'merchant_id'
+            group_id: Folder or merchant ID
+            month: 'YYYY-MM' for one calendar month (None for all time)
+
+        Returns:
+            dict: payments, median, p90 and p99 (None if there were no payments)
+        """
+        sketch = self.quantiles.get((key, int(group_id), month))
+        if sketch is None or sketch.count == 0:
+            return {'payments': 0, **{name: None for name in QUANTILES}}
+        return {'payments': sketch.count, **{name: sketch.quantile(q) for name, q in QUANTILES.items()}}
+
+    def distinct_merchants(self, folder_id, month=None):
+        """Approximate number of different merchants paid from a folder"""
+        counter = self.merchants.get((int(folder_id), month))
+        return counter.estimate() if counter is not None else 0
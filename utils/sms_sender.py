@@ -1,5 +1,4 @@
 import os
-from twilio.rest import Client
 
 # Environment variables for Twilio
 TWILIO_ACCOUNT_SID = os.environ.get("TWILIO_ACCOUNT_SID")
@@ -10,9 +9,21 @@ class SMSSender:
     def __init__(self):
         """Initialize SMS sender with Twilio credentials"""
         self.is_configured = all([TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER])
+        self._client = None
         if self.is_configured:
-            self.client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
             self.phone_number = TWILIO_PHONE_NUMBER
+    
+    @property
+    def client(self):
+        """Twilio client, created on the first send
+        
+        twilio is imported here rather than at module level, since it is
+        slow to import and most sessions never send an SMS.
+        """
+        if self._client is None:
+            from twilio.rest import Client
+            self._client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+        return self._client
         
     def send_limit_exceeded_notification(self, user_phone, folder_name, current_amount, limit_amount):
         """Send SMS notification when a folder spending limit is exceeded
@@ -0,0 +1,64 @@
+import pandas as pd
+
+SPLIT_SEPARATOR = '|'
+
+
+def format_splits(allocations):
+    """Encode split allocations for storage as one field
+
+    Args:
+        allocations: Dict or list of (folder_id, amount) pairs for the
+            folders other than the transaction's own folder
+
+    Returns:
+        str: e.g. '|5:120.0|7:80.0|'; '|' for a transaction that isn't split
+    """
+    if isinstance(allocations, dict):
+        allocations = allocations.items()
+    parts = [f"{int(folder_id)}:{float(amount)}" for folder_id, amount in allocations if float(amount) != 0]
+    return SPLIT_SEPARATOR + ''.join(f"{part}{SPLIT_SEPARATOR}" for part in parts)
+
+
+def parse_splits(value):
+    """Decode a stored splits field into a list of (folder_id, amount) pairs"""
+    if pd.isna(value):
+        return []
+    allocations = []
+    for part in str(value).split(SPLIT_SEPARATOR):
+        if part:
+            folder_id, amount = part.split(':')
+            allocations.append((int(folder_id), float(amount)))
+    return allocations
+
+
+def allocate(transactions):
+    """Spread transactions over the folders their amounts are allocated to
+
+    A split transaction keeps its full amount on its own row; here the
+    amounts allocated to other folders are taken off its own folder's share
+    and added as rows of their own. Only split transactions produce extra
+    rows, so the result is the size of the input plus one row per allocation.
+
+    Args:
+        transactions: Frame with folder_id, amount, timestamp and (optionally)
+            splits columns, and an id column or index
+
+    Returns:
+        DataFrame: id, folder_id, amount and timestamp per allocation
+    """
+    frame = transactions.reset_index() if 'id' not in transactions.columns else transactions.reset_index(drop=True)
+    columns = ['id', 'folder_id', 'amount', 'timestamp']
+    if 'splits' not in frame.columns:
+        return frame[columns]
+    is_split = frame['splits'].notna() & (frame['splits'] != SPLIT_SEPARATOR)
+    if not is_split.any():
+        return frame[columns]
+
+    own = frame[columns].copy()
+    extra = []
+    for position, tx in zip(frame.index[is_split], frame[is_split].itertuples(index=False)):
+        for folder_id, amount in parse_splits(tx.splits):
+            own.at[position, 'amount'] -= amount
+            extra.append((tx.id, folder_id, amount, tx.timestamp))
+    extra = pd.DataFrame(extra, columns=columns).astype({'folder_id': own['folder_id'].dtype})
+    return pd.concat([own, extra], ignore_index=True)
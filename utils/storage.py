@@ -0,0 +1,347 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import csv
+import glob
+import io
+import os
+import threading
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows has no flock; fall back to in-process locking only
+    fcntl = None
+
+_path_locks = {}
+_path_locks_guard = threading.Lock()
+_held = threading.local()
+
+
+@contextmanager
+def file_lock(path):
+    """Serialize writers of a data file across threads and processes
+
+    The lock is re-entrant within a thread; only the outermost acquisition
+    takes the OS-level lock.
+
+    Args:
+        path: The data file being written (a sibling ".lock" file is used)
+    """
+    key = os.path.abspath(path)
+    with _path_locks_guard:
+        lock = _path_locks.setdefault(key, threading.RLock())
+
+    with lock:
+        depth = getattr(_held, 'depth', {})
+        _held.depth = depth
+        if fcntl is None or depth.get(key):
+            depth[key] = depth.get(key, 0) + 1
+            try:
+                yield
+            finally:
+                depth[key] -= 1
+            return
+
+        with open(f"{path}.lock", 'a') as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            depth[key] = 1
+            try:
+                yield
+            finally:
+                depth[key] = 0
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _format_value(value):
+    """Format a value the same way DataFrame.to_csv would"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value != value:  # NaN
+        return ''
+    if isinstance(value, datetime):
+        return str(value)
+    return value
+
+
+class AppendLog:
+    """A CSV file that is only ever appended to
+
+    Writers add whole lines at the end of the file, so a write costs O(1) I/O
+    regardless of how large the log is. Readers remember the byte offset they
+    have consumed and only parse what was appended after it.
+    """
+
+    def __init__(self, path, columns, dtype=None):
+        self.path = path
+        self.columns = list(columns)
+        self.dtype = dtype
+        self._initialize_storage()
+
+    def _initialize_storage(self):
+        """Create the log with a header line if it doesn't exist"""
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with file_lock(self.path):
+            if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+                self._write_header()
+
+    def _write_header(self):
+        with open(self.path, 'w', newline='', encoding='utf-8') as f:
+            csv.writer(f, lineterminator='\n').writerow(self.columns)
+
+    def append(self, record):
+        """Append a single record (dict keyed by column name)"""
+        self.append_many([record])
+
+    def append_many(self, records):
+        """Append several records with a single write
+
+        Args:
+            records: Iterable of dicts keyed by column name
+        """
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        for record in records:
+            writer.writerow([_format_value(record.get(column)) for column in self.columns])
+
+        with file_lock(self.path):
+            with open(self.path, 'a', newline='', encoding='utf-8') as f:
+                f.write(buffer.getvalue())
+
+    def version(self):
+        """Identify the current state of the file
+
+        Returns:
+            tuple: (inode, size). The inode changes when the file is replaced
+            by compaction, the size grows with every append.
+        """
+        try:
+            stat = os.stat(self.path)
+            return (stat.st_ino, stat.st_size)
+        except FileNotFoundError:
+            return (0, 0)
+
+    def pending_bytes(self):
+        """Size of the records in the log, not counting the header"""
+        header = len(','.join(self.columns)) + 1
+        return max(0, self.version()[1] - header)
+
+    def read_since(self, offset=0):
+        """Read the records appended after a byte offset
+
+        Args:
+            offset: Byte offset already consumed (0 reads the whole log)
+
+        Returns:
+            tuple: (DataFrame of new records, (inode, offset) cursor of the
+            file that was actually read, to resume from)
+        """
+        return self._read_file(self.path, offset)
+
+    def _read_file(self, path, offset):
+        with open(path, 'rb') as f:
+            inode = os.fstat(f.fileno()).st_ino
+            f.seek(offset)
+            data = f.read()
+
+        # Only consume complete lines; a concurrent writer may be mid-append
+        end = data.rfind(b'\n') + 1
+        data = data[:end]
+        cursor = (inode, offset + end)
+
+        if offset == 0:
+            header = data.find(b'\n') + 1
+            data = data[header:]
+        if not data.strip():
+            return pd.DataFrame(columns=self.columns), cursor
+
+        frame = pd.read_csv(io.BytesIO(data), header=None, names=self.columns, dtype=self.dtype)
+        return frame, cursor
+
+    def segment_path(self, sequence):
+        """Path of the sealed segment with the given sequence number"""
+        root, ext = os.path.splitext(self.path)
+        return f"{root}.{sequence:06d}{ext}"
+
+    def sealed_sequences(self):
+        """Sequence numbers of the sealed segments on disk, oldest first"""
+        root, ext = os.path.splitext(self.path)
+        sequences = []
+        for path in glob.glob(f"{glob.escape(root)}.[0-9]*{ext}"):
+            suffix = path[len(root) + 1:len(path) - len(ext)]
+            if suffix.isdigit():
+                sequences.append(int(suffix))
+        return sorted(sequences)
+
+    def seal(self, sequence):
+        """Move the live records aside as a segment and start an empty log
+
+        The caller must hold this log's file_lock.
+        """
+        os.replace(self.path, self.segment_path(sequence))
+        self._write_header()
+
+    def read_segment(self, sequence):
+        """Read every record of a sealed segment"""
+        return self._read_file(self.segment_path(sequence), 0)[0]
+
+    def remove_segment(self, sequence):
+        try:
+            os.remove(self.segment_path(sequence))
+        except FileNotFoundError:
+            pass
+
+
+class Snapshot:
+    """Typed columnar copy of compacted log state, stored as Arrow IPC (Feather)
+
+    The generation of the last sealed segment folded into the snapshot is
+    kept in the file's schema metadata, so data and generation are replaced
+    together by a single rename.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def generation(self):
+        """Generation of the snapshot on disk (0 if there is none)"""
+        try:
+            with pa.memory_map(self.path) as source:
+                metadata = pa.ipc.open_file(source).schema.metadata or {}
+        except FileNotFoundError:
+            return 0
+        return int(metadata.get(b'generation', 0))
+
+    def read(self):
+        """Load the snapshot
+
+        Returns:
+            tuple: (DataFrame or None if there is no snapshot, generation)
+        """
+        try:
+            table = feather.read_table(self.path)
+        except FileNotFoundError:
+            return None, 0
+        metadata = table.schema.metadata or {}
+        return table.to_pandas(), int(metadata.get(b'generation', 0))
+
+    def write(self, frame, generation):
+        """Atomically replace the snapshot"""
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[b'generation'] = str(generation).encode()
+        table = table.replace_schema_metadata(metadata)
+
+        temp_path = f"{self.path}.tmp"
+        feather.write_feather(table, temp_path)
+        os.replace(temp_path, self.path)
+
+
+class SegmentedStore:
+    """A group of append logs backed by a compacted snapshot
+
+    Compaction seals the live logs into numbered segments, which only takes
+    the writers' locks for a rename, then folds the sealed segments into the
+    snapshot without holding any lock a writer needs. Readers load the
+    snapshot, replay sealed segments newer than it and finally the live logs.
+    """
+
+    def __init__(self, logs, snapshot_path, columns, fold):
+        """
+        Args:
+            logs: Dict of name -> AppendLog, in the order live logs are read
+            snapshot_path: Where the compacted snapshot is kept
+            columns: Columns of the folded state
+            fold: Function (state DataFrame, dict of name -> records) -> state
+        """
+        self.logs = logs
+        self.snapshot = Snapshot(snapshot_path)
+        self.columns = list(columns)
+        self.fold = fold
+        # Callables run after each successful compaction
+        self.on_compact = []
+
+    def sealed_sequences(self):
+        """Sequence numbers of segments sealed but not yet folded away"""
+        sequences = set()
+        for log in self.logs.values():
+            sequences.update(log.sealed_sequences())
+        return sorted(sequences)
+
+    def _fold_segments(self, state, generation, up_to=None):
+        for sequence in self.sealed_sequences():
+            if sequence <= generation or (up_to is not None and sequence > up_to):
+                continue
+            records = {name: log.read_segment(sequence) for name, log in self.logs.items()}
+            state = self.fold(state, records)
+        return state
+
+    def _load_base(self):
+        state, generation = self.snapshot.read()
+        if state is None:
+            state = pd.DataFrame(columns=self.columns)
+        return state, generation
+
+    def load(self):
+        """Load the compacted state and the live logs
+
+        Returns:
+            tuple: (DataFrame of the snapshot with sealed segments folded in,
+            dict of name -> (live records, cursor) for the live logs)
+        """
+        while True:
+            sealed = self.sealed_sequences()
+            try:
+                state, generation = self._load_base()
+                state = self._fold_segments(state, generation)
+                live = {name: log.read_since(0) for name, log in self.logs.items()}
+            except FileNotFoundError:
+                # A concurrent compaction removed a segment we were about to read
+                continue
+            if self.sealed_sequences() == sealed:
+                return state, live
+
+    def pending_bytes(self):
+        """Bytes of log records not yet folded into the snapshot"""
+        pending = sum(log.pending_bytes() for log in self.logs.values())
+        for sequence in self.sealed_sequences():
+            for log in self.logs.values():
+                try:
+                    pending += os.path.getsize(log.segment_path(sequence))
+                except FileNotFoundError:
+                    pass
+        return pending
+
+    def compact(self):
+        """Fold everything written so far into a new snapshot
+
+        Returns:
+            int: Generation of the new snapshot
+        """
+        # Only one compactor at a time; writers never take this lock
+        with file_lock(self.snapshot.path):
+            with ExitStack() as stack:
+                for log in self.logs.values():
+                    stack.enter_context(file_lock(log.path))
+                sequence = max(self.sealed_sequences() + [self.snapshot.generation()]) + 1
+                for log in self.logs.values():
+                    log.seal(sequence)
+
+            state, generation = self._load_base()
+            state = self._fold_segments(state, generation, up_to=sequence)
+            self.snapshot.write(state.reindex(columns=self.columns), sequence)
+
+            for sealed in self.sealed_sequences():
+                if sealed <= sequence:
+                    for log in self.logs.values():
+                        log.remove_segment(sealed)
+
+        for callback in self.on_compact:
+            callback()
+        return sequence
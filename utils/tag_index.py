@@ -0,0 +1,143 @@
+import numpy as np
+import pandas as pd
+from collections import defaultdict
+
+TAG_SEPARATOR = '|'
+
+
+def format_tags(tags):
+    """Encode tags for storage as one field, e.g. ['trip-goa', 'family'] -> '|family|trip-goa|'
+
+    A list, a set or a comma-separated string is accepted. An empty tag set
+    is stored as '|' rather than an empty field, since an empty field in a
+    patch means "unchanged".
+    """
+    if isinstance(tags, str):
+        tags = tags.split(',')
+    tags = sorted({str(tag).strip().replace(TAG_SEPARATOR, '') for tag in tags if str(tag).strip()})
+    return TAG_SEPARATOR + ''.join(f"{tag}{TAG_SEPARATOR}" for tag in tags)
+
+
+def parse_tags(value):
+    """Decode a stored tags field into a list of tags"""
+    if pd.isna(value):
+        return []
+    return [tag for tag in str(value).split(TAG_SEPARATOR) if tag]
+
+
+class TagIndex:
+    """Bitmap per tag over transaction row numbers
+
+    Every transaction gets a row number the first time it is indexed, and
+    each tag keeps a Python int with bit n set for row n. AND and OR of tags
+    are then single big-integer operations rather than string matching over
+    every row. Row numbers of deleted transactions are simply left unset.
+    """
+
+    def __init__(self):
+        self.rows = {}                      # transaction id -> row number
+        self.ids = []                       # row number -> transaction id
+        self.tags = {}                      # row number -> tuple of tags
+        self.bitmaps = defaultdict(int)     # tag -> bitmap of rows
+        self.live = 0                       # bitmap of rows not deleted
+
+    @classmethod
+    def from_transactions(cls, transactions):
+        """Build the index from an id-indexed frame with a tags column"""
+        index = cls()
+        index.ids = transactions.index.tolist()
+        index.rows = dict(zip(index.ids, range(len(index.ids))))
+        # Rows share a handful of distinct tags fields, so each is parsed once
+        codes, fields = pd.factorize(transactions['tags'].fillna(TAG_SEPARATOR).astype(str))
+        parsed = [tuple(parse_tags(field)) for field in fields]
+        index.tags = dict(zip(range(len(codes)), map(parsed.__getitem__, codes)))
+        # Each bitmap is packed from a boolean row array in one step rather
+        # than grown a bit at a time
+        for tag in {tag for tags in parsed for tag in tags}:
+            with_tag = [code for code, tags in enumerate(parsed) if tag in tags]
+            flags = np.isin(codes, with_tag)
+            index.bitmaps[tag] = int.from_bytes(np.packbits(flags, bitorder='little').tobytes(), 'little')
+        index.live = (1 << len(index.ids)) - 1
+        return index
+
+    @classmethod
+    def from_frames(cls, frames):
+        """Restore an index saved with to_frames()"""
+        index = cls()
+        rows = frames['tag_rows']
+        index.ids = rows['id'].tolist()
+        index.rows = dict(zip(index.ids, range(len(index.ids))))
+        live = rows['live'].to_numpy(dtype=bool)
+        codes, fields = pd.factorize(rows['tags'].fillna(TAG_SEPARATOR).astype(str))
+        parsed = [tuple(parse_tags(field)) for field in fields]
+        index.tags = {row: parsed[code] for row, code in enumerate(codes) if live[row]}
+        index.live = int.from_bytes(np.packbits(live, bitorder='little').tobytes(), 'little')
+        for tag, bitmap in frames['tag_bitmaps'].itertuples(index=False):
+            index.bitmaps[tag] = int.from_bytes(bitmap, 'little')
+        return index
+
+    def to_frames(self):
+        """The index as DataFrames: tag_rows (id, stored tags field and live
+        flag per row number) and tag_bitmaps (tag and bitmap bytes)"""
+        live = [row in self.tags for row in range(len(self.ids))]
+        return {
+            'tag_rows': pd.DataFrame({
+                'id': pd.Series(self.ids, dtype=object),
+                'tags': pd.Series([format_tags(self.tags.get(row, ())) for row in range(len(self.ids))], dtype=object),
+                'live': pd.Series(live, dtype=bool)
+            }),
+            'tag_bitmaps': pd.DataFrame(
+                [(tag, bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')) for tag, bitmap in self.bitmaps.items()],
+                columns=['tag', 'bitmap']
+            )
+        }
+
+    def set_tags(self, transaction_id, tags):
+        """Index (or re-index) a transaction's stored tags field"""
+        row = self.rows.get(transaction_id)
+        if row is None:
+            row = len(self.ids)
+            self.rows[transaction_id] = row
+            self.ids.append(transaction_id)
+        bit = 1 << row
+        for tag in self.tags.get(row, ()):
+            self.bitmaps[tag] &= ~bit
+        self.tags[row] = tuple(parse_tags(tags))
+        for tag in self.tags[row]:
+            self.bitmaps[tag] |= bit
+        self.live |= bit
+
+    def remove(self, transaction_id):
+        """Drop a deleted transaction from every bitmap"""
+        row = self.rows.get(transaction_id)
+        if row is None:
+            return
+        bit = 1 << row
+        for tag in self.tags.pop(row, ()):
+            self.bitmaps[tag] &= ~bit
+        self.live &= ~bit
+
+    def all_tags(self):
+        """Tags used by at least one transaction, sorted"""
+        return sorted(tag for tag, bitmap in self.bitmaps.items() if bitmap)
+
+    def match(self, all_of=None, any_of=None):
+        """Bitmap of the transactions that have every tag in `all_of` and at
+        least one tag in `any_of` (either may be empty to skip it)"""
+        bitmap = self.live
+        for tag in all_of or []:
+            bitmap &= self.bitmaps.get(tag, 0)
+        if any_of:
+            either = 0
+            for tag in any_of:
+                either |= self.bitmaps.get(tag, 0)
+            bitmap &= either
+        return bitmap
+
+    def ids_for(self, bitmap):
+        """Transaction IDs of the rows set in a bitmap"""
+        if not bitmap:
+            return []
+        data = np.frombuffer(bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little'), dtype=np.uint8)
+        rows = np.flatnonzero(np.unpackbits(data, bitorder='little'))
+        return [self.ids[row] for row in rows]
@@ -1,33 +1,275 @@
-import pandas as pd
 import os
+import uuid
 from datetime import datetime
+from utils.ledger import get_ledger, EDITABLE_FIELDS, TRANSACTION_COLUMNS, CLEARABLE_FIELDS, CLEARED_SEPARATOR
+from utils.storage import AppendLog
+from utils.tag_index import format_tags
+from utils.splits import format_splits, parse_splits
+from utils.binary_store import get_binary_store, STORAGE_MODE
 
 class TransactionManager:
     def __init__(self):
         self.transactions_file = "data/transactions.csv"
+        self.patches_file = "data/transaction_patches.csv"
+        self.snapshot_file = "data/snapshots/transactions.feather"
+        self.archive_file = "data/transaction_archive.csv"
         self._initialize_storage()
 
     def _initialize_storage(self):
-        """Initialize the transactions storage file if it doesn't exist"""
+        """Initialize the transaction and patch logs if they don't exist"""
         if not os.path.exists('data'):
             os.makedirs('data')
-        if not os.path.exists(self.transactions_file):
-            pd.DataFrame(columns=[
-                'folder', 'amount', 'merchant', 'notes', 'timestamp'
-            ]).to_csv(self.transactions_file, index=False)
+        self.ledger = get_ledger(self.transactions_file, self.patches_file, self.snapshot_file)
+        # Transactions of archived folders, kept out of the ledger
+        self.archive_log = AppendLog(self.archive_file, TRANSACTION_COLUMNS + ['archived_at'], dtype={'id': str})
+        
+        # Binary mode mirrors the numeric columns into fixed-width records
+        self.binary_store = None
+        if STORAGE_MODE == 'binary':
+            self.binary_store = get_binary_store()
+            # Writes that reached the logs but not the store (a crash in
+            # between, or a run in CSV mode) leave the counts apart
+            if self.binary_store.needs_rebuild or self.binary_store.live_count() != self.ledger.count():
+                self.binary_store.rebuild_from(self.ledger.frame())
 
     def add_transaction(self, transaction):
-        """Add a new transaction"""
-        transactions = pd.read_csv(self.transactions_file)
-        # Using concat instead of the deprecated append method
-        transactions = pd.concat([transactions, pd.DataFrame([transaction])], ignore_index=True)
-        transactions.to_csv(self.transactions_file, index=False)
+        """Add a new transaction
+
+        A payment can be split across folders by giving `splits`, a dict of
+        folder name -> amount for folders other than its own; whatever is
+        left of the amount stays in the transaction's folder.
+
+        Returns:
+            str: ID of the new transaction
+        """
+        transaction = self._encode(transaction)
+        allocated = sum(amount for _, amount in parse_splits(transaction.get('splits')))
+        if allocated > float(transaction['amount']):
+            raise ValueError("Split allocations add up to more than the amount")
+        transaction.setdefault('id', uuid.uuid4().hex[:12])
+        # Appending a single line keeps the cost independent of history size
+        self.ledger.transactions_log.append(transaction)
+        if self.binary_store is not None:
+            self.binary_store.append(transaction)
+        return transaction['id']
+
+    def add_transactions(self, transactions):
+        """Add many new transactions with one append per log
+
+        Args:
+            transactions: Iterable of transaction dicts, as for add_transaction
+
+        Returns:
+            list: IDs of the new transactions
+        """
+        transactions = list(transactions)
+        # Each distinct folder and merchant name is looked up once per batch
+        folder_names = {transaction['folder'] for transaction in transactions if 'folder' in transaction}
+        for transaction in transactions:
+            splits = transaction.get('splits')
+            if splits is not None and not isinstance(splits, str):
+                folder_names.update(dict(splits))
+        folder_ids = {name: self.ledger.folder_manager.ensure_folder(name) for name in folder_names}
+        merchant_ids = {
+            name: self.ledger.merchant_registry.get_merchant_id(name)
+            for name in {transaction['merchant'] for transaction in transactions if 'merchant' in transaction}
+        }
+        records = []
+        for transaction in transactions:
+            record = self._encode(transaction, folder_ids, merchant_ids)
+            allocated = sum(amount for _, amount in parse_splits(record.get('splits')))
+            if allocated > float(record['amount']):
+                raise ValueError("Split allocations add up to more than the amount")
+            record.setdefault('id', uuid.uuid4().hex[:12])
+            records.append(record)
+        if records:
+            self.ledger.transactions_log.append_many(records)
+            if self.binary_store is not None:
+                self.binary_store.append_many(records)
+        return [record['id'] for record in records]
+
+    def update_transaction(self, transaction_id, **changes):
+        """Change fields of an existing transaction
+
+        Args:
+            transaction_id: ID of the transaction to edit
+            **changes: New values for any of folder, amount, merchant, notes, timestamp, tags, splits
+
+        Returns:
+            bool: True if a patch was recorded, False if there is no such
+            transaction or nothing to change
+        """
+        current = self.ledger.get_transaction(transaction_id)
+        if current is None:
+            return False
+        changes = self._encode(changes)
+        changes = {field: value for field, value in changes.items() if field in EDITABLE_FIELDS}
+        if not changes:
+            return False
+        if 'amount' in changes or 'splits' in changes:
+            amount = changes.get('amount', current['amount'])
+            allocated = sum(amount for _, amount in parse_splits(changes.get('splits', current['splits'])))
+            if allocated > float(amount):
+                raise ValueError("Split allocations add up to more than the amount")
+        # An empty field in a patch means "unchanged", so emptied fields are listed instead
+        cleared = [field for field in CLEARABLE_FIELDS if field in changes and changes[field] in ('', None)]
+        changes = {field: value for field, value in changes.items() if field not in cleared}
+        self._append_patch({'id': transaction_id, 'op': 'update', **changes, 'cleared': CLEARED_SEPARATOR.join(cleared)})
+        if self.binary_store is not None:
+            self.binary_store.update(transaction_id, changes)
+        return True
+
+    def move_transaction(self, transaction_id, folder):
+        """Move a transaction to another folder
+
+        Returns:
+            bool: True if moved, False if there is no such transaction
+        """
+        return self.update_transaction(transaction_id, folder=folder)
+
+    def delete_transaction(self, transaction_id):
+        """Delete a transaction by recording a tombstone for it
+
+        Returns:
+            bool: True if deleted, False if there is no such transaction
+        """
+        if self.ledger.get_transaction(transaction_id) is None:
+            return False
+        self._append_patch({'id': transaction_id, 'op': 'delete'})
+        if self.binary_store is not None:
+            self.binary_store.delete(transaction_id)
+        return True
+
+    def reassign_folder(self, folder_id, target_folder_id):
+        """Move every transaction in one folder to another
+
+        All the patches go out in a single append, and the ledger adjusts the
+        rollups for the moved rows only.
+
+        Returns:
+            int: Number of transactions moved
+        """
+        transaction_ids = self.ledger.folder_rows(folder_id).index.tolist()
+        patches = {transaction_id: {'id': transaction_id, 'op': 'update', 'folder_id': target_folder_id} for transaction_id in transaction_ids}
+        # Parts of split payments allocated to the folder move with it
+        rewritten = self._rewrite_splits(folder_id, target_folder_id)
+        for transaction_id, splits in rewritten.items():
+            patches.setdefault(transaction_id, {'id': transaction_id, 'op': 'update'})['splits'] = splits
+        if not patches:
+            return 0
+        self.ledger.patches_log.append_many(patches.values())
+        if self.binary_store is not None:
+            if transaction_ids:
+                self.binary_store.update_many(transaction_ids, {'folder_id': target_folder_id})
+            self.binary_store.set_splits(rewritten)
+        return len(transaction_ids)
+
+    def archive_folder(self, folder_id):
+        """Move every transaction in one folder out of the ledger into the archive
+
+        The rows are copied to the archive log before their archive
+        tombstones are written, each with a single append.
+
+        Returns:
+            int: Number of transactions archived
+        """
+        rows = self.ledger.folder_rows(folder_id)
+        # A payment can't be archived in part, so what other folders'
+        # payments allocated to this folder goes back to their own folder
+        rewritten = {transaction_id: splits for transaction_id, splits in self._rewrite_splits(folder_id).items()
+                     if transaction_id not in rows.index}
+        if rewritten:
+            self.ledger.patches_log.append_many(
+                {'id': transaction_id, 'op': 'update', 'splits': splits} for transaction_id, splits in rewritten.items()
+            )
+            if self.binary_store is not None:
+                self.binary_store.set_splits(rewritten)
+        if rows.empty:
+            return 0
+        rows = rows.reset_index()
+        rows['archived_at'] = datetime.now()
+        self.archive_log.append_many(rows.to_dict('records'))
+        self.ledger.patches_log.append_many({'id': transaction_id, 'op': 'archive'} for transaction_id in rows['id'])
+        if self.binary_store is not None:
+            self.binary_store.delete_many(rows['id'].tolist())
+        return len(rows)
+
+    def _rewrite_splits(self, folder_id, target_folder_id=None):
+        """Re-point the split allocations into a folder
+
+        Args:
+            folder_id: Folder whose allocations change
+            target_folder_id: Folder that takes them over (None hands them
+                back to each transaction's own folder)
+
+        Returns:
+            dict: Transaction ID -> new stored splits field, for each split
+            transaction that allocates to the folder
+        """
+        splits = self.ledger.split_transactions()
+        rewritten = {}
+        for transaction_id, home, field in zip(splits.index, splits['folder_id'], splits['splits']):
+            allocations = parse_splits(field)
+            moves_home = home == folder_id and target_folder_id is not None
+            split_folders = {split_folder for split_folder, _ in allocations}
+            if folder_id not in split_folders and not (moves_home and target_folder_id in split_folders):
+                continue
+            home = target_folder_id if moves_home else home
+            merged = {}
+            for split_folder, amount in allocations:
+                if split_folder == folder_id:
+                    split_folder = target_folder_id if target_folder_id is not None else home
+                # An allocation to the transaction's own folder is just part of its share
+                if split_folder != home:
+                    merged[split_folder] = merged.get(split_folder, 0.0) + amount
+            rewritten[transaction_id] = format_splits(merged)
+        return rewritten
+
+    def get_archived_transactions(self):
+        """Get the transactions archived together with their folders"""
+        return self.archive_log.read_since(0)[0]
+
+    def _encode(self, record, folder_ids=None, merchant_ids=None):
+        """Replace folder and merchant names in a record with their IDs and encode its tags and splits
+
+        Args:
+            record: Transaction fields, with folder and merchant names
+            folder_ids: Name -> ID dict already looked up for a batch
+            merchant_ids: Name -> ID dict already looked up for a batch
+        """
+        def folder_id(name):
+            return folder_ids[name] if folder_ids is not None else self.ledger.folder_manager.ensure_folder(name)
+
+        record = dict(record)
+        if 'folder' in record:
+            record['folder_id'] = folder_id(record.pop('folder'))
+        if 'merchant' in record:
+            merchant = record.pop('merchant')
+            record['merchant_id'] = merchant_ids[merchant] if merchant_ids is not None else self.ledger.merchant_registry.get_merchant_id(merchant)
+        if 'tags' in record:
+            record['tags'] = format_tags(record['tags'])
+        if 'splits' in record and not isinstance(record['splits'], str):
+            splits = record['splits']
+            splits = splits.items() if isinstance(splits, dict) else splits
+            record['splits'] = format_splits((folder_id(folder), amount) for folder, amount in splits)
+        return record
+
+    def _append_patch(self, patch):
+        self.ledger.patches_log.append(patch)
+
+    def compact(self):
+        """Fold the transaction and patch logs into the snapshot
+
+        This normally happens on the background compactor; call it directly
+        for maintenance.
+        """
+        return self.ledger.store.compact()
 
     def get_all_transactions(self):
         """Get all transactions"""
-        return pd.read_csv(self.transactions_file)
+        return self.ledger.frame()
 
     def get_folder_transactions(self, folder):
         """Get transactions for a specific folder"""
-        transactions = pd.read_csv(self.transactions_file)
-        return transactions[transactions['folder'] == folder]
\ No newline at end of file
+        transactions = self.ledger.frame()
+        return transactions[transactions['folder'] == folder]
@@ -0,0 +1,85 @@
+import pyarrow.feather as feather
+import hashlib
+import json
+import os
+from datetime import datetime
+
+# Bump when the layout of the saved state changes so old files are ignored
+WARM_STATE_FORMAT = 3
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class WarmStart:
+    """Saves fully typed in-memory state so a fresh process can skip parsing
+
+    Each frame is written as an uncompressed Arrow IPC (Feather) file, which
+    loads with a memory map instead of a parse. A manifest written last
+    records a checksum per file and the data version the state was taken
+    at; the state is only used when every checksum matches.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, 'manifest.json')
+
+    def save(self, frames, data_version):
+        """Write frames and the manifest describing them
+
+        Args:
+            frames: Dict of name -> DataFrame
+            data_version: JSON-serializable description of what the frames reflect
+        """
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+        files = {}
+        for name, frame in frames.items():
+            path = os.path.join(self.directory, f"{name}.arrow")
+            temp_path = f"{path}.tmp"
+            feather.write_feather(frame.reset_index(drop=True), temp_path, compression='uncompressed')
+            os.replace(temp_path, path)
+            files[name] = {'path': os.path.basename(path), 'sha256': _sha256(path)}
+
+        manifest = {
+            'format': WARM_STATE_FORMAT,
+            'saved_at': datetime.now().isoformat(),
+            'data_version': data_version,
+            'files': files
+        }
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(temp_path, self.manifest_path)
+
+    def load(self):
+        """Load the saved frames if they are intact
+
+        Returns:
+            tuple: (dict of name -> DataFrame, data_version), or None if there
+            is no usable warm state
+        """
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+            if manifest.get('format') != WARM_STATE_FORMAT:
+                return None
+
+            frames = {}
+            for name, entry in manifest['files'].items():
+                path = os.path.join(self.directory, entry['path'])
+                if _sha256(path) != entry['sha256']:
+                    return None
+                frames[name] = feather.read_table(path, memory_map=True).to_pandas()
+            return frames, manifest['data_version']
+        except (FileNotFoundError, ValueError, KeyError, OSError):
+            return None
+        except Exception as e:
+            print(f"Error loading warm state: {str(e)}")
+            return None